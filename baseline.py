@@ -0,0 +1,119 @@
+import os
+import glob
+import threading
+import numpy as np
+from calibration import grid_key
+from config import BASELINE_CONFIG
+from logger import setup_logger
+import logging
+
+logger = setup_logger(__name__, level=logging.INFO)
+
+
+class RollingBaseline:
+    """
+    Exponentially weighted blank-solvent baseline, one per frequency grid.
+
+    Each captured blank sweep moves the baseline ``alpha`` of the way towards it
+    (the first capture on a grid is taken as is), so slow drift is tracked without
+    manual re-baselining. The average is taken over complex S11, with magnitude and
+    phase derived from it, so a phase near ±π does not average to one near 0.
+    Baselines live in memory keyed by grid and are written to ``<dir>/<grid key>.npz``
+    after every update. ``lookup`` on a grid without its own baseline (a blank and its
+    sample sweep seldom share an adaptive grid) interpolates the densest baseline
+    covering it, and caches the result until the next update.
+    """
+
+    def __init__(self, directory=BASELINE_CONFIG['dir'], alpha=BASELINE_CONFIG['alpha']):
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha must be in (0, 1]")
+        self.directory = directory
+        self.alpha = alpha
+        self._baselines = self._load_all()
+        self._resampled = {}    # grid key -> entry interpolated from a covering baseline, or None
+        self._lock = threading.Lock()
+
+    def _load_all(self):
+        baselines = {}
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.npz"))):
+            try:
+                with np.load(path) as archive:
+                    if "s11" in archive.files:
+                        s11 = archive["s11"]
+                    else:  # Written before the complex average: magnitude and phase
+                        s11 = archive["permittivity"] * np.exp(1j * archive["conductivity"])
+                    entry = self._entry(archive["frequency"], s11, archive["count"])
+            except (OSError, KeyError, ValueError) as e:
+                logger.warning("Skipping unreadable baseline %s: %s", path, e)
+                continue
+            baselines[grid_key(entry["frequency"])] = entry
+        if baselines:
+            logger.info("Loaded %d rolling baseline(s) from %s.", len(baselines), self.directory)
+        return baselines
+
+    @staticmethod
+    def _entry(frequency, s11, count):
+        return {"frequency": frequency, "s11": s11, "count": np.int64(count),
+                "permittivity": np.abs(s11), "conductivity": np.angle(s11)}
+
+    def _save(self, key, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{key}.npz")
+        temporary = path + ".tmp.npz"
+        np.savez(temporary, frequency=entry["frequency"], s11=entry["s11"], count=entry["count"])
+        os.replace(temporary, path)  # Never leave a half-written baseline behind
+
+    def update(self, frequency, permittivity, conductivity):
+        """Fold one blank sweep (S11 magnitude and phase per point) into its grid's baseline."""
+        frequency = np.asarray(frequency, dtype=np.float64)
+        key = grid_key(frequency)
+        with self._lock:
+            entry = self._baselines.get(key)
+            s11 = np.asarray(permittivity, dtype=np.float64) * np.exp(1j * np.asarray(conductivity, dtype=np.float64))
+            if entry is None:
+                entry = self._entry(frequency, s11, 1)
+            else:
+                entry = self._entry(entry["frequency"], entry["s11"] + self.alpha * (s11 - entry["s11"]),
+                                    entry["count"] + 1)
+            # Replace rather than mutate, so lookups on other threads see whole baselines
+            self._baselines[key] = entry
+            self._resampled = {}
+            self._save(key, entry)
+        logger.info("Baseline for %d points updated (%d blank sweep(s)).", frequency.size, entry["count"])
+        return entry
+
+    def lookup(self, frequency):
+        """(magnitude, phase) arrays on this grid, or None if no captured baseline covers it."""
+        key = grid_key(frequency)
+        entry = self._baselines.get(key)
+        if entry is None:
+            entry = self._resampled.get(key, False)
+            if entry is False:
+                entry = self._resample(np.asarray(frequency, dtype=np.float64), key)
+        if entry is None:
+            return None
+        return entry["permittivity"], entry["conductivity"]
+
+    def _resample(self, frequency, key):
+        with self._lock:
+            lower, upper = frequency.min(), frequency.max()
+            best, best_points = None, 0
+            for candidate in self._baselines.values():
+                grid = candidate["frequency"]
+                if grid[0] <= lower and upper <= grid[-1]:
+                    points = np.count_nonzero((grid >= lower) & (grid <= upper))
+                    if points > best_points:
+                        best, best_points = candidate, points
+            entry = None
+            if best is not None:
+                # Real and imaginary parts interpolate smoothly where the phase would wrap
+                s11 = (np.interp(frequency, best["frequency"], best["s11"].real)
+                       + 1j * np.interp(frequency, best["frequency"], best["s11"].imag))
+                entry = self._entry(frequency, s11, best["count"])
+                logger.info("Using a %d-point baseline interpolated onto a %d-point grid.",
+                            best["frequency"].size, frequency.size)
+            self._resampled[key] = entry
+        return entry
+
+    def __len__(self):
+        return len(self._baselines)
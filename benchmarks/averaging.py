@@ -0,0 +1,78 @@
+"""
+Noise vs sweep time: K software-averaged fast sweeps vs one sweep at IFBW/K.
+
+Runs a FakeVNAServer whose trace noise scales with sqrt(IFBW) and whose sweeps last
+points / IFBW, then for each K takes (a) K sweeps at ``--ifbw`` averaged by
+``vna.acquire_vna_sweep`` (SweepAverager) and (b) one sweep at ``--ifbw`` / K. Both
+should land near the same noise; the table shows what each costs in wall time, and
+compares the measured S11 error of the average with the error predicted from its
+per-point variance (sqrt(mean(s11_var) / K)). Averaging pays the trace fetch and
+parse K times, so it only wins where that is small next to the sweep itself; what it
+adds is the per-point variance. Both sides fetch the way the real acquisition path
+does (straight after *OPC?), unless ``--fetch-delay`` adds a wait before each fetch.
+
+Usage:
+    python benchmarks/averaging.py [--points 501] [--ifbw 10000] [--averages 1 4 16] [--noise 0.001] [--latency 0.0005]
+                                   [--fetch-delay SECONDS]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import logging
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logger as log_setup
+
+log_setup.LOG_DIR = tempfile.mkdtemp(prefix="bench_logs_")  # Keep benchmark output out of output_logs/
+log_setup.shutdown_logging()
+
+from benchmarks.fakes import FakeVNAServer
+from config import VNA_CONFIG
+import vna
+
+
+def sweep(server, config, fetch_delay=None):
+    delay = {} if fetch_delay is None else {"fetch_delay": fetch_delay}
+    start = time.perf_counter()
+    s_parameters = vna.acquire_vna_sweep("localhost", server.port, config=config, **delay)
+    elapsed = time.perf_counter() - start
+    s11 = s_parameters["s11_real"] + 1j * s_parameters["s11_imag"]
+    error = float(np.sqrt(np.mean(np.abs(s11 - (server.real + 1j * server.imag)) ** 2)))
+    return elapsed, error, s_parameters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=501)
+    parser.add_argument("--ifbw", type=float, default=10000, help="IFBW of the fast sweeps (Hz)")
+    parser.add_argument("--averages", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--noise", type=float, default=0.001, help="trace noise std at 1 kHz IFBW")
+    parser.add_argument("--latency", type=float, default=0.0005, help="simulated per-reply latency (s)")
+    parser.add_argument("--fetch-delay", type=float, default=None,
+                        help="post-sweep wait (s); defaults to the one acquire_vna_sweep uses")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    base = {**VNA_CONFIG, 'points': args.points, 'start_frequency': 1e6, 'stop_frequency': 6e9, 'segments': None}
+    print(f"{args.points} points, fast IFBW {args.ifbw:g} Hz, noise {args.noise:g} at 1 kHz, reply latency {args.latency * 1e3:.1f} ms")
+    print(f"  {'K':>3}  {'averaged':>10}  {'S11 error':>10}  {'predicted':>10}  {'IFBW/K':>10}  {'S11 error':>10}")
+
+    with FakeVNAServer(args.points, latency=args.latency, noise=args.noise, ifbw_timing=True) as server:
+        for count in args.averages:
+            averaged_time, averaged_error, averaged = sweep(server, {**base, 'ifbw': args.ifbw, 'averages': count},
+                                                           args.fetch_delay)
+            predicted = np.sqrt(np.mean(averaged["s11_var"]) / count) if count > 1 else float("nan")
+            single_time, single_error, _ = sweep(server, {**base, 'ifbw': args.ifbw / count, 'averages': 1}, args.fetch_delay)
+            print(f"  {count:>3}  {averaged_time:>8.3f} s  {averaged_error:>10.2e}  {predicted:>10.2e}"
+                  f"  {single_time:>8.3f} s  {single_error:>10.2e}")
+
+    log_setup.shutdown_logging()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Local stand-ins for the Jetson hardware so hot paths can be benchmarked anywhere."""
+import sys
+import types
+import ctypes
+import random
+import struct
+import time
+import threading
+import socketserver
+
+import numpy as np
+
+from flow import sensirion_crc8
+
+
+class FakeSMBus:
+    """SMBus double: counts block writes and answers i2c_rdwr reads with valid SLF3S frames."""
+
+    def __init__(self, flow=1.0, noise=0.02, scale_factor=10000.0, seed=0):
+        self.flow = flow
+        self.noise = noise
+        self.scale_factor = scale_factor
+        self.writes = 0
+        self.reads = 0
+        self._random = random.Random(seed)
+
+    def write_i2c_block_data(self, address, register, data, force=None):
+        self.writes += 1
+
+    def write_byte_data(self, address, register, value, force=None):
+        self.writes += 1
+
+    def flow_frame(self):
+        value = self.flow + self._random.gauss(0.0, self.noise)
+        word = struct.pack(">h", max(-32768, min(32767, int(value * self.scale_factor))))
+        return word + bytes([sensirion_crc8(word)])
+
+    def i2c_rdwr(self, *messages):
+        for msg in messages:
+            frame = self.flow_frame()
+            ctypes.memmove(msg.buf, frame, min(msg.len, len(frame)))
+            self.reads += 1
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _fake_gpio_module():
+    gpio = types.ModuleType("Jetson.GPIO")
+    gpio.BOARD, gpio.OUT, gpio.LOW, gpio.HIGH = 10, 0, 0, 1
+    gpio.pins = {}
+    gpio.setmode = lambda mode: None
+    gpio.setup = lambda pin, direction: gpio.pins.setdefault(pin, 0)
+    gpio.output = lambda pin, value: gpio.pins.__setitem__(pin, value)
+    gpio.cleanup = lambda *args: gpio.pins.clear()
+    return gpio
+
+
+def install_fake_gpio():
+    """Make ``import Jetson.GPIO`` resolve to an in-memory fake (call before first GPIO use)."""
+    gpio = _fake_gpio_module()
+    package = types.ModuleType("Jetson")
+    package.GPIO = gpio
+    sys.modules["Jetson"] = package
+    sys.modules["Jetson.GPIO"] = gpio
+    return gpio
+
+
+class FakeFlowAcquisition:
+    """FlowAcquisition double returning a fixed filtered flow."""
+
+    running = True
+
+    def __init__(self, flow=1.0, rate_of_change=0.0):
+        self.flow = flow
+        self.rate = rate_of_change
+
+    def filtered_flow(self, window=None, method=None):
+        return self.flow
+
+    def rate_of_change(self, window=None):
+        return self.rate
+
+
+def trace_line(frequency, real, imag):
+    """A ``VNA:TRACe:DATA?`` response body (without the newline) for the given arrays."""
+    return ",".join(f"[{f},{r},{i}]" for f, r, i in zip(frequency, real, imag)).encode()
+
+
+class _VNAHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        sweep_done = 0.0
+        for line in self.rfile:
+            command = line.decode().strip()
+            if not command:
+                continue
+            if command.startswith("VNA:ACQuisition:IFBW"):
+                server.ifbw = float(command.split()[-1])
+            elif command.startswith("VNA:ACQuisition:POINTS"):
+                server.set_points(int(command.split()[-1]))
+            elif command.startswith("VNA:FREQuency:START"):
+                server.set_points(start=float(command.split()[-1]))
+            elif command.startswith("VNA:FREQuency:STOP"):
+                server.set_points(stop=float(command.split()[-1]))
+            elif command == "VNA:ACQuisition:RUN":
+                sweep_done = time.monotonic() + server.sweep_duration()
+            elif command == "*OPC?":
+                # LibreVNA-GUI answers *OPC? once the sweep has finished
+                delay = sweep_done - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                self._reply(b"1")
+            elif command.startswith("VNA:TRACe:DATA?"):
+                self._reply(server.trace())
+            elif command.endswith("?"):
+                self._reply(b"0")
+
+    def _reply(self, payload):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.wfile.write(payload + b"\n")
+        self.wfile.flush()
+
+
+class FakeVNAServer(socketserver.ThreadingTCPServer):
+    """
+    LibreVNA-GUI SCPI server double on a local port.
+
+    Answers ``*OPC?`` once ``sweep_time`` has passed since ``VNA:ACQuisition:RUN`` and
+    ``VNA:TRACe:DATA?`` with a synthetic trace of the configured points and span; every
+    reply is delayed by ``latency`` seconds. ``resonances`` is a list of (frequency,
+    width, depth) Lorentzian dips in |S11|. With ``noise`` every trace fetched gets
+    fresh Gaussian noise of that standard deviation (real and imaginary part) at 1 kHz
+    IFBW, scaling with sqrt(IFBW); with ``ifbw_timing`` a sweep lasts points / IFBW
+    instead of ``sweep_time``. Use as a context manager; ``port`` is the bound port.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, points=100, sweep_time=0.2, latency=0.0, port=0, resonances=(), noise=0.0, ifbw_timing=False,
+                 seed=0):
+        super().__init__(("127.0.0.1", port), _VNAHandler)
+        self.sweep_time = sweep_time
+        self.latency = latency
+        self.resonances = list(resonances)
+        self.noise = noise
+        self.ifbw_timing = ifbw_timing
+        self.ifbw = 1000.0
+        self._random = np.random.default_rng(seed)
+        self.points, self.start, self.stop = points, 1e6, 6e9
+        self.set_points(points)
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def set_points(self, points=None, start=None, stop=None):
+        self.points = points or self.points
+        self.start = self.start if start is None else start
+        self.stop = self.stop if stop is None else stop
+        frequency = np.linspace(self.start, self.stop, self.points)
+        magnitude = np.full(frequency.size, 0.5)
+        for centre, width, depth in self.resonances:
+            magnitude *= 1 - depth / (1 + ((frequency - centre) / width) ** 2)
+        self.frequency = frequency
+        self.real = magnitude * np.cos(frequency / 1e9)
+        self.imag = magnitude * np.sin(frequency / 1e9)
+        self.trace_response = trace_line(self.frequency, self.real, self.imag)
+
+    def sweep_duration(self):
+        return self.points / self.ifbw if self.ifbw_timing else self.sweep_time
+
+    def trace(self):
+        if not self.noise:
+            return self.trace_response
+        sigma = self.noise * np.sqrt(self.ifbw / 1000.0)
+        return trace_line(self.frequency, self.real + self._random.normal(0, sigma, self.points),
+                          self.imag + self._random.normal(0, sigma, self.points))
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, name=f"fake-vna-{self.port}", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        self.server_close()
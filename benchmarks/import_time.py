@@ -0,0 +1,102 @@
+"""
+Import-time report for the GUI and the offline processing tools.
+
+Runs each entry point in a fresh interpreter with ``python -X importtime`` and
+summarises the cumulative import cost, the slowest imported modules, and
+whether any hardware module (smbus2, Jetson.GPIO) was loaded or a bus opened.
+
+Usage:
+    python benchmarks/import_time.py [--top 10] [--repeat 3] [module ...]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_TARGETS = [
+    "combo_gui",            # GUI entry point
+    "processing_manager",   # Offline processing
+    "feature_engineering",
+    "hdf5_file_inspector",
+    "config",
+]
+
+HARDWARE_MODULES = ("smbus2", "Jetson.GPIO", "Jetson")
+
+# "import time: self [us] | cumulative | imported package"
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S.*)$")
+
+PROBE = """
+import sys
+import {module}
+hw = [m for m in {hardware!r} if m in sys.modules]
+from config import PUMP_CONFIG, FLOW_CONFIG
+opened = [b.bus_number for b in (PUMP_CONFIG['pump_bus'], FLOW_CONFIG['flow_bus']) if b.is_open]
+print("HW_MODULES=" + ",".join(hw))
+print("OPEN_BUSES=" + ",".join(map(str, opened)))
+"""
+
+
+def run_importtime(module):
+    """Import ``module`` in a fresh interpreter and return (entries, probe_output)."""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module, hardware=HARDWARE_MODULES)],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr.strip().splitlines()[-1]}")
+
+    entries = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name.strip(), int(self_us), int(cumulative_us), len(indent) // 2))
+    return entries, proc.stdout
+
+
+def summarise(module, repeat, top):
+    totals = []
+    entries, probe = [], ""
+    for _ in range(repeat):
+        entries, probe = run_importtime(module)
+        totals.append(sum(self_us for _, self_us, _, _ in entries))
+
+    probe_values = dict(line.split("=", 1) for line in probe.splitlines() if "=" in line)
+    slowest = sorted(entries, key=lambda entry: entry[1], reverse=True)[:top]
+
+    print(f"\n== import {module} ==")
+    print(f"total import time: best {min(totals) / 1000:.1f} ms, worst {max(totals) / 1000:.1f} ms over {repeat} run(s)")
+    print(f"hardware modules loaded: {probe_values.get('HW_MODULES') or 'none'}")
+    print(f"I2C buses opened: {probe_values.get('OPEN_BUSES') or 'none'}")
+    print(f"top {top} modules by self time:")
+    for name, self_us, cumulative_us, _ in slowest:
+        print(f"  {self_us / 1000:8.2f} ms self  {cumulative_us / 1000:8.2f} ms cumulative  {name}")
+    return min(totals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=DEFAULT_TARGETS)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    results = {}
+    for module in args.modules:
+        try:
+            results[module] = summarise(module, args.repeat, args.top)
+        except RuntimeError as e:
+            print(f"\n== import {module} ==\n{e}")
+
+    print("\n== summary ==")
+    for module, total_us in results.items():
+        print(f"  {module:<24} {total_us / 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Control-loop iteration time with logging off, through the queue pipeline, and
+with the old synchronous per-logger handlers.
+
+Runs ``flow_control.control_step`` against a fake SMBus and fake GPIO with the
+pump settle delays set to zero, so only the Python work of one iteration
+(flow decode, control law, valve and pump writes, logging) is measured.
+
+Usage:
+    python benchmarks/logging_overhead.py [--iterations 20000] [--no-rate-limit]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import logging
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logger as log_setup
+
+_log_dir = tempfile.mkdtemp(prefix="bench_logs_")
+log_setup.LOG_DIR = _log_dir  # Keep benchmark output out of output_logs/
+log_setup.shutdown_logging()  # The next setup_logger call opens a session in _log_dir
+
+from benchmarks.fakes import FakeSMBus, install_fake_gpio
+install_fake_gpio()
+
+from config import PUMP_CONFIG, shared_data
+import flow_control
+
+HOT_LOGGERS = ("flow_control", "valve", "flow", "pump")
+
+
+def _silence_console():
+    for name in HOT_LOGGERS:
+        log_setup.setup_logger(name, level=logging.CRITICAL)
+
+
+def _set_rate_limit(interval):
+    for hot_logger in log_setup._hot_path_loggers.values():
+        hot_logger.interval = interval
+
+
+def _use_sync_handlers():
+    """Swap the queue handler for direct file and stream handlers, as before the queue pipeline."""
+    formatter = logging.Formatter(log_setup.LOG_FORMAT)
+    file_handler = logging.FileHandler(os.path.join(_log_dir, "sync.log"))
+    file_handler.setFormatter(formatter)
+    stream_handler = logging.StreamHandler(open(os.devnull, "w"))
+    stream_handler.setFormatter(formatter)
+    saved = {}
+    for name in HOT_LOGGERS:
+        module_logger = logging.getLogger(name)
+        saved[name] = module_logger.handlers[:]
+        module_logger.handlers = [file_handler, stream_handler]
+    return saved
+
+
+def _restore_handlers(saved):
+    for name, handlers in saved.items():
+        logging.getLogger(name).handlers = handlers
+
+
+def time_iterations(iterations, pump_bus, flow_bus):
+    durations = []
+    step = flow_control.control_step
+    for _ in range(iterations):
+        start = time.perf_counter()
+        step(pump_bus, flow_bus, shared_data)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def report(label, durations):
+    durations = sorted(durations)
+    p99 = durations[int(len(durations) * 0.99) - 1]
+    print(f"  {label:<10} mean {statistics.fmean(durations) * 1e6:8.1f} us   "
+          f"median {statistics.median(durations) * 1e6:8.1f} us   p99 {p99 * 1e6:8.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--no-rate-limit", action="store_true", help="log every iteration on the hot paths")
+    args = parser.parse_args()
+
+    PUMP_CONFIG["settle_time"] = 0.0
+    PUMP_CONFIG["repeat_delay"] = 0.0
+    pump_bus, flow_bus = FakeSMBus(), FakeSMBus(flow=0.4)
+    _silence_console()
+    if args.no_rate_limit:
+        _set_rate_limit(0.0)
+
+    # Warm up imports, lazily initialised GPIO and caches
+    time_iterations(200, pump_bus, flow_bus)
+
+    print(f"control_step x {args.iterations} (rate limiting {'off' if args.no_rate_limit else 'on'})")
+
+    logging.disable(logging.CRITICAL)
+    report("off", time_iterations(args.iterations, pump_bus, flow_bus))
+    logging.disable(logging.NOTSET)
+
+    report("queued", time_iterations(args.iterations, pump_bus, flow_bus))
+
+    saved = _use_sync_handlers()
+    try:
+        report("sync", time_iterations(args.iterations, pump_bus, flow_bus))
+    finally:
+        _restore_handlers(saved)
+
+    log_setup.shutdown_logging()
+    print(f"log output written under {_log_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Acquisition and processing hot paths, compared against stored baselines.
+
+Every case runs on synthetic sweeps and local fakes and reports seconds per
+operation (lower is better):
+
+  parse/<points>            vna.parse_trace_data on one trace response
+  stream/<points>           vna.SocketStreamReader.readline of one trace line over a socketpair
+  preprocess/<points>       ProcessingManager.preprocess of one raw sweep
+  save_to_csv/<sweeps>      ProcessingManager.save_to_csv append once the CSV holds <sweeps> sweeps
+  append_to_h5/<sweeps>     ProcessingManager.append_to_h5 append once the HDF5 store holds <sweeps> sweeps
+  flow_step                 flow_control.control_step with a fake SMBus and GPIO, settle delays off
+
+Results are compared with ``benchmarks/baselines.json``; a case slower than the
+baseline by more than ``--threshold`` is reported as a regression and makes the run
+exit with status 1. Baselines are machine specific: record them with
+``--save-baseline`` on the machine the suite is compared on. Timings on shared or
+throttled machines vary by tens of percent between runs, hence the 1.5x default.
+
+Usage:
+    python benchmarks/suite.py [--quick] [--only parse stream preprocess storage flow] [--points 100 1000 10000]
+                               [--sweeps 1 100 1000 10000] [--threshold 1.5] [--output results.json] [--save-baseline]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import statistics
+import warnings
+import logging
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logger as log_setup
+
+log_setup.LOG_DIR = tempfile.mkdtemp(prefix="bench_logs_")  # Keep benchmark output out of output_logs/
+log_setup.shutdown_logging()
+
+from benchmarks.fakes import FakeSMBus, install_fake_gpio, trace_line
+install_fake_gpio()
+
+from config import PUMP_CONFIG, shared_data
+import vna
+import flow_control
+from processing_manager import ProcessingManager
+from sweep_pipeline import sweep_to_dataframe
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+GROUPS = ("parse", "stream", "preprocess", "storage", "flow")
+
+
+# Each timed run lasts at least this long, so short cases are not dominated by timer and scheduler noise
+MIN_RUN_TIME = 0.2
+
+
+def best_of(function, repeats, min_time=MIN_RUN_TIME):
+    """Fastest mean time per call of ``function`` over ``repeats`` runs of at least ``min_time`` each."""
+    start = time.perf_counter()
+    function()
+    number = max(1, int(min_time / max(time.perf_counter() - start, 1e-9)))
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def synthetic_sweep(points, seed=0):
+    """S-parameters shaped like a FakeVNAServer sweep, with a resonance and a little noise."""
+    rng = np.random.default_rng(seed)
+    frequency = np.linspace(1e6, 6e9, points)
+    s_parameters = {"frequency": frequency}
+    for index, key in enumerate(("s11", "s21", "s12", "s22")):
+        magnitude = 0.5 / (index + 1) * (1 - 0.8 / (1 + ((frequency - 2.4e9) / 3e7) ** 2))
+        value = magnitude * np.exp(1j * frequency / 1e9) + rng.normal(0, 1e-4, points) + 1j * rng.normal(0, 1e-4, points)
+        s_parameters[f"{key}_real"], s_parameters[f"{key}_imag"] = value.real, value.imag
+    return s_parameters
+
+
+def new_manager(directory):
+    # Only the core pipeline: no calibration, rolling baseline, models or similarity index
+    return ProcessingManager(baseline_file=os.path.join(directory, "none.csv"),
+                             processed_dir=os.path.join(directory, "processed"),
+                             h5_file=os.path.join(directory, "data", "data.h5"),
+                             calibration_dir=None, baseline_dir=None, model_dir=None, index_dir=None)
+
+
+def bench_parse(args):
+    results = {}
+    for points in args.points:
+        sweep = synthetic_sweep(points)
+        response = trace_line(sweep["frequency"], sweep["s11_real"], sweep["s11_imag"]).decode()
+        results[f"parse/{points}"] = best_of(lambda: vna.parse_trace_data(response), args.repeats)
+    return results
+
+
+def bench_stream(args):
+    results = {}
+    for points in args.points:
+        sweep = synthetic_sweep(points)
+        line = trace_line(sweep["frequency"], sweep["s11_real"], sweep["s11_imag"]) + b"\n"
+        number = max(4, 100000 // points)
+        best = float("inf")
+        for _ in range(args.repeats):
+            reader_socket, writer_socket = socket.socketpair()
+            sender = threading.Thread(target=writer_socket.sendall, args=(line * number,), daemon=True)
+            try:
+                reader = vna.SocketStreamReader(reader_socket)
+                start = time.perf_counter()
+                sender.start()
+                for _ in range(number):
+                    reader.readline()
+                best = min(best, (time.perf_counter() - start) / number)
+            finally:
+                sender.join()
+                reader_socket.close()
+                writer_socket.close()
+        results[f"stream/{points}"] = best
+    return results
+
+
+def bench_preprocess(args):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bench_preprocess_") as directory:
+        manager = new_manager(directory)
+        for points in args.points:
+            raw = sweep_to_dataframe(synthetic_sweep(points), "NaCl", 1.0, 1)
+            results[f"preprocess/{points}"] = best_of(lambda: manager.preprocess(raw.copy()), args.repeats)
+    return results
+
+
+def _fill(manager, template, h5_template, sweeps):
+    """Append ``sweeps`` copies of one processed sweep to the CSV and HDF5 stores in bulk."""
+    csv_path = os.path.join(manager.processed_dir, "processed_data.csv")
+    chunk = 500
+    with pd.HDFStore(manager.h5_file) as store:
+        for start in range(0, sweeps, chunk):
+            count = min(chunk, sweeps - start)
+            pd.concat([template] * count).to_csv(csv_path, mode="a", index=False, header=not os.path.exists(csv_path))
+            store.append("processed_data", pd.concat([h5_template] * count, ignore_index=True),
+                         format="table", data_columns=True)
+
+
+def bench_storage(args):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bench_storage_") as directory:
+        manager = new_manager(directory)
+        processed = manager.preprocess(sweep_to_dataframe(synthetic_sweep(args.storage_points), "NaCl", 1.0, 1))
+        summary = manager.sweep_summary(processed)
+        # save_to_csv turns complex columns into _Real/_Imag in place; HDF5 also renames spaces
+        template = processed.copy()
+        manager.save_to_csv(template)
+        h5_template = template.rename(columns=lambda column: column.replace(" ", "_"))
+        manager.append_to_h5(template.copy(), summary)
+        stored = 1
+
+        for sweeps in sorted(args.sweeps):
+            if sweeps > stored:
+                print(f"  filling stores to {sweeps} sweeps...", flush=True)
+                _fill(manager, template, h5_template, sweeps - stored)
+                stored = sweeps
+            csv_times, h5_times = [], []
+            for _ in range(args.samples):
+                data = processed.copy()
+                start = time.perf_counter()
+                manager.save_to_csv(data)
+                csv_times.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                manager.append_to_h5(data, summary)
+                h5_times.append(time.perf_counter() - start)
+            stored += args.samples
+            results[f"save_to_csv/{sweeps}"] = statistics.median(csv_times)
+            results[f"append_to_h5/{sweeps}"] = statistics.median(h5_times)
+    return results
+
+
+def bench_flow(args):
+    PUMP_CONFIG["settle_time"] = 0.0
+    PUMP_CONFIG["repeat_delay"] = 0.0
+    pump_bus, flow_bus = FakeSMBus(), FakeSMBus(flow=0.4)
+    step = lambda: flow_control.control_step(pump_bus, flow_bus, shared_data)
+    best_of(step, 1)  # Warm up lazily initialised GPIO and caches
+    return {"flow_step": best_of(step, args.repeats)}
+
+
+BENCHMARKS = {"parse": bench_parse, "stream": bench_stream, "preprocess": bench_preprocess,
+              "storage": bench_storage, "flow": bench_flow}
+
+
+def machine():
+    return {"platform": platform.platform(), "python": platform.python_version(), "numpy": np.__version__,
+            "pandas": pd.__version__, "recorded": datetime.now().isoformat(timespec="seconds")}
+
+
+def format_seconds(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g} {unit}"
+    return f"{seconds / 1e-9:.3g} ns"
+
+
+def compare(results, baseline, threshold):
+    """Print current vs baseline per case; returns the names of the regressed cases."""
+    regressions = []
+    print(f"  {'case':<22} {'current':>10} {'baseline':>10} {'ratio':>7}")
+    for name, seconds in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            print(f"  {name:<22} {format_seconds(seconds):>10} {'-':>10} {'':>7}  new")
+            continue
+        ratio = seconds / reference
+        verdict = ""
+        if ratio > threshold:
+            verdict = "REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 / threshold:
+            verdict = "faster"
+        print(f"  {name:<22} {format_seconds(seconds):>10} {format_seconds(reference):>10} {ratio:>6.2f}x  {verdict}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=GROUPS, default=list(GROUPS))
+    parser.add_argument("--points", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--sweeps", type=int, nargs="+", default=[1, 100, 1000, 10000],
+                        help="store sizes at which append latency is measured")
+    parser.add_argument("--storage-points", type=int, default=100, help="points per sweep in the storage cases")
+    parser.add_argument("--samples", type=int, default=5, help="appends timed per store size (median reported)")
+    parser.add_argument("--repeats", type=int, default=5, help="runs per case (fastest reported)")
+    parser.add_argument("--quick", action="store_true", help="stores up to 1000 sweeps, 3 repeats")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=1.5, help="slowdown ratio reported as a regression")
+    parser.add_argument("--output", help="also write the results here as JSON")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args()
+    if args.quick:
+        args.sweeps = [sweeps for sweeps in args.sweeps if sweeps <= 1000]
+        args.repeats = min(args.repeats, 3)
+        args.samples = min(args.samples, 3)
+
+    logging.disable(logging.CRITICAL)
+    warnings.filterwarnings("ignore", message="object name is not a valid Python identifier")  # "Frequency_(Hz)"
+    results = {}
+    for group in args.only:
+        print(f"running {group}...", flush=True)
+        results.update(BENCHMARKS[group](args))
+    log_setup.shutdown_logging()
+
+    report = {"machine": machine(), "results": results}
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(report, handle, indent=2)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+    if args.save_baseline:
+        # Cases not run this time keep their stored baseline
+        stored = {**(baseline or {}).get("results", {}), **results}
+        with open(args.baseline, "w") as handle:
+            json.dump({"machine": report["machine"], "results": stored}, handle, indent=2)
+        print(f"baseline saved to {args.baseline}")
+
+    if baseline is None:
+        if not args.save_baseline:
+            print(f"no baseline at {args.baseline}; results only")
+        compare(results, {}, args.threshold)
+        return 0
+    print(f"vs baseline recorded {baseline['machine'].get('recorded')} on {baseline['machine'].get('platform')}")
+    regressions = compare(results, baseline["results"], args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.2f}x: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Sweep throughput of N simulated VNAs: threaded client vs one asyncio event loop.
+
+Starts N FakeVNAServer instances on local ports and takes a full sweep (configure,
+run, *OPC?, fetch S21/S11/S12/S22) from each, in three ways: one after another with
+``vna.libreVNA``, one thread per instrument with ``vna.libreVNA``, and concurrently
+on a single event loop with ``vna_async.AsyncLibreVNA``. The post-sweep fetch delay
+is disabled so only instrument and client time is measured.
+
+Usage:
+    python benchmarks/vna_clients.py [--instruments 1 4 16] [--points 1001] [--sweep-time 0.2] [--latency 0.002] [--rounds 3]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import logging
+import threading
+from contextlib import ExitStack
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logger as log_setup
+
+log_setup.LOG_DIR = tempfile.mkdtemp(prefix="bench_logs_")  # Keep benchmark output out of output_logs/
+log_setup.shutdown_logging()
+
+from benchmarks.fakes import FakeVNAServer
+from config import VNA_CONFIG
+import vna
+import vna_async
+
+
+def threaded_sweep(port, results, index):
+    client = vna.libreVNA(port=port, fetch_timeout=30)
+    try:
+        for command in vna.sweep_setup_commands():
+            client.send_command(command)
+        client.send_command("VNA:ACQuisition:RUN")
+        vna.wait_for_sweep_completion(client, poll_interval=0.01)
+        results[index] = client.fetch_s_parameters()
+    finally:
+        client.close()
+
+
+def run_sequential(ports):
+    results = [None] * len(ports)
+    for index, port in enumerate(ports):
+        threaded_sweep(port, results, index)
+    return results
+
+
+def run_threaded(ports):
+    results = [None] * len(ports)
+    threads = [threading.Thread(target=threaded_sweep, args=(port, results, index)) for index, port in enumerate(ports)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def run_asyncio(ports):
+    endpoints = [("localhost", port) for port in ports]
+    return asyncio.run(vna_async.acquire_many(endpoints, fetch_delay=0))
+
+
+def measure(runner, ports, rounds):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        results = runner(ports)
+        best = min(best, time.perf_counter() - start)
+        failed = [result for result in results if not isinstance(result, dict)]
+        if failed:
+            raise RuntimeError(f"{runner.__name__}: {failed[0]!r}")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--instruments", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--points", type=int, default=1001)
+    parser.add_argument("--sweep-time", type=float, default=0.2, help="simulated sweep duration (s)")
+    parser.add_argument("--latency", type=float, default=0.002, help="simulated per-reply latency (s)")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    VNA_CONFIG["points"] = args.points
+    print(f"{args.points} points, sweep {args.sweep_time * 1e3:.0f} ms, reply latency {args.latency * 1e3:.1f} ms, best of {args.rounds}")
+    print(f"  {'VNAs':>4}  {'sequential':>12}  {'threads':>12}  {'asyncio':>12}  {'asyncio sweeps/s':>16}")
+
+    for count in args.instruments:
+        with ExitStack() as stack:
+            servers = [stack.enter_context(FakeVNAServer(args.points, args.sweep_time, args.latency)) for _ in range(count)]
+            ports = [server.port for server in servers]
+            sequential = measure(run_sequential, ports, args.rounds)
+            threaded = measure(run_threaded, ports, args.rounds)
+            concurrent = measure(run_asyncio, ports, args.rounds)
+        print(f"  {count:>4}  {sequential:>10.3f} s  {threaded:>10.3f} s  {concurrent:>10.3f} s  {count / concurrent:>16.1f}")
+
+    log_setup.shutdown_logging()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import os
+import sys
+import glob
+import hashlib
+import argparse
+import threading
+import numpy as np
+from config import CALIBRATION_CONFIG
+from logger import setup_logger
+import logging
+
+logger = setup_logger(__name__, level=logging.INFO)
+
+STANDARDS = ("short", "open", "load", "thru")
+
+# Twelve-term two-port error model. Forward (port 1 driving): directivity e00, source
+# match e11, reflection tracking e10e01, load match e22, transmission tracking e10e32,
+# isolation e30. Reverse (port 2 driving): the same six terms, with an "_r" suffix.
+ERROR_TERMS = (
+    "e00", "e11", "e10e01", "e22", "e10e32", "e30",
+    "e33_r", "e22_r", "e23e32_r", "e11_r", "e23e01_r", "e03_r",
+)
+
+
+def grid_key(frequency):
+    """Stable identifier of a frequency grid (exact point positions, not just start/stop/count)."""
+    frequency = np.ascontiguousarray(frequency, dtype="<f8")
+    return hashlib.sha1(frequency.tobytes()).hexdigest()[:16]
+
+
+def complex_trace(s_parameters, parameter):
+    return np.asarray(s_parameters[f"{parameter}_real"]) + 1j * np.asarray(s_parameters[f"{parameter}_imag"])
+
+
+def one_port_terms(short, open_, load):
+    """Directivity, source match and reflection tracking from ideal short (-1), open (+1) and load (0)."""
+    directivity = load
+    a = open_ - directivity
+    b = short - directivity
+    source_match = (a + b) / (a - b)
+    tracking = a * (1 - source_match)
+    return directivity, source_match, tracking
+
+
+def solve_error_terms(standards):
+    """
+    Compute the twelve error terms from measured standards.
+
+    ``standards`` maps "short", "open", "load" (both ports' reflections, s11 and s22)
+    and "thru" (all four parameters) to s-parameter dicts like vna.fetch_s_parameters
+    returns; an optional "isolation" measurement (both ports terminated) supplies s21
+    and s12 leakage. Standards are treated as ideal.
+    """
+    missing = [name for name in STANDARDS if name not in standards]
+    if missing:
+        raise ValueError(f"Missing calibration standards: {', '.join(missing)}")
+
+    def trace(name, parameter):
+        return complex_trace(standards[name], parameter)
+
+    e00, e11, e10e01 = one_port_terms(trace("short", "s11"), trace("open", "s11"), trace("load", "s11"))
+    e33_r, e22_r, e23e32_r = one_port_terms(trace("short", "s22"), trace("open", "s22"), trace("load", "s22"))
+
+    if "isolation" in standards:
+        e30, e03_r = trace("isolation", "s21"), trace("isolation", "s12")
+    else:
+        e30 = e03_r = np.zeros_like(e00)
+
+    # Flush thru: the port-1 reflection reveals the forward load match, and vice versa
+    thru_s11, thru_s21 = trace("thru", "s11"), trace("thru", "s21")
+    thru_s22, thru_s12 = trace("thru", "s22"), trace("thru", "s12")
+    e22 = (thru_s11 - e00) / (e10e01 + e11 * (thru_s11 - e00))
+    e11_r = (thru_s22 - e33_r) / (e23e32_r + e22_r * (thru_s22 - e33_r))
+    e10e32 = (thru_s21 - e30) * (1 - e11 * e22)
+    e23e01_r = (thru_s12 - e03_r) * (1 - e22_r * e11_r)
+
+    return dict(zip(ERROR_TERMS, (e00, e11, e10e01, e22, e10e32, e30,
+                                  e33_r, e22_r, e23e32_r, e11_r, e23e01_r, e03_r)))
+
+
+class Calibration:
+    """Twelve-term error model on one frequency grid, applied to whole sweeps at once."""
+
+    def __init__(self, frequency, terms):
+        self.frequency = np.asarray(frequency, dtype=np.float64)
+        self.terms = {name: np.asarray(terms[name], dtype=np.complex128) for name in ERROR_TERMS}
+        self.key = grid_key(self.frequency)
+
+    @classmethod
+    def from_standards(cls, standards):
+        frequency = np.asarray(standards["thru"]["frequency"])
+        for name, measurement in standards.items():
+            if not np.array_equal(np.asarray(measurement["frequency"]), frequency):
+                raise ValueError(f"Standard '{name}' was measured on a different frequency grid")
+        return cls(frequency, solve_error_terms(standards))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as archive:
+            return cls(archive["frequency"], {name: archive[name] for name in ERROR_TERMS})
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(path, frequency=self.frequency, **self.terms)
+        return path
+
+    def resampled(self, frequency):
+        """The same calibration interpolated onto another grid inside its span."""
+        frequency = np.asarray(frequency, dtype=np.float64)
+        if frequency[0] < self.frequency[0] or frequency[-1] > self.frequency[-1]:
+            raise ValueError("Grid extends beyond the calibrated frequency range")
+        terms = {
+            name: np.interp(frequency, self.frequency, values.real) + 1j * np.interp(frequency, self.frequency, values.imag)
+            for name, values in self.terms.items()
+        }
+        return Calibration(frequency, terms)
+
+    def correct(self, s11, s21, s12, s22):
+        """Return error-corrected (s11, s21, s12, s22) complex arrays for measured ones."""
+        t = self.terms
+        n11 = (s11 - t["e00"]) / t["e10e01"]
+        n21 = (s21 - t["e30"]) / t["e10e32"]
+        n12 = (s12 - t["e03_r"]) / t["e23e01_r"]
+        n22 = (s22 - t["e33_r"]) / t["e23e32_r"]
+        denominator = (1 + n11 * t["e11"]) * (1 + n22 * t["e22_r"]) - n21 * n12 * t["e22"] * t["e11_r"]
+        return (
+            (n11 * (1 + n22 * t["e22_r"]) - t["e22"] * n21 * n12) / denominator,
+            n21 * (1 + n22 * (t["e22_r"] - t["e22"])) / denominator,
+            n12 * (1 + n11 * (t["e11"] - t["e11_r"])) / denominator,
+            (n22 * (1 + n11 * t["e11"]) - t["e11_r"] * n21 * n12) / denominator,
+        )
+
+    def correct_dataframe(self, data):
+        """Correct the raw ``S.. Real``/``S.. Imaginary`` columns of one sweep in place."""
+        measured = [data[f"{name} Real"].to_numpy() + 1j * data[f"{name} Imaginary"].to_numpy()
+                    for name in ("S11", "S21", "S12", "S22")]
+        for name, corrected in zip(("S11", "S21", "S12", "S22"), self.correct(*measured)):
+            data[f"{name} Real"] = corrected.real
+            data[f"{name} Imaginary"] = corrected.imag
+        return data
+
+
+class CalibrationStore:
+    """
+    Calibrations on disk (``<dir>/<grid key>.npz``), loaded once and cached by grid.
+
+    ``for_grid`` returns the calibration measured on exactly that grid, otherwise one
+    interpolated from a stored calibration whose span covers it, otherwise None.
+    Lookups after the first for a grid are a single dict access.
+    """
+
+    def __init__(self, directory=CALIBRATION_CONFIG['dir']):
+        self.directory = directory
+        self._calibrations = None
+        self._by_grid = {}
+        self._lock = threading.Lock()
+
+    def _load_all(self):
+        calibrations = {}
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.npz"))):
+            try:
+                calibration = Calibration.load(path)
+            except (OSError, KeyError, ValueError) as e:
+                logger.warning("Skipping unreadable calibration %s: %s", path, e)
+                continue
+            calibrations[calibration.key] = calibration
+        if calibrations:
+            logger.info("Loaded %d calibration(s) from %s.", len(calibrations), self.directory)
+        return calibrations
+
+    def add(self, calibration):
+        """Store a calibration on disk and make it available immediately."""
+        path = calibration.save(os.path.join(self.directory, f"{calibration.key}.npz"))
+        with self._lock:
+            if self._calibrations is None:
+                self._calibrations = self._load_all()
+            self._calibrations[calibration.key] = calibration
+            self._by_grid.clear()  # Interpolated entries may now have a better match
+        logger.info("Calibration for %d points saved to %s.", calibration.frequency.size, path)
+        return path
+
+    def for_grid(self, frequency):
+        key = grid_key(frequency)
+        cached = self._by_grid.get(key, False)
+        if cached is not False:
+            return cached
+        with self._lock:
+            if self._calibrations is None:
+                self._calibrations = self._load_all()
+            calibration = self._calibrations.get(key)
+            if calibration is None:
+                frequency = np.asarray(frequency, dtype=np.float64)
+                for candidate in self._calibrations.values():
+                    if candidate.frequency[0] <= frequency[0] and frequency[-1] <= candidate.frequency[-1]:
+                        calibration = candidate.resampled(frequency)
+                        logger.info("Using calibration %s interpolated onto a %d-point grid.", candidate.key, frequency.size)
+                        break
+            self._by_grid[key] = calibration
+        return calibration
+
+
+def standard_path(name, directory=CALIBRATION_CONFIG['dir']):
+    return os.path.join(directory, "standards", f"{name}.npz")
+
+
+def save_standard(name, s_parameters, directory=CALIBRATION_CONFIG['dir']):
+    path = standard_path(name, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez(path, **{key: np.asarray(value) for key, value in s_parameters.items()})
+    logger.info("Standard '%s' saved to %s.", name, path)
+    return path
+
+
+def load_standards(directory=CALIBRATION_CONFIG['dir']):
+    standards = {}
+    for name in STANDARDS + ("isolation",):
+        path = standard_path(name, directory)
+        if os.path.exists(path):
+            with np.load(path) as archive:
+                standards[name] = {key: archive[key] for key in archive.files}
+    return standards
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure calibration standards and compute SOLT error terms.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    measure = commands.add_parser("measure", help="sweep one standard connected to the VNA")
+    measure.add_argument("standard", choices=STANDARDS + ("isolation",))
+    measure.add_argument("--host", default="localhost")
+    measure.add_argument("--port", type=int, default=19542)
+    commands.add_parser("solve", help="compute and store error terms from the measured standards")
+    parser.add_argument("--dir", default=CALIBRATION_CONFIG['dir'])
+    args = parser.parse_args(argv)
+
+    if args.command == "measure":
+        from vna import acquire_vna_sweep
+        save_standard(args.standard, acquire_vna_sweep(args.host, args.port), args.dir)
+    else:
+        calibration = Calibration.from_standards(load_standards(args.dir))
+        CalibrationStore(args.dir).add(calibration)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
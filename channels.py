@@ -0,0 +1,174 @@
+import os
+import sys
+import argparse
+import threading
+from experiment import ExperimentSession, ExperimentAborted
+from recipe import read_recipe_document, parse_recipe
+from sweep_pipeline import SweepPipeline
+from config import (CHANNELS, CHANNEL_OUTPUT_DIR, VALVE_CONFIG, BASELINE_CONFIG, CALIBRATION_CONFIG, SIMILARITY_CONFIG,
+                    INFERENCE_CONFIG, make_flow_cell_state)
+from hardware import gpio as GPIO
+from logger import setup_logger, channel_thread_name
+import logging
+
+logger = setup_logger(__name__, level=logging.INFO)
+
+
+class Channel:
+    """
+    One measurement channel: a flow cell with its own pump, flow sensor, valve pair and VNA.
+
+    Every channel has its own FlowCellState, sweep pipeline (one worker, its own HDF5
+    file) and output directory ``<CHANNEL_OUTPUT_DIR>/<name>/``, so channels never share
+    a file; its calibration, rolling baselines, concentration models and similarity
+    index are kept there too, as they belong to that VNA and cell and would be
+    clobbered if shared. Its threads are named ``<name>:<role>``, which also copies
+    their log records into the channel's own log file.
+    """
+
+    def __init__(self, name, vna_host='localhost', vna_port=19542, pump_bus=None, flow_bus=None,
+                 valve_pins=None, output_dir=None, baseline_file="baseline.csv"):
+        self.name = name
+        self.vna_endpoint = (vna_host, vna_port)
+        self.pump_bus = pump_bus
+        self.flow_bus = flow_bus
+        self.valve_pins = tuple(valve_pins or VALVE_CONFIG['pins'])
+        self.output_dir = output_dir or os.path.join(CHANNEL_OUTPUT_DIR, name)
+        self.state = make_flow_cell_state()
+        self.pipeline = SweepPipeline(
+            baseline_file=baseline_file,
+            processed_dir=os.path.join(self.output_dir, "processed_data"),
+            h5_file=os.path.join(self.output_dir, "data.h5"),
+            baseline_dir=os.path.join(self.output_dir, BASELINE_CONFIG['dir']),
+            calibration_dir=os.path.join(self.output_dir, CALIBRATION_CONFIG['dir']),
+            model_dir=os.path.join(self.output_dir, INFERENCE_CONFIG['model_dir']),
+            index_dir=os.path.join(self.output_dir, SIMILARITY_CONFIG['dir']),
+            name=channel_thread_name(name, "sweep-pipeline"),
+        )
+        GPIO.register_outputs(*self.valve_pins)
+
+    @classmethod
+    def from_config(cls, name, settings=None):
+        return cls(name, **(settings if settings is not None else CHANNELS[name]))
+
+    def session(self, observers=()):
+        return ExperimentSession(
+            self.state, self.pump_bus, self.flow_bus, observers=observers, valve_pins=self.valve_pins,
+            vna_endpoint=self.vna_endpoint, pipeline=self.pipeline, output_dir=self.output_dir, channel=self.name,
+        )
+
+    def run(self, runs):
+        """Run every experiment in ``runs`` (parsed recipe runs) on this channel; returns the outcomes."""
+        outcomes = []
+        with self.session() as session:
+            for run in runs:
+                first = int(run.get("first_experiment", 1))
+                for experiment_number in range(first, first + run["repeats"]):
+                    logger.info("%s: %s, %s ppm, Experiment %d...",
+                                self.name, run["chemical"], run["concentration"], experiment_number)
+                    try:
+                        outcomes.append(session.run(run["chemical"], run["concentration"], experiment_number,
+                                                    phase_config=run["phases"]))
+                    except ExperimentAborted:
+                        logger.warning("%s stopped at experiment %d.", self.name, experiment_number)
+                        return outcomes
+        return outcomes
+
+    def stop(self):
+        """Abort this channel's running experiment."""
+        self.state.update(terminate=True)
+
+
+class MultiChannelRunner:
+    """Runs each channel's experiments on its own thread, all channels at the same time."""
+
+    def __init__(self, channels):
+        self.channels = {channel.name: channel for channel in channels}
+        self.outcomes = {}
+        self.errors = {}
+
+    def _run_channel(self, channel, runs):
+        try:
+            self.outcomes[channel.name] = channel.run(runs)
+        except Exception as e:
+            logger.error("Channel %s failed: %s", channel.name, e)
+            self.errors[channel.name] = e
+        finally:
+            logger.info("Channel %s finished.", channel.name)
+
+    def run(self, assignments):
+        """
+        Run ``assignments`` ({channel name: parsed runs}) concurrently.
+
+        Returns once every channel has finished and its queued sweeps are stored, with
+        {channel name: list of ExperimentSession.run results}.
+        """
+        threads = [
+            threading.Thread(target=self._run_channel, args=(self.channels[name], runs),
+                             name=channel_thread_name(name, "process"))
+            for name, runs in assignments.items()
+        ]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            self.stop()
+            for thread in threads:
+                thread.join()
+            raise
+        finally:
+            for name in assignments:
+                self.channels[name].pipeline.shutdown()
+            GPIO.cleanup()
+        return self.outcomes
+
+    def stop(self):
+        for channel in self.channels.values():
+            channel.stop()
+
+
+def configured_channels(names=None):
+    """Build Channel objects for ``names`` (all of config.CHANNELS if None)."""
+    return [Channel.from_config(name) for name in (names or CHANNELS)]
+
+
+def load_assignments(path, channel_names):
+    """
+    Read a recipe for several channels.
+
+    A recipe with a ``channels`` mapping gives each channel its own runs
+    (``{"channels": {"cell1": <recipe>, "cell2": <recipe>}}``); any other recipe is run
+    on every channel in ``channel_names``.
+    """
+    document = read_recipe_document(path)
+    if isinstance(document, dict) and "channels" in document:
+        return {name: parse_recipe(recipe) for name, recipe in document["channels"].items()}
+    runs = parse_recipe(document)
+    return {name: runs for name in channel_names}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run recipes on several measurement channels at once.")
+    parser.add_argument("recipe", help="JSON or YAML recipe; may map channel names to their own recipes")
+    parser.add_argument("--channels", nargs="+", help="channels to use (default: all in config.CHANNELS)")
+    args = parser.parse_args(argv)
+
+    names = args.channels or list(CHANNELS)
+    assignments = load_assignments(args.recipe, names)
+    unknown = set(assignments) - set(CHANNELS)
+    if unknown:
+        parser.error(f"unknown channels: {', '.join(sorted(unknown))}")
+
+    runner = MultiChannelRunner(configured_channels(list(assignments)))
+    try:
+        runner.run(assignments)
+    except KeyboardInterrupt:
+        logger.warning("Interrupted.")
+        return 1
+    return 1 if runner.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,7 +10,7 @@ def clean_up_gpios():
         GPIO.cleanup()
         logger.info("GPIO cleanup completed.")
     except Exception as e:
-        logger.error(f"An error occurred during GPIO cleanup: {e}")
+        logger.error("An error occurred during GPIO cleanup: %s", e)
 
 if __name__ == "__main__":
     clean_up_gpios()
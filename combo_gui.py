@@ -2,16 +2,22 @@ import threading
 import time
 import tkinter as tk
 from tkinter import ttk
-import Jetson.GPIO as GPIO
-from flow_control import flow_control_thread, flow_lock
-from process import flush_process, homogenization_process, sample_process, flush_finish_flag, homogenization_finish_flag, sample_finish_flag
-from pump import stop_pump
-from config import PUMP_CONFIG, FLOW_CONFIG, PROCESS_CONFIG, shared_data
+import numpy as np
+from experiment import ExperimentSession
+from gui_bridge import GuiBridge
+from sweep_pipeline import drain_default_pipeline
+from config import GUI_CONFIG, shared_data
 import logging
 from logger import setup_logger
+from hardware import gpio as GPIO
 
 logger = setup_logger(__name__, level=logging.INFO)
 
+try:
+    from live_plots import LivePlots
+except ImportError:  # matplotlib is optional; the window works without plots
+    LivePlots = None
+
 
 class CombinedGUI:
     def __init__(self, root):
@@ -19,8 +25,8 @@ class CombinedGUI:
         self.root.title("VNA Sweep and Process Monitor")
 
         # Set reduced window size for better proportion
-        window_width = 600
-        window_height = 400
+        window_width = 900 if LivePlots is not None else 600
+        window_height = 760 if LivePlots is not None else 400
         screen_width = self.root.winfo_screenwidth()
         screen_height = self.root.winfo_screenheight()
 
@@ -43,7 +49,7 @@ class CombinedGUI:
 
         # Create grid layout for centering
         self.root.grid_rowconfigure(0, weight=1)
-        self.root.grid_rowconfigure(7, weight=1)
+        self.root.grid_rowconfigure(8, weight=1)
         self.root.grid_columnconfigure(0, weight=1)
         self.root.grid_columnconfigure(2, weight=1)
 
@@ -73,9 +79,28 @@ class CombinedGUI:
         # Timer related variables
         self.start_time = 0
         self.is_timer_running = False
+        self.shown_seconds = None
         self.concentration = None
         self.chemical = None
 
+        # Worker threads post updates here; they are applied on the Tk thread once per frame
+        self.bridge = GuiBridge(root, GUI_CONFIG['frame_rate'])
+        self.bridge.subscribe("status", lambda message: self.status_label.config(text=message))
+        self.bridge.subscribe("timer", lambda text: self.timer_label.config(text=text))
+        self.bridge.on_frame(self.update_timer)
+
+        self.plots = None
+        if LivePlots is not None:
+            self.plots = LivePlots(root, flow_window=GUI_CONFIG['flow_plot_window'],
+                                   max_flow_points=GUI_CONFIG['max_flow_points'],
+                                   bg_color=self.bg_color, fg_color=self.fg_color)
+            self.plots.widget.grid(row=6, column=1, columnspan=2, pady=10, sticky='nsew')
+            self.bridge.subscribe("flow", self.plots.add_flow)
+            self.bridge.subscribe("spectrum", lambda spectrum: self.plots.set_spectrum(*spectrum))
+            self.bridge.subscribe("clear", lambda _: self.plots.clear())
+            self.bridge.on_frame(self.plots.refresh)
+        self.bridge.start()
+
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def on_submit(self):
@@ -92,102 +117,97 @@ class CombinedGUI:
         self.process_thread.start()
 
     def run_experiments(self, num_experiments):
-        """Runs multiple experiments in a loop."""
-        for experiment_number in range(1, num_experiments + 1):
-            logger.info(f"Starting Experiment {experiment_number}...")
-            self.run_process_sequence(self.chemical, self.concentration, experiment_number)
-            logger.info(f"Completed Experiment {experiment_number}.")
-
-    def run_process_sequence(self, chemical, concentration, experiment_number):
-        """Runs the process sequence and updates the GUI."""
-        GPIO.setmode(GPIO.BOARD)
+        """Runs multiple experiments in a loop on one flow-control session."""
         try:
-            self.flow_thread = threading.Thread(target=flow_control_thread, args=(PUMP_CONFIG['pump_bus'], FLOW_CONFIG['flow_bus'], shared_data))
-            self.flow_thread.start()
-
-            # Flush process
-            self.update_status("Starting flush process...")
-            self.start_timer()
-            flush_process(shared_data, flow_lock, flush_finish_flag)
-            self.stop_timer()
-
-            # Homogenization process
-            self.update_status("Starting homogenization process...")
-            self.start_timer()
-            homogenization_process(shared_data, flow_lock, homogenization_finish_flag)
-            self.stop_timer()
-
-            # Sample process
-            self.update_status(f"Starting sample process for {chemical}, {concentration} ppm, Experiment {experiment_number}...")
-            self.start_timer()
-            sample_process(shared_data, flow_lock, sample_finish_flag, concentration, chemical, experiment_number)
-            self.stop_timer()
-
-            # Final flush process
-            self.update_status("Starting final flush process...")
-            self.start_timer()
-            flush_process(shared_data, flow_lock, flush_finish_flag)
-            self.stop_timer()
-
-            # Terminate the flow control thread
-            shared_data["terminate"] = True
-            self.flow_thread.join()
-
-            # Turn off the pump
-            self.update_status("Turning off pump...")
-            stop_pump(PUMP_CONFIG['pump_bus'])
-
+            with ExperimentSession(shared_data, observers=[self.on_flow_sample]) as session:
+                for experiment_number in range(1, num_experiments + 1):
+                    logger.info("Starting Experiment %s...", experiment_number)
+                    self.run_process_sequence(session, self.chemical, self.concentration, experiment_number)
+                    logger.info("Completed Experiment %s.", experiment_number)
+                self.update_status("Turning off pump...")
             self.update_status("All processes completed. Resetting...")
-
             self.reset_process()
-
         except Exception as e:
             self.update_status(f"Error: {e}")
+
+    def run_process_sequence(self, session, chemical, concentration, experiment_number):
+        """Runs the process sequence and updates the GUI."""
+        try:
+            result = session.run(chemical, concentration, experiment_number,
+                                 on_phase=self.on_phase, on_sweep=self.on_sweep)
+            result["persist_future"].add_done_callback(self.on_sweep_persisted)
         finally:
-            GPIO.cleanup()
+            self.stop_timer()
+
+    def on_phase(self, name, message):
+        """Show each process phase as it starts and restart the timer."""
+        self.stop_timer()
+        self.update_status(message)
+        self.start_timer()
+
+    def on_flow_sample(self, timestamp, target_flow, flow, voltage, valve_mode, phase):
+        """Queue a control sample for the flow plot (runs on the flow-control thread)."""
+        self.bridge.extend("flow", (timestamp, flow, target_flow))
+
+    def on_sweep(self, s_parameters):
+        """Queue the new sweep's |S11| for the spectrum plot (runs on the process thread)."""
+        if "s11_real" not in s_parameters:
+            return
+        s11 = np.asarray(s_parameters["s11_real"]) + 1j * np.asarray(s_parameters["s11_imag"])
+        with np.errstate(divide='ignore'):
+            s11_db = 20 * np.log10(np.abs(s11))
+        self.bridge.post("spectrum", (s_parameters["frequency"], s11_db))
+
+    def on_sweep_persisted(self, future):
+        """Report the result of a sweep saved in the background (runs on the pipeline worker)."""
+        error = future.exception()
+        if error is not None:
+            self.update_status(f"Error saving sweep: {error}")
+        else:
+            logger.info("Sweep stored: %s", future.result())
 
     def update_status(self, message):
-        """Update the process status on the GUI."""
-        self.root.after(0, lambda: self.status_label.config(text=message))
+        """Update the process status on the GUI (safe from any thread)."""
+        self.bridge.post("status", message)
 
     def start_timer(self):
-        """Start the timer and update the GUI every second."""
+        """Start the timer; the label is refreshed by the GUI frame loop."""
         self.start_time = time.time()
         self.is_timer_running = True
-        self.update_timer()
 
     def stop_timer(self):
         """Stop the timer."""
         self.is_timer_running = False
 
     def update_timer(self):
-        """Update the timer label on the GUI."""
+        """Update the timer label on the GUI (called once per frame on the Tk thread)."""
         if self.is_timer_running:
             elapsed_time = int(time.time() - self.start_time)
-            minutes = elapsed_time // 60
-            seconds = elapsed_time % 60
-            self.root.after(0, lambda: self.timer_label.config(text=f"Elapsed Time: {minutes:02}:{seconds:02}"))
-            self.root.after(1000, self.update_timer)
+            if elapsed_time != self.shown_seconds:
+                self.shown_seconds = elapsed_time
+                minutes = elapsed_time // 60
+                seconds = elapsed_time % 60
+                self.timer_label.config(text=f"Elapsed Time: {minutes:02}:{seconds:02}")
 
     def reset_process(self):
         """Resets the process to the initial state."""
-        shared_data["flow"] = None
-        shared_data["voltage"] = PUMP_CONFIG['initial_voltage']
-        shared_data["target_flow"] = PROCESS_CONFIG['flush_rate']
-        shared_data["elapsed_time"] = 0
-        shared_data["valve_mode"] = "flush_flow"
-        shared_data["terminate"] = False
+        shared_data.reset()
 
         self.update_status("Process Status: Waiting...")
-        self.root.after(0, lambda: self.timer_label.config(text="Elapsed Time: 00:00"))
+        self.shown_seconds = None
+        self.bridge.post("timer", "Elapsed Time: 00:00")
+        self.bridge.post("clear", None)  # Drop the previous run's flow trace and spectrum
 
     def on_close(self):
         logger.info("Closing the application...")
         if hasattr(self, 'process_thread') and self.process_thread.is_alive():
             logger.info("Terminating process thread...")
-            shared_data["terminate"] = True
+            shared_data.update(terminate=True)
             self.process_thread.join(timeout=1)
+        # Sweeps still being saved in the background must reach disk before exiting
+        drain_default_pipeline()
         GPIO.cleanup()
+        self.bridge.stop()
         self.root.quit()
         self.root.destroy()
 
@@ -1,6 +1,8 @@
-from smbus2 import SMBus
+from hardware import LazyBus
+from state import FlowCellState
 
 # Pump configuration
+# Buses are LazyBus handles: importing config never opens I2C
 PUMP_CONFIG = {
     'i2c_address': 0x59,
     'register_page_ff': 0xFF,
@@ -9,7 +11,9 @@ PUMP_CONFIG = {
     'max_voltage': 100,
     'initial_voltage': 0,  # Start with the pump off
     'voltage_step': 0.5,
-    'pump_bus': SMBus(7)
+    'settle_time': 0.2,  # Delay after each register page write (seconds)
+    'repeat_delay': 0.1,  # Delay between the two write passes in run_sequence (seconds)
+    'pump_bus': LazyBus(7)
 }
 
 # Flow sensor configuration
@@ -21,7 +25,14 @@ FLOW_CONFIG = {
     'sample_interval': 0.5,  # Interval between samples in seconds
     'kp': 20.0,  # Proportional control constant
     'deadband': 0.1,  # Base deadband value
-    'flow_bus': SMBus(1)  # I2C bus number for the flow sensor
+    'kd': 0.0,  # Derivative gain on the filtered flow rate of change (0 disables)
+    'acquisition_interval': 0.002,  # Burst reader period in seconds (sensor updates at ~2 kHz)
+    'ring_buffer_size': 2**19,  # Samples kept in the flow trace ring buffer (~17 min at 500 Hz)
+    'filter_window': 0.5,  # Seconds of samples used for the filtered flow and rate of change
+    'filter_method': 'median',  # 'median' or 'mean'
+    'trace_dir': 'flow_traces',  # Per-experiment flow traces
+    'log_interval': 5.0,  # Minimum seconds between repeated control-loop log lines
+    'flow_bus': LazyBus(1)  # I2C bus number for the flow sensor
 }
 
 # Process configuration
@@ -32,21 +43,139 @@ PROCESS_CONFIG = {
     'homogenization_time': 1, #60 original      # Time allowed for the system to stabilize before data collection (in seconds)
     'sample_rate': 0.4,               # Target flow rate during the sampling process
     'sample_time': None,              # Time for the sampling process (in seconds), if needed
+    # Phases end once flow has been within flow_tolerance of target for stable_samples
+    # consecutive controller readings (and the phase's min time has passed); the
+    # *_time values above are the maximum duration of each phase
+    'flow_tolerance': None,           # ml/min; None (and anything tighter) means the controller deadband
+    'stable_samples': 5,
+    'flush_min_time': 0,              # Minimum flush time (in seconds)
+    'homogenization_min_time': 0,     # Minimum homogenization time (in seconds)
+    'sample_settle_time': 30,         # Maximum wait for stable sample flow before the sweep (in seconds)
 }
 
-# Shared data for threads
-shared_data = {
-    "flow": None,
-    "voltage": PUMP_CONFIG['initial_voltage'],
-    "target_flow": PROCESS_CONFIG['flush_rate'],
-    "elapsed_time": 0,
-    "valve_mode": "flush_flow",  # Initial valve mode
-    "terminate": False  # Flag to stop the flow control thread
+# Valve configuration
+VALVE_CONFIG = {
+    'pins': (15, 13),  # BOARD pins driving valve 1 and valve 2
 }
+
+def make_flow_cell_state():
+    """Fresh state for one flow cell, with the process's initial values."""
+    return FlowCellState(
+        flow=None,
+        voltage=PUMP_CONFIG['initial_voltage'],
+        target_flow=PROCESS_CONFIG['flush_rate'],
+        flow_rate_of_change=0.0,
+        elapsed_time=0,
+        valve_mode="flush_flow",  # Initial valve mode
+        phase="idle",  # Current process phase, recorded in telemetry
+        terminate=False  # Flag to stop the flow control thread
+    )
+
+# Shared state for threads (see state.FlowCellState); each extra channel gets its own
+shared_data = make_flow_cell_state()
+
+# Measurement channels (see channels.py): one flow cell, pump, flow sensor, valve pair
+# and VNA each. Buses are opened lazily, so unused channels cost nothing.
+CHANNELS = {
+    'cell1': {
+        'vna_host': 'localhost',
+        'vna_port': 19542,
+        'pump_bus': PUMP_CONFIG['pump_bus'],
+        'flow_bus': FLOW_CONFIG['flow_bus'],
+        'valve_pins': VALVE_CONFIG['pins'],
+    },
+    # 'cell2': {'vna_host': 'localhost', 'vna_port': 19543, 'pump_bus': LazyBus(8),
+    #           'flow_bus': LazyBus(0), 'valve_pins': (29, 31)},
+}
+CHANNEL_OUTPUT_DIR = 'channels'  # Per-channel Raw_datalog, flow_traces, processed data and HDF5
+# GUI configuration
+GUI_CONFIG = {
+    'frame_rate': 20,           # GUI refreshes per second; worker updates are coalesced per frame
+    'flow_plot_window': 300,    # Seconds of flow shown in the live plot
+    'max_flow_points': 5000,    # Flow samples kept for the live plot
+}
+
+# Headless daemon configuration (see daemon.py)
+DAEMON_CONFIG = {
+    'host': '127.0.0.1',        # Local-only HTTP API
+    'port': 8765,
+    'unix_socket': None,        # Path to serve on a Unix socket instead of TCP
+    'history': 50,              # Recent results kept for /results
+    'status_interval': 1.0,     # Seconds between status events on /events
+}
+
 VNA_CONFIG = {
     'ifbw': 10000,              # IF Bandwidth in Hz --> 100
     'points': 100,          # Number of points --> 10000
     'start_frequency': 0,     # Start frequency in Hz
-    'stop_frequency': 6e9     # Stop frequency in Hz
+    'stop_frequency': 6e9,    # Stop frequency in Hz
+    # Optional sub-bands swept as one logical sweep, each with its own density and IFBW, e.g.
+    # [{'start_frequency': 0, 'stop_frequency': 1.5e9, 'points': 50, 'ifbw': 10000},
+    #  {'start_frequency': 1.5e9, 'stop_frequency': 2.5e9, 'points': 400, 'ifbw': 1000}, ...]
+    'segments': None,
+    'averages': 1,              # Sweeps averaged per band (Welford mean/variance); K fast sweeps vs one at IFBW/K
+}
+
+# Adaptive sweeps: coarse pass, then dense windows around the |S11| minima (see refinement.py)
+REFINEMENT_CONFIG = {
+    'enabled': False,           # Sample (and blank) sweeps use acquire_adaptive_sweep instead of one fixed sweep
+    'coarse_points': 201,       # Whole-band detection sweep
+    'coarse_ifbw': 10000,
+    'max_resonances': 3,        # Deepest minima refined per sweep
+    'min_depth_db': 3,          # A minimum must be this far below the median |S11| to count
+    'window': 100e6,            # Width in Hz of the dense band around each resonance
+    'dense_points': 201,
+    'dense_ifbw': 1000,
+    'cache_file': 'resonances.json',  # Last resonances per chemical; cached chemicals skip the coarse pass
+}
+
+
+# SOLT calibration applied in software before feature engineering (see calibration.py)
+CALIBRATION_CONFIG = {
+    'dir': 'calibration',       # Error terms per frequency grid (<grid key>.npz) and measured standards
+    'apply': True,              # Correct sweeps whose grid a stored calibration covers
+}
+
+# Rolling blank-solvent baseline captured during flushes (see baseline.py)
+BASELINE_CONFIG = {
+    'dir': 'baselines',         # One <grid key>.npz per frequency grid
+    'alpha': 0.2,               # Weight of each new blank sweep in the moving baseline
+    'capture_on_flush': True,   # Sweep the blank cell at the end of each experiment's first flush
+}
+
+# Concentration inference over processed sweeps (see inference.py)
+INFERENCE_CONFIG = {
+    'model_dir': 'models',      # One <chemical>.npz per trained model
+    'features': ['Permittivity_Corrected', 'Conductivity_Corrected', 'S21_Mag'],
+    'feature_points': 64,       # Each feature is resampled onto this many frequencies
+    'ridge_lambda': 1.0,
+    'predict_inline': True,     # Predict every sweep in ProcessingManager.process_and_save
+    'online_update': True,      # Fold every stored labelled sweep into its chemical's model
+    'snapshot_every': 50,       # Online updates between automatic model snapshots (0: never)
+    'snapshots_kept': 10,
 }
 
+# Spectral similarity index over processed sweeps (see similarity.py)
+SIMILARITY_CONFIG = {
+    'dir': 'similarity_index',  # vectors.f32 + meta.jsonl, plus pca.npz / ivf.npy once built
+    'enabled': True,            # Index every processed sweep and record its best match
+    'points': 128,              # Complex S11 is resampled onto this many frequencies
+    'ivf_probes': 4,            # Lists searched per query once an approximate index is built
+}
+
+# Per-sweep quality checks (see quality.py)
+QC_CONFIG = {
+    'snr_floor_db': 10,         # S11 SNR scoring zero ...
+    'snr_good_db': 40,          # ... and scoring one
+    'jump_factor': 8,           # Step in S11 larger than this many median steps counts as a discontinuity
+    's21_floor': 1e-4,          # |S21| below this (-80 dB) is taken as the noise floor
+    'flow_cv_limit': 0.05,      # Flow std/mean during the sweep above this lowers the score
+    'min_score': 0.5,           # Sweeps below this are logged as suspect and skipped by good_sweeps()
+}
+
+# Hot-path timing spans and counters (see instrumentation.py)
+INSTRUMENTATION_CONFIG = {
+    'enabled': True,            # Off: spans and counters are no-ops
+    'metrics_host': '127.0.0.1',
+    'metrics_port': None,       # Serve Prometheus text on GET /metrics from the GUI (the daemon always has /metrics)
+}
@@ -0,0 +1,326 @@
+import sys
+import json
+import time
+import queue
+import signal
+import asyncio
+import argparse
+import threading
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+from experiment import ExperimentSession, ExperimentAborted
+from recipe import parse_recipe
+from sweep_pipeline import drain_default_pipeline
+from instrumentation import prometheus_text
+from config import DAEMON_CONFIG, shared_data
+from logger import setup_logger
+import logging
+
+logger = setup_logger(__name__, level=logging.INFO)
+
+HTTP_STATUS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               500: "Internal Server Error"}
+
+
+class ExperimentDaemon:
+    """
+    Runs queued experiments without the GUI and reports on them over a local HTTP API.
+
+    Experiments run one at a time on a worker thread that keeps a single
+    ExperimentSession open (the pump is paused while the queue is empty). The asyncio
+    side only serves requests and fans events out to subscribers, so slow or many
+    clients never hold up an experiment.
+
+    Endpoints:
+      GET  /status           current phase, flow and queue
+      GET  /results?limit=N  most recent finished experiments
+      GET  /events           Server-Sent Events stream of phase, result and status events
+      GET  /metrics          timing spans and counters in the Prometheus text format
+      POST /runs             queue runs (a recipe document, a list of runs or one run)
+      POST /stop             clear the queue and abort the running experiment
+    """
+
+    def __init__(self, state=shared_data, history=DAEMON_CONFIG['history'],
+                 status_interval=DAEMON_CONFIG['status_interval'], session_factory=ExperimentSession):
+        self.state = state
+        self.status_interval = status_interval
+        self.session_factory = session_factory
+        self.results = deque(maxlen=history)
+        self.current = None
+        self.completed = 0
+        self._jobs = queue.Queue()
+        self._next_job_id = 1
+        self._stops = 0         # Stop requests so far; a job queued before the latest one never starts
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._streams = set()
+        self._loop = None
+        self._worker = None
+
+    # Worker thread
+
+    def submit(self, document):
+        """Queue every experiment of a recipe document; returns the new job ids."""
+        if isinstance(document, dict) and "runs" not in document:
+            document = [document]
+        jobs = []
+        with self._lock:
+            for run in parse_recipe(document):
+                first = int(run.get("first_experiment", 1))
+                for experiment_number in range(first, first + run["repeats"]):
+                    job = {"id": self._next_job_id, "chemical": run["chemical"],
+                           "concentration": run["concentration"], "experiment_number": experiment_number,
+                           "phases": run["phases"], "stops": self._stops}
+                    self._next_job_id += 1
+                    self._jobs.put(job)
+                    jobs.append(job["id"])
+        self.emit({"event": "queued", "jobs": jobs})
+        return jobs
+
+    def stop_runs(self):
+        """Drop every queued experiment and abort the one running."""
+        dropped = []
+        with self._lock:
+            self._stops += 1  # Also covers a job the worker has dequeued but not yet started
+            while True:
+                try:
+                    job = self._jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    self._jobs.put(None)  # Keep the shutdown request
+                    break
+                dropped.append(job["id"])
+            if self.current is not None:
+                self.state.update(terminate=True)
+        self.emit({"event": "stopped", "dropped": dropped})
+        return dropped
+
+    def _work(self):
+        session = self.session_factory(self.state)
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    break
+                self._run_job(session, job)
+                if self._jobs.empty():
+                    session.pause()
+        finally:
+            session.close()
+
+    def _run_job(self, session, job):
+        with self._lock:
+            stopped = job["stops"] != self._stops
+            if not stopped:
+                self.current = {**job, "started": time.time(), "phase": None}
+        if stopped:
+            logger.info("Experiment %d was stopped before it started.", job["id"])
+            self.emit({"event": "stopped", "dropped": [job["id"]]})
+            return
+        self.emit({"event": "started", "job": job["id"]})
+
+        def on_phase(name, message):
+            self.current["phase"] = name
+            self.emit({"event": "phase", "job": job["id"], "phase": name, "message": message})
+
+        result = {"job": job["id"], "chemical": job["chemical"], "concentration": job["concentration"],
+                  "experiment_number": job["experiment_number"], "started": self.current["started"]}
+        try:
+            outcome = session.run(job["chemical"], job["concentration"], job["experiment_number"],
+                                  phase_config=job["phases"], on_phase=on_phase)
+            result.update(status="completed", raw_data_filename=outcome["raw_data_filename"],
+                          phases=outcome["phases"], stored=None)
+            outcome["persist_future"].add_done_callback(lambda future: self._on_stored(result, future))
+            self.completed += 1
+        except ExperimentAborted:
+            result["status"] = "aborted"
+        except Exception as e:
+            logger.error("Experiment %d failed: %s", job["id"], e)
+            result.update(status="failed", error=str(e))
+        finally:
+            # A stop request only applies to the experiment it interrupted
+            with self._lock:
+                self.state.update(terminate=False)
+                self.current = None
+
+        result["finished"] = time.time()
+        self.results.append(result)
+        self.emit({"event": "result", **result})
+
+    def _on_stored(self, result, future):
+        error = future.exception()
+        result["stored"] = error is None
+        if error is not None:
+            result["error"] = str(error)
+        self.emit({"event": "stored", "job": result["job"], "stored": result["stored"]})
+
+    def status(self):
+        state = self.state.snapshot()
+        current = self.current
+        return {
+            "state": "running" if current is not None else "idle",
+            "job": current and {key: current[key] for key in ("id", "chemical", "concentration", "experiment_number", "phase")},
+            "queued": self._jobs.qsize(),
+            "completed": self.completed,
+            "phase": state.phase,
+            "valve_mode": state.valve_mode,
+            "flow": state.flow,
+            "target_flow": state.target_flow,
+            "voltage": state.voltage,
+            "time": time.time(),
+        }
+
+    # Event fan-out (asyncio side)
+
+    def emit(self, event):
+        """Send an event to every subscriber; safe to call from any thread."""
+        if self._loop is not None and self._subscribers:
+            self._loop.call_soon_threadsafe(self._broadcast, event)
+
+    def _broadcast(self, event):
+        message = f"data: {json.dumps(event, default=str)}\n\n".encode()
+        for subscriber in self._subscribers:
+            if subscriber.full():
+                subscriber.get_nowait()  # Slow client: drop its oldest event
+            subscriber.put_nowait(message)
+
+    async def _status_ticker(self):
+        while True:
+            await asyncio.sleep(self.status_interval)
+            if self._subscribers:
+                self._broadcast({"event": "status", **self.status()})
+
+    # HTTP
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+        except (ValueError, asyncio.IncompleteReadError):
+            writer.close()
+            return
+
+        url = urlsplit(target)
+        try:
+            if url.path == "/events" and method == "GET":
+                await self._stream_events(writer)
+                return
+            try:
+                status, payload = self._route(method, url.path, parse_qs(url.query), body)
+            except (ValueError, TypeError, KeyError, AttributeError) as e:
+                # Malformed documents surface as any of these from json/parse_recipe
+                status, payload = 400, {"error": str(e)}
+            except Exception as e:
+                logger.error("Request %s %s failed: %s", method, url.path, e)
+                logger.debug("Exception details:", exc_info=True)
+                status, payload = 500, {"error": "Internal error"}
+            await self._respond(writer, status, payload)
+        finally:
+            writer.close()
+
+    def recent_results(self, limit):
+        """The last ``limit`` finished experiments (none for 0)."""
+        results = list(self.results)
+        limit = min(max(int(limit), 0), len(results))
+        return results[len(results) - limit:]
+
+    def _route(self, method, path, query, body):
+        routes = {
+            ("GET", "/status"): lambda: (200, self.status()),
+            ("GET", "/results"): lambda: (200, self.recent_results(query.get("limit", ["10"])[0])),
+            ("GET", "/metrics"): lambda: (200, prometheus_text()),
+            ("POST", "/runs"): lambda: (202, {"jobs": self.submit(json.loads(body or b"null"))}),
+            ("POST", "/stop"): lambda: (200, {"dropped": self.stop_runs()}),
+        }
+        if (method, path) in routes:
+            return routes[(method, path)]()
+        if any(route_path == path for _, route_path in routes):
+            return 405, {"error": f"{method} not allowed on {path}"}
+        return 404, {"error": f"No such endpoint: {path}"}
+
+    async def _respond(self, writer, status, payload):
+        # Text payloads (/metrics) are sent as they are; everything else is JSON
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload, default=str).encode(), "application/json"
+        writer.write(
+            f"HTTP/1.1 {status} {HTTP_STATUS[status]}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _stream_events(self, writer):
+        subscriber = asyncio.Queue(maxsize=100)
+        self._subscribers.add(subscriber)
+        self._streams.add(asyncio.current_task())
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                     b"Connection: close\r\n\r\n")
+        self._broadcast({"event": "status", **self.status()})
+        try:
+            while True:
+                writer.write(await subscriber.get())
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._subscribers.discard(subscriber)
+            self._streams.discard(asyncio.current_task())
+            writer.close()
+
+    async def serve(self, host=DAEMON_CONFIG['host'], port=DAEMON_CONFIG['port'], unix_socket=DAEMON_CONFIG['unix_socket']):
+        """Serve the API until SIGINT/SIGTERM, then finish the running experiment's cleanup."""
+        self._loop = asyncio.get_running_loop()
+        self._worker = threading.Thread(target=self._work, name="experiment-worker", daemon=True)
+        self._worker.start()
+
+        if unix_socket:
+            server = await asyncio.start_unix_server(self._handle, path=unix_socket)
+            logger.info("Daemon listening on unix:%s", unix_socket)
+        else:
+            server = await asyncio.start_server(self._handle, host, port)
+            logger.info("Daemon listening on http://%s:%d", host, port)
+
+        stopping = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self._loop.add_signal_handler(signum, stopping.set)
+        ticker = asyncio.create_task(self._status_ticker())
+        async with server:
+            await stopping.wait()
+            # Open event streams would otherwise keep the server from closing
+            for stream in list(self._streams):
+                stream.cancel()
+
+        logger.info("Shutting down daemon...")
+        ticker.cancel()
+        self.stop_runs()
+        self._jobs.put(None)
+        await self._loop.run_in_executor(None, self._worker.join)
+        await self._loop.run_in_executor(None, drain_default_pipeline)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run experiments headless behind a local HTTP API.")
+    parser.add_argument("--host", default=DAEMON_CONFIG['host'])
+    parser.add_argument("--port", type=int, default=DAEMON_CONFIG['port'])
+    parser.add_argument("--unix-socket", default=DAEMON_CONFIG['unix_socket'], help="serve on a Unix socket instead of TCP")
+    args = parser.parse_args(argv)
+
+    asyncio.run(ExperimentDaemon().serve(args.host, args.port, args.unix_socket))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
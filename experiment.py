@@ -0,0 +1,163 @@
+import os
+import time
+from config import PUMP_CONFIG, FLOW_CONFIG, BASELINE_CONFIG
+from flow_acquisition import FlowAcquisition
+from flow_control import FlowControlService
+from process import flush_process, homogenization_process, sample_process, flush_finish_flag, homogenization_finish_flag, sample_finish_flag
+from telemetry import TelemetryRecorder, telemetry_path_for
+from instrumentation import snapshot, write_timing_when_done
+from vna import raw_datalog_path
+from hardware import gpio as GPIO
+from logger import setup_logger, channel_thread_name
+import logging
+
+logger = setup_logger(__name__, level=logging.INFO)
+
+
+class ExperimentAborted(Exception):
+    """Raised by ExperimentSession.run when the state's terminate flag stops an experiment."""
+
+
+class ExperimentSession:
+    """
+    Keeps the flow sensor and one FlowControlService running across many experiments.
+
+    The sensor is started and warmed up once per session rather than once per
+    experiment; each ``run`` then only retargets the running controller through the
+    process phases and swaps the telemetry recorder.
+    """
+
+    def __init__(self, shared_data, pump_bus=None, flow_bus=None, observers=(), valve_pins=None,
+                 vna_endpoint=None, pipeline=None, output_dir=None, channel=None):
+        """
+        The defaults drive the single local cell. For one channel of several, pass its
+        buses, valve pins, VNA (host, port), sweep pipeline, an ``output_dir`` under which
+        Raw_datalog and flow_traces are kept, and a ``channel`` name for thread names and
+        its log file.
+        """
+        self.shared_data = shared_data
+        self.channel = channel
+        self.pump_bus = pump_bus or PUMP_CONFIG['pump_bus']
+        self.flow_bus = flow_bus or FLOW_CONFIG['flow_bus']
+        self.valve_pins = valve_pins
+        self.vna_endpoint = vna_endpoint
+        self.pipeline = pipeline
+        self.raw_dir = os.path.join(output_dir, "Raw_datalog") if output_dir else "Raw_datalog"
+        self.trace_dir = os.path.join(output_dir, FLOW_CONFIG['trace_dir']) if output_dir else FLOW_CONFIG['trace_dir']
+        self.acquisition = FlowAcquisition(self.flow_bus, name=channel_thread_name(channel, "flow-acquisition"))
+        # Callables given every control sample (same arguments as TelemetryRecorder.record)
+        self.observers = list(observers)
+        self._recorder = None
+        # The session is the controller's recorder so each experiment can swap files
+        self.controller = FlowControlService(
+            self.pump_bus, self.flow_bus, shared_data, self.acquisition, recorder=self,
+            valve_pins=valve_pins, name=channel_thread_name(channel, "flow-control")
+        )
+
+    def start(self):
+        if self.controller.alive:
+            if self.controller.status == "paused":
+                self.controller.start()
+            return
+        self.shared_data.reset()
+        if not self.acquisition.start():
+            raise RuntimeError("Flow sensor did not start")
+        self.controller.start()
+        logger.info("Experiment session started.")
+
+    def record(self, *sample):
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.record(*sample)
+        for observer in self.observers:
+            observer(*sample)
+
+    def run(self, chemical, concentration, experiment_number, phase_config=None, on_phase=None, on_sweep=None):
+        """
+        Run flush, homogenization, sample and final flush for one experiment.
+
+        ``phase_config`` overrides PROCESS_CONFIG entries (rates and timings) for this run.
+        ``on_phase(name, message)`` is called as each phase starts and ``on_sweep(s_parameters)``
+        as soon as the sweep is in memory. Returns a dict with the raw sweep file, the
+        sweep's persistence future and the per-phase results. Raises ExperimentAborted if
+        the terminate flag is set before the experiment completes.
+        """
+        self.start()
+        notify = on_phase or (lambda name, message: None)
+
+        # Every per-experiment artefact shares the raw sweep's file stem
+        raw_data_filename = raw_datalog_path(chemical, concentration, experiment_number, base_dir=self.raw_dir)
+        stem = os.path.splitext(os.path.basename(raw_data_filename))[0]
+        trace_path = os.path.join(self.trace_dir, f"{stem}_flow.npz")
+        timing_path = os.path.join(self.trace_dir, f"{stem}_timing.json")
+        started_at = time.monotonic()  # Same clock as the flow samples
+        timing_before = snapshot()
+
+        # Swap the recorder rather than restarting the controller
+        self._recorder = TelemetryRecorder(
+            telemetry_path_for(raw_data_filename), raw_data_filename=raw_data_filename,
+            metadata={"chemical": chemical, "concentration": concentration, "experiment_number": experiment_number}
+        )
+        controller = self.controller
+        phases = []
+        persist_future = None
+        try:
+            notify("flush", "Starting flush process...")
+            phases.append(flush_process(
+                self.shared_data, flush_finish_flag, phase_config, controller,
+                capture_baseline=BASELINE_CONFIG['capture_on_flush'], pipeline=self.pipeline, vna_endpoint=self.vna_endpoint,
+                chemical=chemical
+            ))
+            self._check_aborted(experiment_number)
+
+            notify("homogenization", "Starting homogenization process...")
+            phases.append(homogenization_process(self.shared_data, homogenization_finish_flag, phase_config, controller))
+            self._check_aborted(experiment_number)
+
+            notify("sample", f"Starting sample process for {chemical}, {concentration} ppm, Experiment {experiment_number}...")
+            persist_future = sample_process(
+                self.shared_data, sample_finish_flag, concentration, chemical, experiment_number,
+                raw_data_filename, phase_config, controller, on_sweep,
+                pipeline=self.pipeline, vna_endpoint=self.vna_endpoint, flow=self.acquisition
+            )
+            self._check_aborted(experiment_number)
+
+            notify("final_flush", "Starting final flush process...")
+            phases.append(flush_process(self.shared_data, flush_finish_flag, phase_config, controller))
+        finally:
+            recorder, self._recorder = self._recorder, None
+            recorder.close()
+            self.acquisition.save_trace(trace_path, since=started_at)
+            # Written once the sweep is processed, so the breakdown includes preprocessing and storage
+            write_timing_when_done(timing_path, timing_before, persist_future, metadata={
+                "chemical": chemical, "concentration": concentration, "experiment_number": experiment_number,
+                "wall_seconds": time.monotonic() - started_at,
+            })
+
+        return {"raw_data_filename": raw_data_filename, "persist_future": persist_future, "phases": phases}
+
+    def pause(self):
+        """Turn the pump off between batches; the sensor and controller stay up for the next run."""
+        if self.controller.alive:
+            self.controller.pause()
+
+    def _check_aborted(self, experiment_number):
+        if self.shared_data.terminate:
+            raise ExperimentAborted(f"Experiment {experiment_number} aborted")
+
+    def close(self):
+        """Stop the controller (which turns the pump off) and stop the sensor."""
+        self.controller.stop()
+        self.acquisition.stop()
+        # GPIO is shared between channels; the channel runner releases it once all are done
+        if self.channel is None:
+            GPIO.cleanup()
+        self.shared_data.reset()
+        logger.info("Experiment session closed.")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -123,6 +123,6 @@ class FeatureEngineering:
 
             logger.info("Effective dielectric constant calculated.")
         except Exception as e:
-            logger.error(f"Error calculating effective dielectric constant: {e}")
+            logger.error("Error calculating effective dielectric constant: %s", e)
             logger.debug("Exception details:", exc_info=True)
             raise
\ No newline at end of file
@@ -1,20 +1,57 @@
 import time
-from smbus2 import SMBus, i2c_msg
+import struct
 from config import FLOW_CONFIG
-from logger import setup_logger
+from logger import setup_logger, setup_hot_path_logger
 import logging
 
 logger = setup_logger(__name__, level=logging.INFO)
+hot_logger = setup_hot_path_logger(__name__, interval=FLOW_CONFIG['log_interval'])
 
 I2C_SLF3S_ADDRESS = FLOW_CONFIG['i2c_address']
 SCALE_FACTOR_FLOW = FLOW_CONFIG['scale_factor_flow']
 
+# One measurement word: signed 16-bit big-endian flow followed by its CRC byte
+FLOW_FRAME = struct.Struct(">hB")
+
+
+def _build_crc8_table(polynomial=0x31):
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ polynomial) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return bytes(table)
+
+_CRC8_TABLE = _build_crc8_table()
+
+def sensirion_crc8(data):
+    """CRC-8 used by Sensirion sensors (polynomial 0x31, init 0xFF)."""
+    crc = 0xFF
+    for byte in data:
+        crc = _CRC8_TABLE[crc ^ byte]
+    return crc
+
+def decode_flow_frame(frame):
+    """Decode a 3-byte flow frame, returning ml/min or None if the CRC does not match."""
+    raw_flow, crc = FLOW_FRAME.unpack_from(frame)
+    if _CRC8_TABLE[_CRC8_TABLE[0xFF ^ frame[0]] ^ frame[1]] != crc:
+        return None
+    return raw_flow / SCALE_FACTOR_FLOW
+
+def read_flow_frame(bus):
+    """Read one raw flow frame (flow MSB, flow LSB, CRC) from the sensor."""
+    from smbus2 import i2c_msg  # Deferred so importing this module never requires smbus2
+    msg = i2c_msg.read(I2C_SLF3S_ADDRESS, FLOW_FRAME.size)
+    bus.i2c_rdwr(msg)
+    return bytes(msg)
+
 def start_flow_measurement(bus):
     logger.info("Starting continuous measurement...")
     try:
         bus.write_i2c_block_data(I2C_SLF3S_ADDRESS, 0x36, [FLOW_CONFIG['calibration_cmd_byte']], force=True)
     except OSError as e:
-        logger.error(f"Error starting continuous measurement: {e}")
+        logger.error("Error starting continuous measurement: %s", e)
         return False
     return True
 
@@ -23,33 +60,26 @@ def stop_flow_measurement(bus):
     try:
         bus.write_i2c_block_data(I2C_SLF3S_ADDRESS, 0x3F, [0xF9], force=True)
     except OSError as e:
-        logger.error(f"Error stopping continuous measurement: {e}")
+        logger.error("Error stopping continuous measurement: %s", e)
 
 def read_flow(bus):
     try:
-        # Request 3 bytes of data from the sensor
-        msg = i2c_msg.read(I2C_SLF3S_ADDRESS, 3)
-        bus.i2c_rdwr(msg)
+        # Request the flow word and its CRC from the sensor
+        frame = read_flow_frame(bus)
     except OSError as e:
-        logger.error(f"Error reading from sensor: {e}")
+        logger.error("Error reading from sensor: %s", e)
         return None
-    
-    # Convert the I2C message to a list of bytes
-    data = list(msg)
-    logger.debug(f"Raw sensor data: {data}")
 
-    # Combine the first two bytes to create a 16-bit integer
-    sensor_flow_value = (data[0] << 8) | data[1]
+    hot_logger.debug("Raw sensor data: %s", list(frame))
 
-    # Convert to a signed integer
-    signed_flow_value = int.from_bytes(sensor_flow_value.to_bytes(2, byteorder='big'), byteorder='big', signed=True)
+    # Decode the signed 16-bit value and scale it, rejecting corrupted frames
+    scaled_flow_value = decode_flow_frame(frame)
+    if scaled_flow_value is None:
+        logger.warning("CRC mismatch in flow frame: %s", list(frame))
 
-    # Scale the flow value using the sensor's scale factor
-    scaled_flow_value = float(signed_flow_value) / SCALE_FACTOR_FLOW
-    
     return scaled_flow_value
 
-def monitor_flow_sensor(bus, shared_data, flow_lock):
+def monitor_flow_sensor(bus, shared_data):
     with bus:
         time.sleep(1)
         if start_flow_measurement(bus):
@@ -60,11 +90,10 @@ def monitor_flow_sensor(bus, shared_data, flow_lock):
                     if flow_value is None:
                         flow_value = 0.0  # Default to 0 if reading fails
 
-                    with flow_lock:
-                        shared_data["flow"] = flow_value
+                    shared_data.update(flow=flow_value)
 
                     # Commented out the logging of flow values to prevent extra logging
-                    # logger.info(f"Flow Value: {flow_value:.3f} ml/min")
+                    # logger.info("Flow Value: %.3f ml/min", flow_value)
 
                     time.sleep(FLOW_CONFIG['sample_interval'])
             except KeyboardInterrupt:
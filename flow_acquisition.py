@@ -0,0 +1,201 @@
+import os
+import time
+import threading
+import numpy as np
+from config import FLOW_CONFIG
+from flow import read_flow_frame, decode_flow_frame, start_flow_measurement, stop_flow_measurement
+from logger import setup_logger
+import logging
+
+logger = setup_logger(__name__, level=logging.INFO)
+
+
+class FlowRingBuffer:
+    """
+    Fixed-size ring buffer of (timestamp, flow) samples backed by NumPy arrays.
+
+    ``window`` and ``since`` binary-search the timestamps, so they must never go
+    backwards: stamp samples with ``time.monotonic()``, not the wall clock.
+    """
+
+    def __init__(self, capacity=FLOW_CONFIG['ring_buffer_size']):
+        self.capacity = int(capacity)
+        self._times = np.zeros(self.capacity, dtype=np.float64)
+        self._values = np.zeros(self.capacity, dtype=np.float32)
+        self._count = 0  # Total samples ever appended
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    @property
+    def total_samples(self):
+        return self._count
+
+    def append(self, timestamp, value):
+        with self._lock:
+            index = self._count % self.capacity
+            self._times[index] = timestamp
+            self._values[index] = value
+            self._count += 1
+
+    def clear(self):
+        with self._lock:
+            self._count = 0
+
+    def latest(self, n=None):
+        """Return copies of the last ``n`` samples (all retained samples if None), oldest first."""
+        with self._lock:
+            size = min(self._count, self.capacity)
+            n = size if n is None else min(int(n), size)
+            if n == 0:
+                return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float32)
+            end = self._count % self.capacity
+            start = end - n
+            if start >= 0:
+                return self._times[start:end].copy(), self._values[start:end].copy()
+            # Window wraps around the end of the arrays
+            return (np.concatenate((self._times[start:], self._times[:end])),
+                    np.concatenate((self._values[start:], self._values[:end])))
+
+    def window(self, seconds, max_samples=None):
+        """Return the samples recorded within ``seconds`` of the newest sample."""
+        times, values = self.latest(max_samples)
+        if times.size == 0:
+            return times, values
+        first = np.searchsorted(times, times[-1] - seconds, side='left')
+        return times[first:], values[first:]
+
+    def since(self, timestamp):
+        """Return all retained samples taken at or after ``timestamp``."""
+        times, values = self.latest()
+        first = np.searchsorted(times, timestamp, side='left')
+        return times[first:], values[first:]
+
+
+class FlowAcquisition:
+    """Reads the SLF3S flow sensor at its native rate on a dedicated thread."""
+
+    def __init__(self, bus, capacity=FLOW_CONFIG['ring_buffer_size'], interval=FLOW_CONFIG['acquisition_interval'],
+                 name="flow-acquisition"):
+        self.bus = bus
+        self.name = name
+        self.interval = interval
+        self.buffer = FlowRingBuffer(capacity)
+        self.crc_errors = 0
+        self.read_errors = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start continuous measurement on the sensor and the reader thread."""
+        if self.running:
+            return True
+        if not start_flow_measurement(self.bus):
+            logger.error("Failed to start flow measurement. Acquisition not started.")
+            return False
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        logger.info("Flow acquisition started at %.0f Hz.", 1 / self.interval)
+        return True
+
+    def stop(self):
+        """Stop the reader thread and the sensor's continuous measurement."""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        stop_flow_measurement(self.bus)
+        logger.info("Flow acquisition stopped after %d samples (%d CRC errors, %d read errors).",
+                    self.buffer.total_samples, self.crc_errors, self.read_errors)
+
+    def _run(self):
+        # Local bindings keep the per-sample loop tight
+        bus = self.bus
+        append = self.buffer.append
+        stop_event = self._stop_event
+        interval = self.interval
+        clock = time.monotonic  # A wall-clock step (NTP, DST) would unsort the buffer
+        next_read = time.monotonic()
+
+        while not stop_event.is_set():
+            try:
+                frame = read_flow_frame(bus)
+            except OSError as e:
+                self.read_errors += 1
+                logger.debug("Flow read failed: %s", e)
+            else:
+                value = decode_flow_frame(frame)
+                if value is None:
+                    self.crc_errors += 1
+                else:
+                    append(clock(), value)
+
+            # Fixed-rate schedule; if we fall behind, resynchronise instead of bursting
+            next_read += interval
+            delay = next_read - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_read = time.monotonic()
+
+    def latest_flow(self):
+        """Return the most recent raw flow sample, or None if nothing has been read yet."""
+        _, values = self.buffer.latest(1)
+        return float(values[0]) if values.size else None
+
+    def _window(self, window):
+        window = FLOW_CONFIG['filter_window'] if window is None else window
+        max_samples = int(window / self.interval) * 2 + 1
+        return self.buffer.window(window, max_samples)
+
+    def filtered_flow(self, window=None, method=FLOW_CONFIG['filter_method']):
+        """Moving median or mean of the flow over the last ``window`` seconds."""
+        _, values = self._window(window)
+        if values.size == 0:
+            return None
+        if method == 'median':
+            return float(np.median(values))
+        if method == 'mean':
+            return float(values.mean())
+        raise ValueError(f"Unknown filter method: {method}")
+
+    def rate_of_change(self, window=None):
+        """Least-squares slope of the flow over the last ``window`` seconds in ml/min per second."""
+        times, values = self._window(window)
+        if times.size < 2:
+            return 0.0
+        t = times - times.mean()
+        denominator = np.dot(t, t)
+        if denominator == 0:
+            return 0.0
+        return float(np.dot(t, values - values.mean()) / denominator)
+
+    def window_stats(self, since):
+        """Mean, standard deviation and number of the flow samples taken since ``since`` (``time.monotonic()``)."""
+        _, values = self.buffer.since(since)
+        if values.size == 0:
+            return {"mean": None, "std": None, "samples": 0}
+        return {"mean": float(values.mean()), "std": float(values.std()), "samples": int(values.size)}
+
+    def trace(self):
+        """Return the full retained flow trace as (``time.monotonic()`` timestamps, flow) arrays."""
+        return self.buffer.latest()
+
+    def save_trace(self, path, since=None):
+        """
+        Write the retained flow trace (from ``since``, a ``time.monotonic()`` value, onwards if
+        given) to a compressed ``.npz`` file, with the timestamps converted to epoch seconds.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        times, values = self.trace() if since is None else self.buffer.since(since)
+        np.savez_compressed(path, time=times + (time.time() - time.monotonic()), flow=values,
+                            crc_errors=self.crc_errors, read_errors=self.read_errors)
+        logger.info("Flow trace with %s samples saved to %s.", times.size, path)
+        return path
@@ -1,74 +1,240 @@
 import time
+import queue
+import threading
 import logging
-from logger import setup_logger
-from config import PUMP_CONFIG, FLOW_CONFIG, PROCESS_CONFIG, shared_data
-from pump import run_sequence
+from logger import setup_logger, setup_hot_path_logger
+from config import PUMP_CONFIG, FLOW_CONFIG
+from pump import run_sequence, stop_pump
 from valve import control_valve_mode
 from flow import read_flow, start_flow_measurement, stop_flow_measurement
-from smbus2 import SMBus
-import threading  # Include threading for the lock
+from instrumentation import timed, span
 
 logger = setup_logger(__name__, level=logging.INFO)
+# Per-iteration messages; the telemetry recorder keeps the full-rate record
+hot_logger = setup_hot_path_logger(__name__, interval=FLOW_CONFIG['log_interval'])
 
-# Define the lock here
-flow_lock = threading.Lock()
+def flow_control_thread(pump_bus, flow_bus, shared_data, acquisition=None, recorder=None):
+    """Thread to monitor flow rate, adjust pump voltage, and control valve mode.
 
-def flow_control_thread(pump_bus, flow_bus, shared_data):
-    """Thread to monitor flow rate, adjust pump voltage, and control valve mode."""
+    If ``acquisition`` (a running FlowAcquisition) is given, control decisions use its
+    filtered flow and rate of change instead of a single direct sensor read. If
+    ``recorder`` (a TelemetryRecorder) is given, every control iteration is recorded.
+    """
     logger.debug("Flow control thread initialized.")
-    
-    if not start_flow_measurement(flow_bus):
-        logger.error("Failed to start flow measurement. Exiting.")
+
+    if acquisition is None:
+        if not start_flow_measurement(flow_bus):
+            logger.error("Failed to start flow measurement. Exiting.")
+            return
+    elif not acquisition.running:
+        logger.error("Flow acquisition is not running. Exiting.")
         return
 
     logger.info("Flow measurement started successfully.")
 
     while True:
         # Check if we should terminate
-        if shared_data.get("terminate", False):
+        if shared_data.terminate:
             logger.info("Terminating flow control thread.")
             break
 
-        # Monitor the flow rate using flow_bus
-        logger.debug("Reading flow...")
-        flow = read_flow(flow_bus)
-        if flow is not None:
-            with flow_lock:
-                shared_data["flow"] = flow
-        else:
+        if not control_step(pump_bus, flow_bus, shared_data, acquisition, recorder):
             logger.warning("Failed to read flow measurement.")
-            time.sleep(FLOW_CONFIG['sample_interval'])
-            continue
-
-        with flow_lock:
-            current_flow = shared_data.get("flow", None)
-            current_voltage = shared_data.get("voltage", PUMP_CONFIG['initial_voltage'])
-            valve_mode = shared_data.get("valve_mode", "flush_flow")
-        
-        logger.debug(f"Current flow: {current_flow}, Current voltage: {current_voltage}")
-
-        if current_flow is not None:
-            target_flow = shared_data.get("target_flow", PROCESS_CONFIG['flush_rate'])
-            error = target_flow - current_flow
-            deadband = calculate_deadband(FLOW_CONFIG['kp'])
-
-            if abs(error) > deadband:
-                kp = FLOW_CONFIG['kp']
-                voltage_adjustment = kp * error
-                new_voltage = current_voltage + voltage_adjustment
-                new_voltage = max(PUMP_CONFIG['min_voltage'], min(PUMP_CONFIG['max_voltage'], new_voltage))
-
-                with flow_lock:
-                    shared_data["voltage"] = new_voltage
-            else:
-                voltage_adjustment = 0.0
-                new_voltage = current_voltage
-
-            control_valve_mode(valve_mode)
-            logger.info(f"Valve Mode: {valve_mode}, Target Flow Rate: {target_flow:.3f} ml/min, Flow Rate: {current_flow:.3f} ml/min, Voltage: {new_voltage:.1f} V, Adjustment: {voltage_adjustment:.1f} V")
-            run_sequence(pump_bus, new_voltage)
-        
-        time.sleep(FLOW_CONFIG['sample_interval'])
+
+        # Sleep for one sample interval, but wake immediately on a new target, valve mode or stop request
+        commanded = (shared_data.target_flow, shared_data.valve_mode, shared_data.terminate)
+        shared_data.wait_for(
+            lambda state: (state.target_flow, state.valve_mode, state.terminate) != commanded,
+            timeout=FLOW_CONFIG['sample_interval']
+        )
+
+class FlowControlService:
+    """
+    Long-lived flow controller driven by commands instead of shared flags.
+
+    One thread serves a whole batch of experiments: ``start`` begins (or resumes)
+    closed-loop control, ``pause`` turns the pump off but keeps the thread and sensor
+    alive, ``retarget`` changes the target flow, valve mode and phase and runs a control
+    step straight away, and ``stop`` ends the thread. Commands are applied in order by
+    the service thread; between commands it runs one control step per sample interval.
+    The state's terminate flag aborts running phases but does not stop the service.
+    """
+
+    def __init__(self, pump_bus, flow_bus, shared_data, acquisition=None, recorder=None,
+                 interval=FLOW_CONFIG['sample_interval'], valve_pins=None, name="flow-control"):
+        self.pump_bus = pump_bus
+        self.flow_bus = flow_bus
+        self.shared_data = shared_data
+        self.acquisition = acquisition
+        self.recorder = recorder  # May be swapped between experiments
+        self.interval = interval
+        self.valve_pins = valve_pins  # None drives the default valve pair
+        self.name = name
+        self.status = "idle"  # idle, running, paused or stopped
+        self._commands = queue.Queue()
+        self._thread = None
+
+    @property
+    def alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _send(self, command, wait, timeout=None, **arguments):
+        if not self.alive:
+            raise RuntimeError(f"Flow control service is not running; cannot {command}")
+        done = threading.Event()
+        self._commands.put((command, arguments, done))
+        if wait:
+            done.wait(timeout)
+        return done
+
+    def start(self, wait=True):
+        """Start the service thread if needed and begin (or resume) closed-loop control."""
+        if not self.alive:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        return self._send("start", wait)
+
+    def pause(self, wait=True):
+        """Suspend control and turn the pump off; ``start`` resumes it."""
+        return self._send("pause", wait)
+
+    def retarget(self, target_flow, valve_mode=None, phase=None, wait=True):
+        """Change the setpoint (and optionally valve mode and phase) and act on it immediately."""
+        changes = {"target_flow": target_flow}
+        if valve_mode is not None:
+            changes["valve_mode"] = valve_mode
+        if phase is not None:
+            changes["phase"] = phase
+        return self._send("retarget", wait, **changes)
+
+    def stop(self, timeout=None):
+        """Stop control, turn the pump off and end the service thread."""
+        if not self.alive:
+            return
+        self._commands.put(("stop", {}, threading.Event()))
+        self._thread.join(timeout)
+
+    def _run(self):
+        logger.debug("Flow control service initialized.")
+        owns_measurement = self.acquisition is None
+        if owns_measurement:
+            if not start_flow_measurement(self.flow_bus):
+                logger.error("Failed to start flow measurement. Exiting.")
+                self._fail_pending()
+                return
+        elif not self.acquisition.running:
+            logger.error("Flow acquisition is not running. Exiting.")
+            self._fail_pending()
+            return
+        logger.info("Flow control service started.")
+
+        running = False
+        try:
+            while True:
+                try:
+                    command, arguments, done = self._commands.get(timeout=self.interval if running else None)
+                except queue.Empty:
+                    command = None
+
+                if command == "stop":
+                    break
+                if command == "start":
+                    running = True
+                    self.status = "running"
+                elif command == "pause":
+                    if running:
+                        stop_pump(self.pump_bus)
+                    running = False
+                    self.status = "paused"
+                elif command == "retarget":
+                    self.shared_data.update(**arguments)
+                if command is not None:
+                    # Acknowledge once applied; the control step below acts on it straight away
+                    done.set()
+
+                if running:
+                    try:
+                        if not control_step(self.pump_bus, self.flow_bus, self.shared_data, self.acquisition,
+                                            self.recorder, self.valve_pins):
+                            hot_logger.warning("Failed to read flow measurement.")
+                    except OSError as e:
+                        # A single bus error must not take down a batch-long controller
+                        logger.error("Flow control step failed: %s", e)
+        finally:
+            if running:
+                stop_pump(self.pump_bus)
+            if owns_measurement:
+                stop_flow_measurement(self.flow_bus)
+            self.status = "stopped"
+            self._fail_pending()
+            logger.info("Flow control service stopped.")
+
+    def _fail_pending(self):
+        # Release anyone still waiting on a command that will never run
+        while True:
+            try:
+                _, _, done = self._commands.get_nowait()
+            except queue.Empty:
+                return
+            done.set()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+@timed("flow_control.step")
+def control_step(pump_bus, flow_bus, shared_data, acquisition=None, recorder=None, valve_pins=None):
+    """Run one control iteration: read flow, adjust the pump voltage and apply the valve mode.
+
+    Returns False if no flow reading was available.
+    """
+    # Monitor the flow rate using flow_bus
+    hot_logger.debug("Reading flow...")
+    with span("flow_control.read_flow"):
+        if acquisition is not None:
+            flow = acquisition.filtered_flow()
+            flow_rate_of_change = acquisition.rate_of_change()
+        else:
+            flow = read_flow(flow_bus)
+            flow_rate_of_change = 0.0
+    if flow is None:
+        return False
+
+    with shared_data.lock:
+        shared_data.update(flow=flow, flow_rate_of_change=flow_rate_of_change)
+        state = shared_data.snapshot()
+    current_flow = flow
+    current_voltage = state.voltage
+    valve_mode = state.valve_mode
+    phase = state.phase
+
+    hot_logger.debug("Current flow: %s, Current voltage: %s", current_flow, current_voltage)
+
+    target_flow = state.target_flow
+    error = target_flow - current_flow
+    deadband = calculate_deadband(FLOW_CONFIG['kp'])
+
+    if abs(error) > deadband:
+        kp = FLOW_CONFIG['kp']
+        # Derivative term damps overshoot using the denoised rate of change
+        voltage_adjustment = kp * error - FLOW_CONFIG['kd'] * flow_rate_of_change
+        new_voltage = current_voltage + voltage_adjustment
+        new_voltage = max(PUMP_CONFIG['min_voltage'], min(PUMP_CONFIG['max_voltage'], new_voltage))
+
+        shared_data.update(voltage=new_voltage)
+    else:
+        voltage_adjustment = 0.0
+        new_voltage = current_voltage
+
+    control_valve_mode(valve_mode, valve_pins)
+    hot_logger.info("Valve Mode: %s, Target Flow Rate: %.3f ml/min, Flow Rate: %.3f ml/min, Voltage: %.1f V, Adjustment: %.1f V", valve_mode, target_flow, current_flow, new_voltage, voltage_adjustment)
+    run_sequence(pump_bus, new_voltage)
+    if recorder is not None:
+        recorder.record(time.time(), target_flow, current_flow, new_voltage, valve_mode, phase)
+    return True
 
 def calculate_deadband(kp, base_kp=FLOW_CONFIG['kp'], base_deadband=FLOW_CONFIG['deadband']):
     """Calculate the deadband based on the proportional control constant (Kp)."""
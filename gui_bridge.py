@@ -0,0 +1,74 @@
+import threading
+from logger import setup_logger
+import logging
+
+logger = setup_logger(__name__, level=logging.INFO)
+
+
+class GuiBridge:
+    """
+    Hands updates from worker threads to the Tk thread at a fixed frame rate.
+
+    Workers call ``post`` (only the latest value per key is kept) or ``extend`` (values
+    accumulate until the next frame); neither touches Tk. Once per frame the Tk thread
+    takes everything posted since the last frame and calls the subscribers for each key,
+    then the per-frame callbacks. However fast updates arrive, the GUI does at most one
+    refresh per key per frame.
+    """
+
+    def __init__(self, root, frame_rate=20):
+        self.root = root
+        self.frame_interval = max(1, int(1000 / frame_rate))  # ms
+        self._latest = {}
+        self._batches = {}
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._frame_callbacks = []
+        self._after_id = None
+
+    def post(self, key, value):
+        """Publish a value for ``key``; replaces anything not yet shown. Safe from any thread."""
+        with self._lock:
+            self._latest[key] = value
+
+    def extend(self, key, *values):
+        """Queue values for ``key``; subscribers get the whole batch as a list. Safe from any thread."""
+        with self._lock:
+            self._batches.setdefault(key, []).extend(values)
+
+    def subscribe(self, key, callback):
+        """Call ``callback(value)`` on the Tk thread when ``key`` has new data."""
+        self._subscribers.setdefault(key, []).append(callback)
+
+    def on_frame(self, callback):
+        """Call ``callback()`` on the Tk thread once per frame."""
+        self._frame_callbacks.append(callback)
+
+    def start(self):
+        if self._after_id is None:
+            self._after_id = self.root.after(self.frame_interval, self._drain)
+
+    def stop(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+    def _drain(self):
+        with self._lock:
+            latest, self._latest = self._latest, {}
+            batches, self._batches = self._batches, {}
+
+        for updates in (latest, batches):
+            for key, value in updates.items():
+                for callback in self._subscribers.get(key, ()):
+                    try:
+                        callback(value)
+                    except Exception as e:
+                        logger.error("GUI update for %s failed: %s", key, e)
+        for callback in self._frame_callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error("GUI frame callback failed: %s", e)
+
+        self._after_id = self.root.after(self.frame_interval, self._drain)
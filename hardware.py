@@ -0,0 +1,95 @@
+import importlib
+import threading
+
+
+class LazyBus:
+    """I2C bus handle that only opens the underlying SMBus on first use."""
+
+    def __init__(self, bus_number):
+        self.bus_number = bus_number
+        self._bus = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._bus is not None
+
+    def open(self):
+        """Open the bus if needed and return the real SMBus object."""
+        if self._bus is None:
+            with self._lock:
+                if self._bus is None:
+                    from smbus2 import SMBus
+                    self._bus = SMBus(self.bus_number)
+        return self._bus
+
+    def close(self):
+        """Close the bus; the next access transparently reopens it."""
+        with self._lock:
+            if self._bus is not None:
+                self._bus.close()
+                self._bus = None
+
+    def __getattr__(self, name):
+        # Only reached for attributes not defined on the proxy itself,
+        # i.e. the SMBus API (write_i2c_block_data, i2c_rdwr, ...).
+        return getattr(self.open(), name)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        state = "open" if self.is_open else "closed"
+        return f"LazyBus({self.bus_number}, {state})"
+
+
+class LazyGPIO:
+    """Jetson.GPIO wrapper that defers import, setmode and pin setup to first use."""
+
+    def __init__(self, mode="BOARD"):
+        self.mode = mode
+        self._gpio = None
+        self._output_pins = []
+        self._lock = threading.RLock()
+
+    @property
+    def is_initialized(self):
+        return self._gpio is not None
+
+    def register_outputs(self, *pins):
+        """Declare output pins; they are configured the first time GPIO is touched."""
+        with self._lock:
+            for pin in pins:
+                if pin not in self._output_pins:
+                    self._output_pins.append(pin)
+                    if self._gpio is not None:
+                        self._gpio.setup(pin, self._gpio.OUT)
+
+    def module(self):
+        """Import and initialise Jetson.GPIO if needed and return the module."""
+        if self._gpio is None:
+            with self._lock:
+                if self._gpio is None:
+                    gpio = importlib.import_module("Jetson.GPIO")
+                    gpio.setmode(getattr(gpio, self.mode))
+                    for pin in self._output_pins:
+                        gpio.setup(pin, gpio.OUT)
+                    self._gpio = gpio
+        return self._gpio
+
+    def cleanup(self):
+        """Release the pins if they were ever set up; the next use re-initialises them."""
+        with self._lock:
+            if self._gpio is not None:
+                self._gpio.cleanup()
+                self._gpio = None
+
+    def __getattr__(self, name):
+        return getattr(self.module(), name)
+
+
+gpio = LazyGPIO()
@@ -0,0 +1,305 @@
+import os
+import re
+import sys
+import glob
+import time
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+from config import INFERENCE_CONFIG, VNA_CONFIG
+from vna import sweep_segments
+from logger import setup_logger
+import logging
+
+logger = setup_logger(__name__, level=logging.INFO)
+
+
+def feature_grid(points=INFERENCE_CONFIG['feature_points'], config=VNA_CONFIG):
+    """Frequencies every sweep is resampled onto, so models work across sweep grids."""
+    segments = sweep_segments(config)
+    return np.linspace(min(segment['start_frequency'] for segment in segments),
+                       max(segment['stop_frequency'] for segment in segments), points)
+
+
+def sweep_features(frequency, columns, grid):
+    """
+    One sweep's feature vector: each column interpolated onto ``grid``, concatenated.
+
+    ``columns`` is a list of per-point arrays (e.g. Permittivity_Corrected) measured at
+    ``frequency``.
+    """
+    frequency = np.asarray(frequency, dtype=np.float64)
+    order = np.argsort(frequency, kind="stable")
+    return np.concatenate([
+        np.interp(grid, frequency[order], np.asarray(values, dtype=np.float64)[order]) for values in columns
+    ])
+
+
+def split_sweeps(table, frequency_column="Frequency_(Hz)"):
+    """
+    Yield (chemical, concentration, rows) for each sweep in a processed_data table.
+
+    Rows carry no sweep id, so a sweep ends where the labels change or the frequency
+    drops back (a repeated experiment number).
+    """
+    frequency = table[frequency_column].to_numpy()
+    labels = table[["Chemical", "Concentration", "Experiment_Number"]]
+    boundary = np.ones(len(table), dtype=bool)
+    boundary[1:] = (np.diff(frequency) <= 0) | (labels.iloc[1:].to_numpy() != labels.iloc[:-1].to_numpy()).any(axis=1)
+    starts = np.flatnonzero(boundary)
+    for start, stop in zip(starts, np.append(starts[1:], len(table))):
+        rows = table.iloc[start:stop]
+        yield rows["Chemical"].iloc[0], float(rows["Concentration"].iloc[0]), rows
+
+
+class RidgeModel:
+    """
+    Ridge regression kept as running (Welford) moments of the features and target.
+
+    The model holds the feature mean, the centred co-moment matrix Σ(x-μ)(x-μ)ᵀ and
+    the centred cross-moment Σ(x-μ)(y-ȳ). ``update`` folds in one labelled sweep with
+    Welford's update; ``solve`` standardises with the current per-feature spread and
+    solves the ridge system in that space, so every sweep (not only the first ones)
+    is standardised the same way under the penalty. The intercept is ȳ and is not
+    penalised.
+    """
+
+    def __init__(self, mean, comoment, xy_comoment, y_mean, ridge_lambda, count=0):
+        self.mean = np.asarray(mean, dtype=np.float64).copy()
+        self.comoment = np.asarray(comoment, dtype=np.float64).copy()
+        self.xy_comoment = np.asarray(xy_comoment, dtype=np.float64).copy()
+        self.y_mean = float(y_mean)
+        self.ridge_lambda = float(ridge_lambda)
+        self.count = int(count)
+        self.scale = None
+        self.weights = None
+
+    @classmethod
+    def empty(cls, size, ridge_lambda=INFERENCE_CONFIG['ridge_lambda']):
+        return cls(np.zeros(size), np.zeros((size, size)), np.zeros(size), 0.0, ridge_lambda)
+
+    @classmethod
+    def fit(cls, features, targets, ridge_lambda=INFERENCE_CONFIG['ridge_lambda']):
+        features = np.asarray(features, dtype=np.float64)
+        targets = np.asarray(targets, dtype=np.float64)
+        mean = np.nan_to_num(np.nanmean(features, axis=0))
+        centred = np.nan_to_num(features - mean)  # Missing values count as the mean
+        y_mean = targets.mean()
+        model = cls(mean, centred.T @ centred, centred.T @ (targets - y_mean), y_mean, ridge_lambda, len(targets))
+        model.solve()
+        return model
+
+    def solve(self):
+        variance = np.diag(self.comoment) / max(self.count, 1)
+        self.scale = np.sqrt(variance)
+        self.scale[~(self.scale > 0)] = 1.0  # Constant features contribute nothing
+        system = self.comoment / np.outer(self.scale, self.scale) + self.ridge_lambda * np.eye(self.mean.size)
+        self.weights = np.linalg.solve(system, self.xy_comoment / self.scale)
+        return self.weights
+
+    def update(self, features, target):
+        """Add one labelled sweep to the moments and refresh the weights."""
+        features = np.asarray(features, dtype=np.float64)
+        features = np.where(np.isnan(features), self.mean, features)
+        self.count += 1
+        delta = features - self.mean
+        y_delta = target - self.y_mean
+        weight = (self.count - 1) / self.count
+        self.comoment += weight * np.outer(delta, delta)
+        self.xy_comoment += weight * delta * y_delta
+        self.mean += delta / self.count
+        self.y_mean += y_delta / self.count
+        return self.solve()
+
+    def predict(self, features):
+        standardised = np.nan_to_num((np.atleast_2d(features) - self.mean) / self.scale)
+        return standardised @ self.weights + self.y_mean
+
+    def to_arrays(self):
+        return dict(mean=self.mean, comoment=self.comoment, xy_comoment=self.xy_comoment, y_mean=self.y_mean,
+                    ridge_lambda=self.ridge_lambda, count=self.count)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        if "xtx" in arrays:
+            return cls._from_standardised(arrays)
+        model = cls(arrays["mean"], arrays["comoment"], arrays["xy_comoment"], arrays["y_mean"],
+                    arrays["ridge_lambda"], arrays["count"])
+        model.solve()
+        return model
+
+    @classmethod
+    def _from_standardised(cls, arrays):
+        """Model files written before the running moments: ZᵀZ and Zᵀ(y-y0) with an intercept column."""
+        count = int(arrays["count"])
+        scale, xtx, xty = arrays["scale"], arrays["xtx"], arrays["xty"]
+        z_mean = xtx[:-1, -1] / max(count, 1)
+        y_mean = float(arrays["y_offset"]) + xty[-1] / max(count, 1)
+        comoment = (xtx[:-1, :-1] - count * np.outer(z_mean, z_mean)) * np.outer(scale, scale)
+        xy_comoment = (xty[:-1] - count * z_mean * (y_mean - float(arrays["y_offset"]))) * scale
+        model = cls(arrays["mean"] + scale * z_mean, comoment, xy_comoment, y_mean, arrays["ridge_lambda"], count)
+        model.solve()
+        return model
+
+
+def model_path(model_dir, chemical):
+    return os.path.join(model_dir, re.sub(r"[^A-Za-z0-9._-]+", "_", str(chemical)) + ".npz")
+
+
+class ConcentrationPredictor:
+    """
+    Per-chemical concentration models over processed sweep features.
+
+    Models are loaded from ``<model_dir>/<chemical>.npz`` once; ``predict`` then only
+    resamples the sweep's feature columns and takes one dot product. ``learn`` folds
+    each newly stored labelled sweep into its chemical's model (starting a model for
+    a chemical seen for the first time) and rewrites that model's file; the models
+    can be snapshotted under ``<model_dir>/snapshots/`` and rolled back.
+    """
+
+    def __init__(self, models=None, columns=INFERENCE_CONFIG['features'], grid=None, model_dir=None):
+        self.models = dict(models or {})
+        self.columns = list(columns)
+        self.grid = feature_grid() if grid is None else np.asarray(grid, dtype=np.float64)
+        self.model_dir = model_dir
+        self.updates = 0
+
+    def features(self, data, frequency_column="Frequency (Hz)"):
+        return sweep_features(data[frequency_column].to_numpy(), [data[column].to_numpy() for column in self.columns],
+                              self.grid)
+
+    def predict(self, chemical, data, frequency_column="Frequency (Hz)"):
+        """Predicted concentration of one processed sweep, or None without a model for ``chemical``."""
+        model = self.models.get(chemical)
+        if model is None:
+            return None
+        return float(model.predict(self.features(data, frequency_column))[0])
+
+    def learn(self, chemical, data, concentration, frequency_column="Frequency (Hz)"):
+        """Update ``chemical``'s model with one processed sweep of known concentration."""
+        features = self.features(data, frequency_column)
+        model = self.models.get(chemical)
+        if model is None:
+            model = self.models[chemical] = RidgeModel.empty(features.size)
+            logger.info("Started a concentration model for %s.", chemical)
+        model.update(features, concentration)
+        self.updates += 1
+        if self.model_dir:
+            self.save_model(chemical)
+            if INFERENCE_CONFIG['snapshot_every'] and self.updates % INFERENCE_CONFIG['snapshot_every'] == 0:
+                self.snapshot()
+        return model
+
+    @classmethod
+    def train(cls, h5_file, ridge_lambda=INFERENCE_CONFIG['ridge_lambda'], columns=INFERENCE_CONFIG['features'], grid=None):
+        """Fit one model per chemical on every sweep in the HDF5 processed_data table."""
+        predictor = cls(columns=columns, grid=grid)
+        table = pd.read_hdf(h5_file, "processed_data")
+        hdf_columns = [column.replace(" ", "_") for column in predictor.columns]
+        samples = {}
+        for chemical, concentration, rows in split_sweeps(table):
+            features = predictor.features(rows.rename(columns=dict(zip(hdf_columns, predictor.columns))),
+                                          frequency_column="Frequency_(Hz)")
+            samples.setdefault(chemical, ([], []))
+            samples[chemical][0].append(features)
+            samples[chemical][1].append(concentration)
+        for chemical, (features, targets) in samples.items():
+            predictor.models[chemical] = RidgeModel.fit(np.vstack(features), targets, ridge_lambda)
+            residual = predictor.models[chemical].predict(np.vstack(features)) - np.asarray(targets)
+            logger.info("Trained %s on %d sweep(s); training RMSE %.3g.",
+                        chemical, len(targets), float(np.sqrt(np.mean(residual ** 2))))
+        return predictor
+
+    def save_model(self, chemical, model_dir=None):
+        model_dir = model_dir or self.model_dir
+        os.makedirs(model_dir, exist_ok=True)
+        path = model_path(model_dir, chemical)
+        temporary = path + ".tmp.npz"
+        np.savez(temporary, chemical=str(chemical), columns=np.array(self.columns), grid=self.grid,
+                 **self.models[chemical].to_arrays())
+        os.replace(temporary, path)  # A crash mid-write keeps the previous model
+        return path
+
+    def save(self, model_dir=None):
+        model_dir = model_dir or self.model_dir or INFERENCE_CONFIG['model_dir']
+        os.makedirs(model_dir, exist_ok=True)
+        for chemical in self.models:
+            self.save_model(chemical, model_dir)
+        logger.info("Saved %d model(s) to %s.", len(self.models), model_dir)
+
+    def snapshot(self, name=None):
+        """Copy the current models to ``<model_dir>/snapshots/<name>``; returns the name."""
+        name = name or f"{time.strftime('%Y%m%d-%H%M%S')}-{self.updates}"
+        directory = os.path.join(self.model_dir, "snapshots", name)
+        os.makedirs(directory, exist_ok=True)
+        for chemical in self.models:
+            self.save_model(chemical, directory)
+        logger.info("Snapshot '%s' of %d model(s) taken.", name, len(self.models))
+        for old in list_snapshots(self.model_dir)[:-INFERENCE_CONFIG['snapshots_kept']]:
+            shutil.rmtree(os.path.join(self.model_dir, "snapshots", old), ignore_errors=True)
+        return name
+
+    def rollback(self, name):
+        """Replace the current models with snapshot ``name`` (also on disk)."""
+        restored = ConcentrationPredictor.load(os.path.join(self.model_dir, "snapshots", name))
+        if not restored.models:
+            raise ValueError(f"Snapshot '{name}' has no models")
+        for path in glob.glob(os.path.join(self.model_dir, "*.npz")):
+            os.remove(path)
+        self.models, self.columns, self.grid = restored.models, restored.columns, restored.grid
+        self.save()
+        logger.info("Rolled back to snapshot '%s'.", name)
+
+    @classmethod
+    def load(cls, model_dir=INFERENCE_CONFIG['model_dir']):
+        """Every model in ``model_dir``; models with other features or grid than the first are skipped."""
+        predictor = None
+        for path in sorted(glob.glob(os.path.join(model_dir, "*.npz"))):
+            with np.load(path) as archive:
+                arrays = {key: archive[key] for key in archive.files}
+            if predictor is None:
+                predictor = cls(columns=arrays["columns"].tolist(), grid=arrays["grid"], model_dir=model_dir)
+            elif arrays["columns"].tolist() != predictor.columns or not np.array_equal(arrays["grid"], predictor.grid):
+                logger.warning("Skipping model %s: trained on different features.", path)
+                continue
+            predictor.models[str(arrays["chemical"])] = RidgeModel.from_arrays(arrays)
+        if predictor is None:
+            return cls(model_dir=model_dir)
+        logger.info("Loaded concentration models for: %s.", ", ".join(predictor.models))
+        return predictor
+
+
+def list_snapshots(model_dir=INFERENCE_CONFIG['model_dir']):
+    """Snapshot names, oldest first."""
+    directory = os.path.join(model_dir, "snapshots")
+    return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train, snapshot and roll back per-chemical concentration models.")
+    parser.add_argument("--model-dir", default=INFERENCE_CONFIG['model_dir'])
+    commands = parser.add_subparsers(dest="command", required=True)
+    train = commands.add_parser("train", help="fit models on every sweep in an HDF5 store")
+    train.add_argument("--h5", default="data/data.h5", help="HDF5 store with a processed_data table")
+    train.add_argument("--ridge-lambda", type=float, default=INFERENCE_CONFIG['ridge_lambda'])
+    snapshot = commands.add_parser("snapshot", help="save a copy of the current models")
+    snapshot.add_argument("name", nargs="?")
+    commands.add_parser("snapshots", help="list snapshots")
+    rollback = commands.add_parser("rollback", help="restore the models from a snapshot")
+    rollback.add_argument("name")
+    args = parser.parse_args(argv)
+
+    if args.command == "train":
+        ConcentrationPredictor.train(args.h5, args.ridge_lambda).save(args.model_dir)
+    elif args.command == "snapshots":
+        print("\n".join(list_snapshots(args.model_dir)))
+    elif args.command == "snapshot":
+        ConcentrationPredictor.load(args.model_dir).snapshot(args.name)
+    else:
+        ConcentrationPredictor.load(args.model_dir).rollback(args.name)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
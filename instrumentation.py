@@ -0,0 +1,192 @@
+"""
+Lightweight timing spans and counters for the acquisition and processing hot paths.
+
+``with span("vna.opc_wait"): ...`` adds the block's monotonic duration to a named
+total, ``@timed(name)`` does the same for a whole function and ``count(name, n)``
+bumps a counter. Totals are process-wide; ``snapshot`` and ``difference`` turn them
+into a per-experiment breakdown and ``prometheus_text`` renders them for scraping.
+With INSTRUMENTATION_CONFIG['enabled'] off, ``span`` returns a shared no-op context
+and ``count`` returns at once, so instrumented code costs one call per use.
+"""
+import json
+import os
+import threading
+import functools
+from time import perf_counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import INSTRUMENTATION_CONFIG
+from logger import setup_logger
+import logging
+
+logger = setup_logger(__name__, level=logging.INFO)
+
+_enabled = INSTRUMENTATION_CONFIG['enabled']
+_lock = threading.Lock()
+_spans = {}         # name -> [count, total seconds]
+_counters = {}      # name -> total
+
+
+def enabled():
+    return _enabled
+
+
+def enable(flag=True):
+    global _enabled
+    _enabled = flag
+
+
+def _record(name, elapsed):
+    with _lock:
+        totals = _spans.get(name)
+        if totals is None:
+            _spans[name] = [1, elapsed]
+        else:
+            totals[0] += 1
+            totals[1] += elapsed
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _record(self.name, perf_counter() - self.start)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name):
+    """Context manager timing its block under ``name`` (a no-op while disabled)."""
+    return _Span(name) if _enabled else _NULL_SPAN
+
+
+def timed(name):
+    """Decorator timing every call of the function under ``name``."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _record(name, perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def count(name, value=1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def snapshot():
+    """Copy of the totals: {"spans": {name: {"count", "seconds"}}, "counters": {name: value}}."""
+    with _lock:
+        return {
+            "spans": {name: {"count": calls, "seconds": seconds} for name, (calls, seconds) in _spans.items()},
+            "counters": dict(_counters),
+        }
+
+
+def difference(before, after=None):
+    """What was recorded between two snapshots (``after`` defaults to now), busiest spans first."""
+    after = after or snapshot()
+    spans = {}
+    for name, totals in after["spans"].items():
+        previous = before["spans"].get(name, {"count": 0, "seconds": 0.0})
+        calls = totals["count"] - previous["count"]
+        if calls:
+            seconds = totals["seconds"] - previous["seconds"]
+            spans[name] = {"count": calls, "seconds": seconds, "mean_seconds": seconds / calls}
+    counters = {name: value - before["counters"].get(name, 0) for name, value in after["counters"].items()
+                if value != before["counters"].get(name, 0)}
+    return {"spans": dict(sorted(spans.items(), key=lambda item: -item[1]["seconds"])), "counters": counters}
+
+
+def write_timing(path, before, metadata=None):
+    """Write the breakdown since ``before`` as JSON; nothing is written while disabled."""
+    if not _enabled:
+        return None
+    breakdown = {**(metadata or {}), **difference(before)}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as handle:
+        json.dump(breakdown, handle, indent=2, default=str)
+    logger.info("Timing breakdown saved to %s.", path)
+    return path
+
+
+def write_timing_when_done(path, before, future=None, metadata=None):
+    """
+    Write the breakdown once ``future`` (a sweep's persistence) completes, or now without one.
+
+    Spans are process-wide, so with several channels running at once the file also
+    holds the other channels' work from the same period.
+    """
+    if future is None:
+        return write_timing(path, before, metadata)
+    future.add_done_callback(lambda _: write_timing(path, before, metadata))
+    return path
+
+
+def _metric_name(name):
+    return "".join(character if character.isalnum() else "_" for character in name)
+
+
+def prometheus_text():
+    """Totals in the Prometheus text exposition format."""
+    totals = snapshot()
+    spans = sorted(totals["spans"].items())
+    lines = ["# TYPE span_seconds_total counter"]
+    lines += [f'span_seconds_total{{span="{name}"}} {values["seconds"]:.9f}' for name, values in spans]
+    lines.append("# TYPE span_calls_total counter")
+    lines += [f'span_calls_total{{span="{name}"}} {values["count"]}' for name, values in spans]
+    for name, value in sorted(totals["counters"].items()):
+        metric = f"{_metric_name(name)}_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("Metrics request: " + format, *args)
+
+
+def start_metrics_server(host=INSTRUMENTATION_CONFIG['metrics_host'], port=INSTRUMENTATION_CONFIG['metrics_port']):
+    """Serve ``GET /metrics`` on a daemon thread; returns the server (``shutdown()`` stops it)."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("Serving metrics on http://%s:%d/metrics.", host, server.server_address[1])
+    return server
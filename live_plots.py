@@ -0,0 +1,130 @@
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+
+class LivePlots:
+    """
+    Flow-vs-time and |S11| plots embedded in a Tk widget, redrawn by blitting.
+
+    The axes, ticks and labels are rendered once into a cached background; each frame
+    only the two lines are redrawn on top of it. A full redraw happens only when data
+    leaves the current axis limits, which the flow plot avoids by paging its time axis
+    forward half a window at a time.
+    """
+
+    def __init__(self, master, flow_window=300.0, max_flow_points=5000, bg_color="#1e1e1e", fg_color="#ffffff"):
+        self.flow_window = flow_window
+        self.max_flow_points = max_flow_points
+        self._flow_t = np.empty(0)
+        self._flow = np.empty(0)
+        self._target = np.empty(0)
+        self._t0 = None
+        self._dirty = False
+        self._background = None
+
+        self.figure = Figure(figsize=(6, 3.2), dpi=100, facecolor=bg_color)
+        self.flow_axes = self.figure.add_subplot(1, 2, 1)
+        self.s11_axes = self.figure.add_subplot(1, 2, 2)
+        for axes, title, xlabel, ylabel in (
+            (self.flow_axes, "Flow", "Time (s)", "ml/min"),
+            (self.s11_axes, "|S11|", "Frequency (GHz)", "dB"),
+        ):
+            axes.set_facecolor(bg_color)
+            axes.set_title(title, color=fg_color)
+            axes.set_xlabel(xlabel, color=fg_color)
+            axes.set_ylabel(ylabel, color=fg_color)
+            axes.tick_params(colors=fg_color)
+        self.flow_axes.set_xlim(0, flow_window)
+        self.flow_axes.set_ylim(0, 1.5)
+        self.s11_axes.set_xlim(0, 6)
+        self.s11_axes.set_ylim(-40, 0)
+
+        # Animated artists are skipped by canvas.draw() and drawn by us on the background
+        self.flow_line, = self.flow_axes.plot([], [], color="#4fc3f7", animated=True)
+        self.target_line, = self.flow_axes.plot([], [], color="#ffb74d", linestyle="--", animated=True)
+        self.s11_line, = self.s11_axes.plot([], [], color="#81c784", animated=True)
+        self.figure.tight_layout()
+
+        self.canvas = FigureCanvasTkAgg(self.figure, master=master)
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+        self.widget = self.canvas.get_tk_widget()
+
+    def add_flow(self, samples):
+        """Append (timestamp, flow, target_flow) samples."""
+        if not samples:
+            return
+        data = np.asarray(samples, dtype=np.float64)
+        if self._t0 is None:
+            self._t0 = data[0, 0]
+        self._flow_t = np.concatenate((self._flow_t, data[:, 0] - self._t0))[-self.max_flow_points:]
+        self._flow = np.concatenate((self._flow, data[:, 1]))[-self.max_flow_points:]
+        self._target = np.concatenate((self._target, data[:, 2]))[-self.max_flow_points:]
+        self._dirty = True
+
+    def set_spectrum(self, frequency, s11_db):
+        self.s11_line.set_data(np.asarray(frequency) / 1e9, s11_db)
+        self._dirty = True
+
+    def clear(self):
+        self._flow_t = self._flow = self._target = np.empty(0)
+        self._t0 = None
+        self.s11_line.set_data([], [])
+        self.flow_axes.set_xlim(0, self.flow_window)
+        self._dirty = True
+        self.canvas.draw_idle()
+
+    def _rescale(self):
+        """Widen the axis limits if the data left them; returns True if they changed."""
+        changed = False
+        if self._flow_t.size:
+            left, right = self.flow_axes.get_xlim()
+            if self._flow_t[-1] > right:
+                # Page forward so the next half window needs no redraw
+                left = max(0.0, self._flow_t[-1] - self.flow_window / 2)
+                self.flow_axes.set_xlim(left, left + self.flow_window)
+                changed = True
+            high = max(self._flow.max(), self._target.max())
+            bottom, top = self.flow_axes.get_ylim()
+            if high > top or self._flow.min() < bottom:
+                self.flow_axes.set_ylim(min(bottom, self._flow.min()), high * 1.2)
+                changed = True
+
+        x, y = self.s11_line.get_data()
+        if len(x):
+            y = np.asarray(y)
+            finite = y[np.isfinite(y)]
+            new_xlim = (float(np.min(x)), float(np.max(x)))
+            if new_xlim[1] > new_xlim[0] and new_xlim != self.s11_axes.get_xlim():
+                self.s11_axes.set_xlim(*new_xlim)
+                changed = True
+            if finite.size:
+                bottom, top = self.s11_axes.get_ylim()
+                if finite.min() < bottom or finite.max() > top:
+                    self.s11_axes.set_ylim(min(bottom, np.floor(finite.min() / 10) * 10),
+                                           max(top, np.ceil(finite.max() / 10) * 10))
+                    changed = True
+        return changed
+
+    def _on_draw(self, event):
+        self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self._draw_lines()
+
+    def _draw_lines(self):
+        self.flow_line.set_data(self._flow_t, self._flow)
+        self.target_line.set_data(self._flow_t, self._target)
+        for line in (self.flow_line, self.target_line, self.s11_line):
+            line.axes.draw_artist(line)
+
+    def refresh(self):
+        """Redraw the lines if anything changed since the last frame."""
+        if not self._dirty:
+            return
+        self._dirty = False
+        if self._background is None or self._rescale():
+            # Full redraw; _on_draw re-caches the background and draws the lines
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self._background)
+        self._draw_lines()
+        self.canvas.blit(self.figure.bbox)
@@ -0,0 +1,170 @@
+"""
+Columnar index of the session logs in output_logs/.
+
+Every record becomes one row (timestamp, file, level, module, message), with the
+numbers of the flow-control lines parsed into their own columns (flow, voltage,
+target, adjustment, valve_mode). Files are parsed in parallel and appended to a
+compressed HDF5 table indexed on the timestamp, so time-range queries read only the
+matching rows. Re-running ``ingest`` only parses new or grown files.
+
+Usage:
+    python log_index.py ingest [--logs output_logs] [--store data/logs.h5] [--workers N]
+    python log_index.py query --start "2024-11-30 15:20" [--stop ...] [--module flow_control] [--level INFO] [--csv out.csv]
+"""
+import os
+import re
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from logger import LOG_DIR, setup_logger
+import logging
+
+logger = setup_logger(__name__, level=logging.INFO)
+
+STORE_PATH = "data/logs.h5"
+# Session logs only; <session>_<channel>.log files repeat records already in the session log
+SESSION_FILE = re.compile(r"^\d{4}-\d\d-\d\d_\d\d-\d\d-\d\d\.log$")
+RECORD = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),(\d{3}) - ([A-Z]+) - (\S+) - (.*)$")
+CURRENT_FLOW = re.compile(r"^Current flow: (\S+), Current voltage: (\S+)")
+FLOW_ADJUSTMENT = re.compile(
+    r"^Valve Mode: (\S+), Target Flow Rate: (\S+) ml/min, Flow Rate: (\S+) ml/min, Voltage: (\S+) V, Adjustment: (\S+) V"
+)
+NUMERIC_COLUMNS = ["flow", "voltage", "target", "adjustment"]
+# Messages (tracebacks included) are truncated to this many characters in the store
+MESSAGE_CHARS = 512
+MIN_ITEMSIZE = {"file": 32, "level": 8, "module": 32, "message": MESSAGE_CHARS, "valve_mode": 32}
+
+
+def _number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan
+
+
+def parse_log(path):
+    """One log file as a DataFrame; lines that do not start a record (tracebacks) join the previous message."""
+    timestamps, levels, modules, messages = [], [], [], []
+    with open(path, errors="replace") as handle:
+        for line in handle:
+            match = RECORD.match(line)
+            if match is None:
+                if messages:
+                    messages[-1] += "\n" + line.rstrip("\n")
+                continue
+            timestamps.append(f"{match.group(1)}.{match.group(2)}")
+            levels.append(match.group(3))
+            modules.append(match.group(4))
+            messages.append(match.group(5))
+
+    size = len(messages)
+    numbers = {column: np.full(size, np.nan, dtype=np.float32) for column in NUMERIC_COLUMNS}
+    valve_mode = [""] * size
+    for row, (module, message) in enumerate(zip(modules, messages)):
+        if module != "flow_control":
+            continue
+        match = FLOW_ADJUSTMENT.match(message)
+        if match:
+            valve_mode[row] = match.group(1)
+            for column, text in zip(("target", "flow", "voltage", "adjustment"), match.groups()[1:]):
+                numbers[column][row] = _number(text)
+            continue
+        match = CURRENT_FLOW.match(message)
+        if match:
+            numbers["flow"][row], numbers["voltage"][row] = _number(match.group(1)), _number(match.group(2))
+
+    return pd.DataFrame({
+        "timestamp": pd.to_datetime(timestamps, format="%Y-%m-%d %H:%M:%S.%f"),
+        "file": os.path.basename(path),
+        "level": levels,
+        "module": modules,
+        "message": [message[:MESSAGE_CHARS] for message in messages],
+        **numbers,
+        "valve_mode": valve_mode,
+    })
+
+
+def _ingested(store):
+    if "files" not in store:
+        return {}
+    files = store["files"]
+    return dict(zip(files["file"], files["size"]))
+
+
+def ingest(log_dir=LOG_DIR, store_path=STORE_PATH, workers=None):
+    """Parse new or grown session logs into the store; returns the number of rows added."""
+    sizes = {name: os.path.getsize(os.path.join(log_dir, name))
+             for name in sorted(os.listdir(log_dir)) if SESSION_FILE.match(name)}
+    os.makedirs(os.path.dirname(store_path) or ".", exist_ok=True)
+    with pd.HDFStore(store_path, complevel=9, complib="blosc") as store:
+        known = _ingested(store)
+        pending = [name for name, size in sizes.items() if known.get(name) != size]
+        if not pending:
+            logger.info("No new log files in %s.", log_dir)
+            return 0
+        for name in pending:
+            if name in known and "logs" in store:
+                store.remove("logs", where="file == name")  # Grown since the last ingest; parsed again in full
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            frames = list(executor.map(parse_log, [os.path.join(log_dir, name) for name in pending]))
+        logs = pd.concat(frames, ignore_index=True).sort_values("timestamp", kind="stable")
+        if len(logs):
+            store.append("logs", logs, format="table", data_columns=["timestamp", "file", "level", "module"],
+                         min_itemsize=MIN_ITEMSIZE, index=False)
+            store.create_table_index("logs", columns=["timestamp"], optlevel=9, kind="full")
+        known.update((name, sizes[name]) for name in pending)
+        store.put("files", pd.DataFrame({"file": list(known), "size": list(known.values())}))
+    logger.info("Ingested %d record(s) from %d file(s).", len(logs), len(pending))
+    return len(logs)
+
+
+def query(start=None, stop=None, module=None, level=None, store_path=STORE_PATH):
+    """Records between ``start`` and ``stop`` (anything pandas.Timestamp accepts), optionally of one module/level."""
+    conditions = []
+    if start is not None:
+        start = pd.Timestamp(start)
+        conditions.append("timestamp >= start")
+    if stop is not None:
+        stop = pd.Timestamp(stop)
+        conditions.append("timestamp <= stop")
+    if module is not None:
+        conditions.append("module == module")
+    if level is not None:
+        conditions.append("level == level")
+    with pd.HDFStore(store_path, "r") as store:
+        return store.select("logs", where=" & ".join(conditions) or None).sort_values("timestamp", kind="stable")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--store", default=STORE_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest_command = commands.add_parser("ingest", help="parse new or grown session logs into the store")
+    ingest_command.add_argument("--logs", default=LOG_DIR)
+    ingest_command.add_argument("--workers", type=int, default=None)
+    query_command = commands.add_parser("query", help="print the records of a time range")
+    query_command.add_argument("--start")
+    query_command.add_argument("--stop")
+    query_command.add_argument("--module")
+    query_command.add_argument("--level")
+    query_command.add_argument("--csv", help="write the records here instead of printing them")
+    args = parser.parse_args(argv)
+
+    if args.command == "ingest":
+        ingest(args.logs, args.store, args.workers)
+        return 0
+
+    records = query(args.start, args.stop, args.module, args.level, args.store)
+    if args.csv:
+        records.to_csv(args.csv, index=False)
+    else:
+        with pd.option_context("display.max_rows", None, "display.width", 200, "display.max_colwidth", 80):
+            print(records.drop(columns=["file"]).to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
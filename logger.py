@@ -1,33 +1,189 @@
 import os
-import csv
+import time
+import queue
+import atexit
+import threading
 from datetime import datetime
 import logging
+from logging.handlers import QueueHandler, QueueListener
 
-# Ensure directories exist
-if not os.path.exists("Raw_datalog"):
-    os.makedirs("Raw_datalog")
+LOG_DIR = "output_logs"
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+# Threads named "<channel>:<role>" also log to that channel's own file
+CHANNEL_SEPARATOR = ":"
+
+
+class LazyFileHandler(logging.FileHandler):
+    """File handler that creates its directory and file only when the first record is written."""
+
+    def __init__(self, filename, mode="a", encoding=None):
+        super().__init__(filename, mode=mode, encoding=encoding, delay=True)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queue handler that leaves formatting to the listener thread.
+
+    The stock QueueHandler renders the message in the calling thread so records can
+    be pickled; ours never leave the process, so the caller only pays for the enqueue.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class _StreamLevelFilter(logging.Filter):
+    """Applies the per-logger console level passed to setup_logger."""
+
+    def filter(self, record):
+        return record.levelno >= _stream_levels.get(record.name, logging.INFO)
+
+
+class _ChannelFileRouter(logging.Handler):
+    """Copies records from a channel's threads into ``<session>_<channel>.log``."""
+
+    def __init__(self, session_path, formatter):
+        super().__init__(logging.DEBUG)
+        self._base = os.path.splitext(session_path)[0]
+        self._formatter = formatter
+        self._handlers = {}
+
+    def emit(self, record):
+        channel, separator, _ = record.threadName.partition(CHANNEL_SEPARATOR)
+        if not separator:
+            return
+        handler = self._handlers.get(channel)
+        if handler is None:
+            handler = self._handlers[channel] = LazyFileHandler(f"{self._base}_{channel}.log")
+            handler.setFormatter(self._formatter)
+        handler.handle(record)
+
+    def close(self):
+        for handler in self._handlers.values():
+            handler.close()
+        super().close()
+
+
+def channel_thread_name(channel, role):
+    """Thread name that routes the thread's log records to the channel's log file."""
+    return f"{channel}{CHANNEL_SEPARATOR}{role}" if channel else role
+
+
+class RateLimitedLogger:
+    """Wraps a logger so each message template is emitted at most once per ``interval`` seconds.
+
+    The check runs before a LogRecord is built, so suppressed calls cost a dict lookup.
+    Records at WARNING and above always go through. When a template is emitted again,
+    the number of calls dropped in between is appended to the message.
+    """
+
+    def __init__(self, logger, interval):
+        self.logger = logger
+        self.interval = interval
+        self._last_emit = {}
+        self._suppressed = {}
+
+    def log(self, level, msg, *args, **kwargs):
+        if level < logging.WARNING:
+            if not self.logger.isEnabledFor(level):
+                return
+            key = (msg, level)
+            now = time.monotonic()
+            last = self._last_emit.get(key)
+            if last is not None and now - last < self.interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return
+            self._last_emit[key] = now
+            suppressed = self._suppressed.pop(key, 0)
+            if suppressed:
+                msg = f"{msg} (%d similar suppressed)"
+                args = args + (suppressed,)
+        self.logger.log(level, msg, *args, **kwargs)
+
+    def debug(self, msg, *args, **kwargs):
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self.log(logging.INFO, msg, *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self.log(logging.WARNING, msg, *args, **kwargs)
+
+    def error(self, msg, *args, **kwargs):
+        self.log(logging.ERROR, msg, *args, **kwargs)
+
+
+_stream_levels = {}
+_hot_path_loggers = {}
+_log_queue = queue.SimpleQueue()
+_queue_handler = DeferredQueueHandler(_log_queue)
+_session = {}
+_session_lock = threading.Lock()
+
+
+def session_log_path():
+    """Path of this session's log file; every module logger writes to it."""
+    return _start_session()["path"]
+
+
+def _start_session():
+    # One background writer and one log file per process; records queued while
+    # the writer is stopped are written once it is started again
+    with _session_lock:
+        if not _session:
+            path = os.path.join(LOG_DIR, datetime.now().strftime("%Y-%m-%d_%H-%M-%S.log"))
+            formatter = logging.Formatter(LOG_FORMAT)
+
+            file_handler = LazyFileHandler(path)
+            file_handler.setLevel(logging.DEBUG)
+            file_handler.setFormatter(formatter)
+
+            stream_handler = logging.StreamHandler()
+            stream_handler.addFilter(_StreamLevelFilter())
+            stream_handler.setFormatter(formatter)
+
+            channel_router = _ChannelFileRouter(path, formatter)
+
+            listener = QueueListener(_log_queue, file_handler, stream_handler, channel_router, respect_handler_level=True)
+            listener.start()
+
+            _session.update(path=path, listener=listener)
+        return _session
+
+
+def shutdown_logging():
+    """Flush pending records and stop the background writer."""
+    with _session_lock:
+        listener = _session.pop("listener", None)
+        _session.clear()
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+atexit.register(shutdown_logging)
 
-if not os.path.exists("output_logs"):
-    os.makedirs("output_logs")
 
 # Setup logger
 def setup_logger(name, level=logging.INFO):
     logger = logging.getLogger(name)
-    if not logger.hasHandlers():
-        file_handler = logging.FileHandler(
-            os.path.join("output_logs", datetime.now().strftime("%Y-%m-%d_%H-%M-%S.log"))
-        )
-        file_handler.setLevel(logging.DEBUG)
-        file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(name)s - %(message)s"))
-
-        stream_handler = logging.StreamHandler()
-        stream_handler.setLevel(level)
-        stream_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(name)s - %(message)s"))
-
-        logger.addHandler(file_handler)
-        logger.addHandler(stream_handler)
+    _start_session()
+    _stream_levels[name] = level
+    if not logger.handlers:
+        logger.addHandler(_queue_handler)
 
     logger.setLevel(logging.DEBUG)
     return logger
 
+
+def setup_hot_path_logger(name, interval=5.0):
+    """Rate-limited logger for per-iteration messages in control loops (see RateLimitedLogger)."""
+    hot_logger = _hot_path_loggers.get(name)
+    if hot_logger is None:
+        hot_logger = _hot_path_loggers[name] = RateLimitedLogger(logging.getLogger(name), interval)
+    return hot_logger
+
 logger = setup_logger(__name__)
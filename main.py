@@ -1,9 +1,13 @@
-import Jetson.GPIO as GPIO
+from hardware import gpio as GPIO
 #from inputGUI import show_input_window
 from combo_gui import show_combined_window
+from config import INSTRUMENTATION_CONFIG
+from instrumentation import start_metrics_server
 
 if __name__ == "__main__":
     try:
+        if INSTRUMENTATION_CONFIG['metrics_port']:
+            start_metrics_server()
 
         show_combined_window()
         #show_input_window()  # Show input window on startup
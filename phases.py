@@ -0,0 +1,67 @@
+import time
+from logger import setup_logger
+import logging
+
+logger = setup_logger(__name__, level=logging.INFO)
+
+
+def run_phase(shared_data, name, target_flow, valve_mode, max_time, min_time=0.0,
+              tolerance=None, stable_samples=None, controller=None):
+    """
+    Retarget the flow cell and block until the phase's end condition is met.
+
+    The phase ends as soon as ``min_time`` has passed and the last ``stable_samples``
+    flow readings published by the controller were all within ``tolerance`` of
+    ``target_flow``; it ends regardless after ``max_time`` seconds, or when the state's
+    terminate flag is set. With ``tolerance`` or ``stable_samples`` set to None the
+    phase simply lasts ``max_time``. If ``controller`` (a FlowControlService) is given
+    the new target is sent to it and applied before the phase clock starts.
+
+    Returns a dict with the phase name, its duration, the number of samples seen and
+    the reason it ended ('stable', 'timeout' or 'terminated').
+    """
+    if controller is not None:
+        controller.retarget(target_flow, valve_mode, phase=name)
+    else:
+        shared_data.update(target_flow=target_flow, valve_mode=valve_mode, phase=name)
+    logger.info("Phase '%s' started: target %.3f ml/min, %s.", name, target_flow, valve_mode)
+
+    start = time.monotonic()
+    deadline = start + max_time
+    min_end = start + min_time
+    use_stability = tolerance is not None and stable_samples
+
+    # Only readings taken after the retarget count towards stability
+    seen_samples = shared_data.flow_samples
+    consecutive = 0
+    samples = 0
+    version = shared_data.version
+    reason = "timeout"
+
+    while True:
+        now = time.monotonic()
+        if shared_data.terminate:
+            reason = "terminated"
+            break
+        if use_stability and consecutive >= stable_samples and now >= min_end:
+            reason = "stable"
+            break
+        if now >= deadline:
+            break
+
+        # Wake on the next state change, the minimum time, or the deadline
+        wake_at = deadline if consecutive < (stable_samples or 0) or now >= min_end else min_end
+        version = shared_data.wait_for_change(version, timeout=max(0.0, wake_at - now))
+
+        state = shared_data.snapshot()
+        if state.flow_samples != seen_samples:
+            seen_samples = state.flow_samples
+            samples += 1
+            if use_stability and state.flow is not None and abs(state.flow - target_flow) <= tolerance:
+                consecutive += 1
+            else:
+                consecutive = 0
+
+    duration = time.monotonic() - start
+    logger.info("Phase '%s' ended after %.1f s (%s, %d flow samples).", name, duration, reason, samples)
+    return {"name": name, "duration": duration, "samples": samples, "reason": reason}
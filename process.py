@@ -1,8 +1,9 @@
-import time
 import threading
-from config import PROCESS_CONFIG # Import the process-specific configuration
+from config import PROCESS_CONFIG, FLOW_CONFIG # Import the process-specific configuration
 from valve import control_valve_mode  # Import the valve control function
-from vna import run_vna_sweep  # Import the VNA sweep function
+from vna import start_vna_sweep, start_baseline_sweep  # Import the VNA sweep functions
+from phases import run_phase
+from flow_control import calculate_deadband
 from logger import setup_logger
 import logging
 
@@ -12,45 +13,114 @@ flush_finish_flag = threading.Event()
 homogenization_finish_flag = threading.Event()
 sample_finish_flag = threading.Event()
 
-def flush_process(shared_data, flow_lock, finish_flag):
-    """Perform the flush process."""
-    with flow_lock:
-        shared_data["target_flow"] = PROCESS_CONFIG['flush_rate']
-        shared_data["valve_mode"] = "flush_flow"
-    
+def flow_tolerance(config):
+    """
+    Stability tolerance for the phases, never tighter than the controller's deadband.
+
+    The controller stops correcting once the flow is within the deadband, so flow can
+    settle anywhere inside it; a tighter tolerance would never be met and every phase
+    would run to its timeout.
+    """
+    deadband = calculate_deadband(FLOW_CONFIG['kp'])
+    tolerance = config['flow_tolerance']
+    if tolerance is None:
+        return deadband
+    if tolerance < deadband:
+        logger.warning("flow_tolerance %.3g ml/min is tighter than the controller deadband; using %.3g.",
+                       tolerance, deadband)
+        return deadband
+    return tolerance
+
+def flush_process(shared_data, finish_flag, config=None, controller=None, capture_baseline=False, pipeline=None, vna_endpoint=None,
+                  chemical=None):
+    """
+    Perform the flush process; ends once flow is stable or after flush_time.
+
+    With ``capture_baseline`` the flushed (blank) cell is swept once the phase ends and
+    the sweep is queued on ``pipeline`` for the rolling baseline. A failed blank sweep
+    is logged and does not stop the experiment. ``chemical`` is the one sampled next,
+    for adaptive sweeps to reuse its refinement windows.
+    """
+    config = {**PROCESS_CONFIG, **(config or {})}
     logger.debug("Starting flush process...")
-    control_valve_mode(shared_data["valve_mode"])  # Control the valve mode
-    time.sleep(PROCESS_CONFIG['flush_time'])  # Simulate the process duration
+    if controller is None:
+        control_valve_mode("flush_flow")  # Control the valve mode; a controller switches them on retarget
+    result = run_phase(
+        shared_data, "flush", config['flush_rate'], "flush_flow",
+        max_time=config['flush_time'], min_time=config['flush_min_time'],
+        tolerance=flow_tolerance(config), stable_samples=config['stable_samples'],
+        controller=controller
+    )
+    if capture_baseline and result["reason"] != "terminated":
+        logger.info("Sweeping blank solvent for the baseline...")
+        try:
+            start_baseline_sweep(pipeline=pipeline, endpoint=vna_endpoint, chemical=chemical)
+        except Exception as e:
+            logger.warning("Blank sweep failed; keeping the previous baseline: %s", e)
 
     finish_flag.set()
     logger.debug("Flush process completed.")
+    return result
 
-def homogenization_process(shared_data, flow_lock, finish_flag):
-    """Perform the homogenization process."""
-    with flow_lock:
-        shared_data["target_flow"] = PROCESS_CONFIG['homogenization_rate']
-        shared_data["valve_mode"] = "homogenization_flow"
-    
+def homogenization_process(shared_data, finish_flag, config=None, controller=None):
+    """Perform the homogenization process; ends once flow is stable or after homogenization_time."""
+    config = {**PROCESS_CONFIG, **(config or {})}
     logger.debug("Starting homogenization process...")
-    control_valve_mode(shared_data["valve_mode"])  # Control the valve mode
-    time.sleep(PROCESS_CONFIG['homogenization_time'])
+    if controller is None:
+        control_valve_mode("homogenization_flow")  # Control the valve mode
+    result = run_phase(
+        shared_data, "homogenization", config['homogenization_rate'], "homogenization_flow",
+        max_time=config['homogenization_time'], min_time=config['homogenization_min_time'],
+        tolerance=flow_tolerance(config), stable_samples=config['stable_samples'],
+        controller=controller
+    )
 
     finish_flag.set()
     logger.debug("Homogenization process completed.")
+    return result
+
+def sample_process(shared_data, finish_flag, concentration, chemical, experiment_number, raw_data_filename=None, config=None, controller=None, on_sweep=None,
+                   pipeline=None, vna_endpoint=None, flow=None):
+    """
+    Perform the sampling process with VNA sweep.
 
-def sample_process(shared_data, flow_lock, finish_flag, concentration, chemical, experiment_number):
-    """Perform the sampling process with VNA sweep."""
-    with flow_lock:
-        shared_data["target_flow"] = PROCESS_CONFIG['sample_rate']
-        shared_data["valve_mode"] = "sample_flow"
-    
+    ``config`` overrides PROCESS_CONFIG entries for this call and ``controller`` is passed
+    to run_phase, as in the other phases. ``on_sweep(s_parameters)`` is called with the
+    in-memory sweep as soon as it has been acquired. ``pipeline`` and ``vna_endpoint``
+    select the channel's sweep pipeline and VNA (defaults: the process-wide pipeline and
+    the local VNA); ``flow`` is the FlowAcquisition whose readings during the sweep go
+    into its quality checks.
+    Returns as soon as the sweep is in memory; the returned future completes once the
+    sweep has been saved and processed in the background (see sweep_pipeline). Returns
+    None without sweeping if the process was terminated while the flow settled.
+    """
+    config = {**PROCESS_CONFIG, **(config or {})}
     logger.debug("Starting sampling process...")
-    control_valve_mode(shared_data["valve_mode"])  # Control the valve mode
-    
+    if controller is None:
+        control_valve_mode("sample_flow")  # Control the valve mode
+
+    # Sweep as soon as the sample flow has settled
+    result = run_phase(
+        shared_data, "sample", config['sample_rate'], "sample_flow",
+        max_time=config['sample_settle_time'],
+        tolerance=flow_tolerance(config), stable_samples=config['stable_samples'],
+        controller=controller
+    )
+    if result["reason"] == "terminated":
+        finish_flag.set()
+        logger.info("Sampling process terminated before the VNA sweep.")
+        return None
+
     # Perform the VNA sweep during the sampling process
     logger.info("Starting VNA sweep...")
-    run_vna_sweep(chemical, concentration, experiment_number)  # Perform the VNA sweep
-    
-    # Once VNA sweep is completed, set the finish flag
+    s_parameters, persist_future = start_vna_sweep(
+        chemical, concentration, experiment_number, raw_data_filename, pipeline=pipeline, endpoint=vna_endpoint,
+        flow=flow
+    )
+    if on_sweep is not None:
+        on_sweep(s_parameters)
+
+    # Once VNA sweep is acquired, set the finish flag; storage continues during the next phase
     finish_flag.set()
     logger.debug("Sampling process completed and VNA sweep finished.")
+    return persist_future
@@ -1,12 +1,11 @@
-import threading
 import time
 import tkinter as tk
-import Jetson.GPIO as GPIO
-from flow_control import flow_control_thread, flow_lock
-from process import flush_process, homogenization_process, sample_process, flush_finish_flag, homogenization_finish_flag, sample_finish_flag
-from pump import stop_pump
-from config import PUMP_CONFIG, FLOW_CONFIG, PROCESS_CONFIG, shared_data
+from experiment import ExperimentSession
+from gui_bridge import GuiBridge
+from sweep_pipeline import drain_default_pipeline
+from config import GUI_CONFIG, shared_data
 from logger import setup_logger
+from hardware import gpio as GPIO
 import logging
 
 logger = setup_logger(__name__, level=logging.INFO)
@@ -30,102 +29,88 @@ class ProcessGUI:
 
         self.start_time = 0
         self.is_timer_running = False
+        self.shown_seconds = None
+
+        # Worker threads post updates here; they are applied on the Tk thread once per frame
+        self.bridge = GuiBridge(root, GUI_CONFIG['frame_rate'])
+        self.bridge.subscribe("status", lambda message: self.status_label.config(text=message))
+        self.bridge.subscribe("timer", lambda text: self.timer_label.config(text=text))
+        self.bridge.on_frame(self.update_timer)
+        self.bridge.start()
 
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
+    def on_sweep_persisted(self, future):
+        """Report the result of a sweep saved in the background (runs on the pipeline worker)."""
+        error = future.exception()
+        if error is not None:
+            self.update_status(f"Error saving sweep: {error}")
+        else:
+            logger.info("Sweep stored: %s", future.result())
+
     def update_status(self, message):
-        """Update the process status on the GUI."""
-        self.root.after(0, lambda: self.status_label.config(text=message))
+        """Update the process status on the GUI (safe from any thread)."""
+        self.bridge.post("status", message)
 
     def start_timer(self):
-        """Start the timer and update the GUI every second."""
+        """Start the timer; the label is refreshed by the GUI frame loop."""
         self.start_time = time.time()
         self.is_timer_running = True
-        self.update_timer()
 
     def stop_timer(self):
         """Stop the timer."""
         self.is_timer_running = False
 
     def update_timer(self):
-        """Update the timer label on the GUI."""
+        """Update the timer label on the GUI (called once per frame on the Tk thread)."""
         if self.is_timer_running:
             elapsed_time = int(time.time() - self.start_time)
-            minutes = elapsed_time // 60
-            seconds = elapsed_time % 60
-            self.root.after(0, lambda: self.timer_label.config(text=f"Elapsed Time: {minutes:02}:{seconds:02}"))
-            self.root.after(1000, self.update_timer)
+            if elapsed_time != self.shown_seconds:
+                self.shown_seconds = elapsed_time
+                minutes = elapsed_time // 60
+                seconds = elapsed_time % 60
+                self.timer_label.config(text=f"Elapsed Time: {minutes:02}:{seconds:02}")
 
     def start_experiment_loop(self):
         """Start the experiment loop to run the process sequence multiple times."""
         try:
             experiment_count = 10  # Number of experiments
-            for experiment_number in range(1, experiment_count + 1):
-                logger.info(f"Starting Experiment {experiment_number}...")
-                self.run_process_sequence(self.chemical, self.concentration, experiment_number)
-                logger.info(f"Completed Experiment {experiment_number}.")
+            with ExperimentSession(shared_data) as session:
+                for experiment_number in range(1, experiment_count + 1):
+                    logger.info("Starting Experiment %s...", experiment_number)
+                    self.run_process_sequence(session, self.chemical, self.concentration, experiment_number)
+                    logger.info("Completed Experiment %s.", experiment_number)
+                self.update_status("Turning off pump...")
+            self.update_status("All processes completed. Resetting...")
+            self.reset_process()
         except Exception as e:
-            logger.error(f"Error during experiment loop: {e}")
+            self.update_status(f"Error: {e}")
+            logger.error("Error during experiment loop: %s", e)
 
-    def run_process_sequence(self, chemical, concentration, experiment_number):
+    def run_process_sequence(self, session, chemical, concentration, experiment_number):
         """Runs the process sequence and updates the GUI."""
         try:
-            self.flow_thread = threading.Thread(
-                target=flow_control_thread,
-                args=(PUMP_CONFIG['pump_bus'], FLOW_CONFIG['flow_bus'], shared_data),
-            )
-            self.flow_thread.start()
-
-            # Flush process
-            self.update_status("Starting flush process...")
-            self.start_timer()
-            flush_process(shared_data, flow_lock, flush_finish_flag)
-            self.stop_timer()
-
-            # Homogenization process
-            self.update_status("Starting homogenization process...")
-            self.start_timer()
-            homogenization_process(shared_data, flow_lock, homogenization_finish_flag)
-            self.stop_timer()
-
-            # Sample process
-            self.update_status(f"Starting sample process: {chemical}, {concentration} ppm, Experiment {experiment_number}...")
-            self.start_timer()
-            sample_process(shared_data, flow_lock, sample_finish_flag, concentration, chemical, experiment_number)
-            self.stop_timer()
-
-            # Final flush process
-            self.update_status("Starting final flush process...")
-            self.start_timer()
-            flush_process(shared_data, flow_lock, flush_finish_flag)
+            result = session.run(chemical, concentration, experiment_number, on_phase=self.on_phase)
+            result["persist_future"].add_done_callback(self.on_sweep_persisted)
+        finally:
             self.stop_timer()
 
-            shared_data["terminate"] = True
-            self.flow_thread.join()
-
-            self.update_status("Turning off pump...")
-            stop_pump(PUMP_CONFIG['pump_bus'])
-
-            self.update_status("All processes completed. Resetting...")
-            self.reset_process()
-
-        except Exception as e:
-            self.update_status(f"Error: {e}")
-        finally:
-            GPIO.cleanup()
+    def on_phase(self, name, message):
+        """Show each process phase as it starts and restart the timer."""
+        self.stop_timer()
+        self.update_status(message)
+        self.start_timer()
 
     def reset_process(self):
         """Resets the process to the initial state."""
-        shared_data["flow"] = None
-        shared_data["voltage"] = PUMP_CONFIG['initial_voltage']
-        shared_data["target_flow"] = PROCESS_CONFIG['flush_rate']
-        shared_data["elapsed_time"] = 0
-        shared_data["valve_mode"] = "flush_flow"
+        shared_data.reset()
 
         self.update_status("Process Status: Waiting...")
-        self.root.after(0, lambda: self.timer_label.config(text="Elapsed Time: 00:00"))
+        self.shown_seconds = None
+        self.bridge.post("timer", "Elapsed Time: 00:00")
 
     def close_gui(self):
+        self.bridge.stop()
         self.root.quit()
         self.root.after(0, self.root.destroy)
         from inputGUI import show_input_window  # Import here to avoid circular import
@@ -135,7 +120,9 @@ class ProcessGUI:
         logger.info("Closing the application...")
         if hasattr(self, 'process_thread') and self.process_thread.is_alive():
             logger.info("Terminating process thread...")
-            shared_data["terminate"] = True
+            shared_data.update(terminate=True)
             self.process_thread.join(timeout=1)
+        # Sweeps still being saved in the background must reach disk before exiting
+        drain_default_pipeline()
         GPIO.cleanup()
         self.close_gui()
@@ -1,17 +1,36 @@
 import os
+import numpy as np
 import pandas as pd
 from logger import setup_logger
 from feature_engineering import FeatureEngineering
+from calibration import CalibrationStore
+from baseline import RollingBaseline
+from inference import ConcentrationPredictor
+from similarity import SpectralIndex
+from quality import sweep_quality
+from instrumentation import timed
+from config import CALIBRATION_CONFIG, BASELINE_CONFIG, INFERENCE_CONFIG, SIMILARITY_CONFIG, QC_CONFIG
 import logging
 
 logger = setup_logger(__name__, level=logging.INFO)
 
 class ProcessingManager:
-    def __init__(self, baseline_file="baseline.csv", processed_dir="processed_data", h5_file="data/data.h5"):
+    def __init__(self, baseline_file="baseline.csv", processed_dir="processed_data", h5_file="data/data.h5",
+                 calibration_dir=CALIBRATION_CONFIG['dir'], baseline_dir=BASELINE_CONFIG['dir'],
+                 model_dir=INFERENCE_CONFIG['model_dir'], index_dir=SIMILARITY_CONFIG['dir']):
         self.processed_dir = processed_dir
         self.h5_file = h5_file
         self.baseline_file = baseline_file
         self.feature_engineering = FeatureEngineering()
+        # None disables software calibration; raw sweeps are then used as measured
+        self.calibrations = CalibrationStore(calibration_dir) if calibration_dir and CALIBRATION_CONFIG['apply'] else None
+        # Captured blank sweeps; baseline_file is only used for grids without one
+        self.rolling_baseline = RollingBaseline(baseline_dir) if baseline_dir else None
+        # Concentration models are loaded once; sweeps of untrained chemicals get no prediction
+        use_models = INFERENCE_CONFIG['predict_inline'] or INFERENCE_CONFIG['online_update']
+        self.predictor = ConcentrationPredictor.load(model_dir) if model_dir and use_models else None
+        # Every processed sweep is indexed so similar historical sweeps can be looked up
+        self.similarity_index = SpectralIndex(index_dir) if index_dir and SIMILARITY_CONFIG['enabled'] else None
 
         os.makedirs(self.processed_dir, exist_ok=True)
         os.makedirs(os.path.dirname(self.h5_file), exist_ok=True)
@@ -25,10 +44,10 @@ class ProcessingManager:
                 logger.info("Baseline data loaded successfully.")
                 return baseline_data
             else:
-                logger.warning(f"Baseline file '{self.baseline_file}' not found. Continuing without baseline.")
+                logger.warning("Baseline file '%s' not found. Continuing without baseline.", self.baseline_file)
                 return None
         except Exception as e:
-            logger.error(f"Error loading baseline data: {e}")
+            logger.error("Error loading baseline data: %s", e)
             logger.debug("Exception details:", exc_info=True)
             raise
 
@@ -42,16 +61,28 @@ class ProcessingManager:
             missing_cols = set(required_columns) - set(raw_data.columns)
             raise ValueError(f"Input raw_data is missing required columns: {missing_cols}")
 
+    @timed("processing.apply_baseline_correction")
     def apply_baseline_correction(self, data):
         try:
             logger.info("Applying baseline correction...")
-            if self.baseline_data is not None:
-                data = pd.merge(data, self.baseline_data, on="Frequency (Hz)", how="left")
-
-                if "Baseline_Permittivity" not in data.columns or "Baseline_Conductivity" not in data.columns:
+            rolling = self.rolling_baseline.lookup(data["Frequency (Hz)"].to_numpy()) if self.rolling_baseline else None
+            if rolling is not None:
+                # Already on this sweep's grid (interpolated if captured on another), so no merge is needed
+                data["Baseline_Permittivity"], data["Baseline_Conductivity"] = rolling
+                data["Permittivity_Corrected"] = data["S11_Mag"] - data["Baseline_Permittivity"]
+                data["Conductivity_Corrected"] = data["S11_Phase"] - data["Baseline_Conductivity"]
+            elif self.baseline_data is not None:
+                if "Baseline_Permittivity" not in self.baseline_data.columns or "Baseline_Conductivity" not in self.baseline_data.columns:
                     logger.warning("Baseline data columns are missing. Defaulting to zeros.")
                     data["Baseline_Permittivity"] = 0
                     data["Baseline_Conductivity"] = 0
+                else:
+                    # Interpolated, so any sweep grid (segmented, refined) inside the baseline's span is corrected
+                    baseline = self.baseline_data.sort_values("Frequency (Hz)")
+                    frequency = data["Frequency (Hz)"].to_numpy()
+                    for column in ("Baseline_Permittivity", "Baseline_Conductivity"):
+                        data[column] = np.interp(frequency, baseline["Frequency (Hz)"], baseline[column],
+                                                 left=np.nan, right=np.nan)
 
                 data["Permittivity_Corrected"] = data["S11_Mag"] - data["Baseline_Permittivity"]
                 data["Conductivity_Corrected"] = data["S11_Phase"] - data["Baseline_Conductivity"]
@@ -63,15 +94,56 @@ class ProcessingManager:
             logger.info("Baseline correction applied.")
             return data
         except Exception as e:
-            logger.error(f"Error during baseline correction: {e}")
+            logger.error("Error during baseline correction: %s", e)
+            logger.debug("Exception details:", exc_info=True)
+            raise
+
+    @timed("processing.apply_calibration")
+    def apply_calibration(self, data):
+        """Error-correct the raw S-parameters with the stored calibration for this sweep's grid, if any."""
+        if self.calibrations is None:
+            return data
+        calibration = self.calibrations.for_grid(data["Frequency (Hz)"].to_numpy())
+        if calibration is None:
+            logger.debug("No calibration covers this frequency grid. Using raw S-parameters.")
+            return data
+        return calibration.correct_dataframe(data)
+
+    def capture_baseline(self, raw_data):
+        """Fold a blank-solvent sweep into the rolling baseline for its frequency grid."""
+        if self.rolling_baseline is None:
+            logger.warning("Rolling baseline disabled. Blank sweep ignored.")
+            return
+        try:
+            logger.info("Capturing blank sweep for the rolling baseline...")
+            self.validate_raw_data(raw_data)
+            blank = self.apply_calibration(raw_data.copy())
+            self.feature_engineering.calculate_magnitude_and_phase(blank)
+            self.rolling_baseline.update(
+                blank["Frequency (Hz)"].to_numpy(), blank["S11_Mag"].to_numpy(), blank["S11_Phase"].to_numpy()
+            )
+        except Exception as e:
+            logger.error("Error capturing baseline: %s", e)
             logger.debug("Exception details:", exc_info=True)
             raise
 
-    def preprocess(self, raw_data):
+    @timed("processing.quality_check")
+    def quality_check(self, data, flow_stats=None):
+        """Compute the sweep's quality metrics (see quality.sweep_quality) and warn about suspect sweeps."""
+        quality = sweep_quality(data, flow_stats)
+        if quality["Quality_Score"] < QC_CONFIG['min_score']:
+            logger.warning("Suspect sweep (quality %.2f): SNR %.1f dB, %d NaN, %d inf, %d discontinuities, "
+                           "S21 at noise floor on %.0f%% of points, flow std %s.",
+                           quality["Quality_Score"], quality["SNR_dB"], quality["NaN_Count"], quality["Inf_Count"],
+                           quality["Discontinuities"], 100 * quality["S21_Floor_Fraction"], quality["Flow_Std"])
+        return quality
+
+    @timed("processing.preprocess")
+    def preprocess(self, raw_data, flow_stats=None):
         try:
             logger.info("Starting preprocessing...")
             self.validate_raw_data(raw_data)
-            processed_data = raw_data.copy()
+            processed_data = self.apply_calibration(raw_data.copy())
 
             # Call feature engineering methods that generate required columns
             self.feature_engineering.calculate_magnitude_and_phase(processed_data)  # Produces S11_Mag, etc.
@@ -88,13 +160,17 @@ class ProcessingManager:
             self.feature_engineering.calculate_loss_tangent(processed_data)
             self.feature_engineering.calculate_effective_dielectric_constant(processed_data)
 
+            # Quality checks run on the finished features; the result travels with the frame
+            processed_data.attrs["quality"] = self.quality_check(processed_data, flow_stats)
+
             logger.info("Preprocessing completed successfully.")
             return processed_data
         except Exception as e:
-            logger.error(f"Error during preprocessing: {e}")
+            logger.error("Error during preprocessing: %s", e)
             logger.debug("Exception details:", exc_info=True)
             raise
 
+    @timed("processing.save_to_csv")
     def save_to_csv(self, data):
         try:
             logger.info("Saving data to CSV...")
@@ -107,13 +183,79 @@ class ProcessingManager:
                 data.drop(columns=[column], inplace=True)
 
             data.to_csv(csv_path, mode='a', index=False, header=not os.path.exists(csv_path))
-            logger.info(f"Processed data saved to {csv_path}.")
+            logger.info("Processed data saved to %s.", csv_path)
         except Exception as e:
-            logger.error(f"Error saving to CSV: {e}")
+            logger.error("Error saving to CSV: %s", e)
             logger.debug("Exception details:", exc_info=True)
             raise
 
-    def append_to_h5(self, data):
+    @timed("processing.predict_concentration")
+    def predict_concentration(self, data):
+        """Predicted concentration of one processed sweep, or None if no model applies."""
+        if self.predictor is None or not INFERENCE_CONFIG['predict_inline'] or data.empty:
+            return None
+        try:
+            prediction = self.predictor.predict(data["Chemical"].iloc[0], data)
+        except Exception as e:
+            logger.warning("Concentration prediction failed: %s", e)
+            return None
+        if prediction is not None:
+            logger.info("Predicted concentration: %.4g (labelled %s).", prediction, data["Concentration"].iloc[0])
+        return prediction
+
+    def update_model(self, data):
+        """Fold a stored sweep (HDF5 column names) into its chemical's model if it is labelled."""
+        if self.predictor is None or not INFERENCE_CONFIG['online_update'] or data.empty:
+            return
+        concentration = pd.to_numeric(data["Concentration"].iloc[0], errors="coerce")
+        if not np.isfinite(concentration):
+            return
+        try:
+            self.predictor.learn(data["Chemical"].iloc[0], data, float(concentration), frequency_column="Frequency_(Hz)")
+        except Exception as e:
+            logger.warning("Online model update failed: %s", e)
+            logger.debug("Exception details:", exc_info=True)
+
+    def nearest_similarity(self, data):
+        """Cosine similarity of a processed sweep to its closest indexed sweep (None if the index is empty)."""
+        if self.similarity_index is None or not len(self.similarity_index):
+            return None
+        try:
+            matches = self.similarity_index.search(data, k=1)
+        except Exception as e:
+            logger.warning("Similarity search failed: %s", e)
+            return None
+        return matches[0][1] if matches else None
+
+    @timed("processing.index_sweep")
+    def index_sweep(self, data):
+        """Add a stored sweep (HDF5 column names) to the similarity index."""
+        if self.similarity_index is None or data.empty:
+            return
+        try:
+            self.similarity_index.add(
+                data, frequency_column="Frequency_(Hz)", real_column="S11_Real", imag_column="S11_Imaginary",
+                chemical=data["Chemical"].iloc[0], concentration=data["Concentration"].iloc[0],
+                experiment_number=data["Experiment_Number"].iloc[0], timestamp=pd.Timestamp.now().isoformat(),
+            )
+        except Exception as e:
+            logger.warning("Failed to index sweep: %s", e)
+            logger.debug("Exception details:", exc_info=True)
+
+    def sweep_summary(self, data, **values):
+        """One-row table describing a sweep, stored next to processed_data."""
+        first = data.iloc[0]
+        return pd.DataFrame([{
+            "Chemical": str(first["Chemical"]),
+            "Concentration": first["Concentration"],
+            "Experiment_Number": first["Experiment Number"],
+            "Timestamp": pd.Timestamp.now(),
+            "Points": len(data),
+            **{name: np.nan if value is None else value for name, value in values.items()},
+        }])
+
+    @timed("processing.append_to_h5")
+    def append_to_h5(self, data, summary=None):
         try:
             logger.info("Appending data to HDF5...")
             h5_path = self.h5_file
@@ -128,27 +270,44 @@ class ProcessingManager:
             data.columns = [col.replace(" ", "_") for col in data.columns]
 
             with pd.HDFStore(h5_path) as store:
+                # The summary records where the sweep's rows start, to select them by quality later
+                row_start = store.get_storer("processed_data").nrows if "processed_data" in store else 0
                 store.append("processed_data", data, format="table", data_columns=True)
-            logger.info(f"Processed data appended to {h5_path}.")
+                if summary is not None:
+                    summary = summary.assign(Row_Start=row_start, Row_Count=len(data))
+                    store.append("sweep_summary", summary, format="table", data_columns=True,
+                                 min_itemsize={"Chemical": 64})
+            logger.info("Processed data appended to %s.", h5_path)
+
+            # Only sweeps that made it into the store are learned from
+            self.update_model(data)
         except Exception as e:
-            logger.error(f"Error saving to HDF5: {e}")
+            logger.error("Error saving to HDF5: %s", e)
             logger.debug("Exception details:", exc_info=True)
             raise
 
-    def process_and_save(self, raw_data):
+    def process_and_save(self, raw_data, flow_stats=None):
         try:
             logger.info("Starting processing and saving...")
             # Preprocess the raw data
-            processed_data = self.preprocess(raw_data)
+            processed_data = self.preprocess(raw_data, flow_stats)
+
+            # Predict before saving; saving converts complex columns in place
+            summary = self.sweep_summary(processed_data,
+                                         Predicted_Concentration=self.predict_concentration(processed_data),
+                                         Nearest_Similarity=self.nearest_similarity(processed_data),
+                                         **processed_data.attrs.get("quality", {}))
 
             # Save processed data to CSV
             self.save_to_csv(processed_data)
 
             # Append processed data to HDF5
-            self.append_to_h5(processed_data)
+            self.append_to_h5(processed_data, summary)
+            self.index_sweep(processed_data)
 
             logger.info("Processing and saving completed successfully.")
+            return summary
         except Exception as e:
-            logger.error(f"Error during process_and_save: {e}")
+            logger.error("Error during process_and_save: %s", e)
             logger.debug("Exception details:", exc_info=True)
             raise
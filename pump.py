@@ -1,5 +1,6 @@
 import time
 from config import PUMP_CONFIG
+from instrumentation import timed, count
 
 def write_waveform_data(bus, voltage):
     amplitude_value = int((voltage / 150.0) * 255)
@@ -13,24 +14,31 @@ def write_waveform_data(bus, voltage):
     
     for i, data in enumerate(waveform_data):
         bus.write_i2c_block_data(PUMP_CONFIG['i2c_address'], i, [data])
+    count("pump.i2c_writes", 1 + len(waveform_data))
     
-    time.sleep(0.2)
+    if PUMP_CONFIG['settle_time']:
+        time.sleep(PUMP_CONFIG['settle_time'])
 
 def write_control_data(bus):
     bus.write_i2c_block_data(PUMP_CONFIG['i2c_address'], PUMP_CONFIG['register_page_ff'], [0])
     
     for i, data in enumerate(PUMP_CONFIG['control_data']):
         bus.write_i2c_block_data(PUMP_CONFIG['i2c_address'], i, [data])
+    count("pump.i2c_writes", 1 + len(PUMP_CONFIG['control_data']))
     
-    time.sleep(0.2)
+    if PUMP_CONFIG['settle_time']:
+        time.sleep(PUMP_CONFIG['settle_time'])
 
+@timed("pump.run_sequence")
 def run_sequence(bus, voltage):
     for _ in range(2):  # Loop twice
         write_waveform_data(bus, voltage)
         write_control_data(bus)
         bus.write_i2c_block_data(PUMP_CONFIG['i2c_address'], PUMP_CONFIG['register_page_ff'], [0])
+        count("pump.i2c_writes")
         # Optional: Add a small delay if needed between the two iterations
-        time.sleep(0.1)
+        if PUMP_CONFIG['repeat_delay']:
+            time.sleep(PUMP_CONFIG['repeat_delay'])
 
 def stop_pump(bus):
     for _ in range(2):
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+from config import QC_CONFIG
+from logger import setup_logger
+import logging
+
+logger = setup_logger(__name__, level=logging.INFO)
+
+# Derived columns that go NaN/inf on degenerate input (zero frequency, zero reactance, ...)
+DERIVED_SUFFIXES = ("_Capacitance", "_Inductance", "_Skin_Depth")
+RAW_COLUMNS = ["S11 Real", "S11 Imaginary", "S21 Real", "S21 Imaginary",
+               "S12 Real", "S12 Imaginary", "S22 Real", "S22 Imaginary"]
+
+
+def s11_snr_db(s11, frequency):
+    """
+    S11 signal-to-noise ratio in dB.
+
+    The noise is estimated from the complex second difference, which cancels the
+    smooth response: for white noise E|d²|² = 6σ², and the median of |d²| is used
+    so that a few resonances do not count as noise. On segmented grids only evenly
+    spaced triples are used.
+    """
+    if s11.size < 3:
+        return np.nan
+    spacing = np.diff(frequency)
+    even = np.isclose(spacing[1:], spacing[:-1], rtol=1e-6)
+    second_difference = np.abs(s11[2:] - 2 * s11[1:-1] + s11[:-2])[even]
+    if not second_difference.size:
+        return np.nan
+    noise = np.median(second_difference) / np.sqrt(6 * np.log(2))
+    signal = np.sqrt(np.mean(np.abs(s11) ** 2))
+    if noise == 0:
+        return np.inf if signal > 0 else np.nan
+    return float(20 * np.log10(signal / noise))
+
+
+def sweep_quality(data, flow_stats=None, config=QC_CONFIG):
+    """
+    Quality metrics of one preprocessed sweep and a combined score in [0, 1].
+
+    ``flow_stats`` (FlowAcquisition.window_stats during the sweep) adds the flow
+    variation; without it the flow does not affect the score. NaN/inf counts of the
+    derived columns are reported but not scored, since some are expected (skin depth
+    for negative phase, capacitance at zero reactance); non-finite raw S-parameters are.
+    """
+    frequency = data["Frequency (Hz)"].to_numpy()
+    s11 = data["S11 Real"].to_numpy() + 1j * data["S11 Imaginary"].to_numpy()
+    s21_magnitude = np.hypot(data["S21 Real"].to_numpy(), data["S21 Imaginary"].to_numpy())
+
+    derived = data[[column for column in data.columns if column.endswith(DERIVED_SUFFIXES)]].to_numpy(dtype=np.float64)
+    nan_count = int(np.isnan(derived).sum())
+    inf_count = int(np.isinf(derived).sum())
+    raw = data[RAW_COLUMNS].to_numpy(dtype=np.float64)
+    raw_nonfinite_fraction = float(np.mean(~np.isfinite(raw))) if raw.size else 0.0
+
+    # Steps per Hz, so denser segments of a segmented sweep do not look like jumps
+    spacing = np.diff(frequency)
+    steps = np.abs(np.diff(s11)) / np.where(spacing > 0, spacing, np.nan)
+    steps = steps[np.isfinite(steps)]
+    typical_step = np.median(steps) if steps.size else 0.0
+    discontinuities = int(np.count_nonzero(steps > config['jump_factor'] * typical_step)) if typical_step > 0 else 0
+
+    snr_db = s11_snr_db(s11, frequency)
+    s21_floor_fraction = float(np.mean(s21_magnitude < config['s21_floor'])) if s21_magnitude.size else 0.0
+
+    flow_mean = flow_std = np.nan
+    flow_cv = 0.0
+    if flow_stats and flow_stats.get("samples"):
+        flow_mean, flow_std = float(flow_stats["mean"]), float(flow_stats["std"])
+        flow_cv = flow_std / abs(flow_mean) if flow_mean else np.inf
+
+    # Each factor is 1 for a clean sweep; the score is their product
+    snr_span = config['snr_good_db'] - config['snr_floor_db']
+    snr_factor = float(np.clip((snr_db - config['snr_floor_db']) / snr_span, 0, 1)) if not np.isnan(snr_db) else 0.0
+    finite_factor = 1 - raw_nonfinite_fraction
+    continuity_factor = 1 / (1 + discontinuities)
+    flow_factor = 1.0 if flow_cv <= config['flow_cv_limit'] else config['flow_cv_limit'] / flow_cv
+    s21_factor = 1 - 0.5 * s21_floor_fraction  # A dead S21 is suspicious but S11 may still be usable
+
+    return {
+        "SNR_dB": snr_db,
+        "NaN_Count": nan_count,
+        "Inf_Count": inf_count,
+        "Raw_Nonfinite_Fraction": raw_nonfinite_fraction,
+        "Discontinuities": discontinuities,
+        "S21_Floor_Fraction": s21_floor_fraction,
+        "Zero_Hz_Point": bool(frequency.size and frequency.min() <= 0),
+        "Flow_Mean": flow_mean,
+        "Flow_Std": flow_std,
+        "Quality_Score": snr_factor * finite_factor * continuity_factor * flow_factor * s21_factor,
+    }
+
+
+def good_sweeps(h5_file, min_score=QC_CONFIG['min_score']):
+    """
+    processed_data rows of every sweep scoring at least ``min_score``.
+
+    Uses the indexed Quality_Score column of sweep_summary and each sweep's row range,
+    so only the selected rows are read.
+    """
+    with pd.HDFStore(h5_file, "r") as store:
+        selected = store.select("sweep_summary", where=f"Quality_Score >= {float(min_score)}",
+                                columns=["Row_Start", "Row_Count"])
+        if selected.empty:
+            return store.select("processed_data", stop=0)
+        coordinates = np.concatenate([
+            np.arange(start, start + count) for start, count in zip(selected["Row_Start"], selected["Row_Count"])
+        ])
+        return store.select("processed_data", where=coordinates)
@@ -0,0 +1,181 @@
+import os
+import sys
+import json
+import argparse
+import threading
+from experiment import ExperimentSession, ExperimentAborted
+from sweep_pipeline import drain_default_pipeline
+from config import shared_data
+from logger import setup_logger
+import logging
+
+logger = setup_logger(__name__, level=logging.INFO)
+
+# Phase settings a recipe may override; anything else is rejected so typos don't pass silently
+PHASE_KEYS = {
+    'flush_rate', 'homogenization_rate', 'sample_rate',
+    'flush_time', 'flush_min_time', 'homogenization_time', 'homogenization_min_time',
+    'sample_settle_time', 'flow_tolerance', 'stable_samples',
+}
+
+
+def load_recipe(path):
+    """
+    Load a recipe file (JSON, or YAML if PyYAML is installed) into a list of runs.
+
+    The file is either a list of runs or ``{"defaults": {...}, "runs": [...]}``. Each run
+    has a chemical, a concentration, an optional repeat count and optional ``phases``
+    overrides of PROCESS_CONFIG; ``defaults`` supplies values missing from a run.
+    """
+    return parse_recipe(read_recipe_document(path))
+
+
+def read_recipe_document(path):
+    """Read a JSON or YAML recipe file without validating it."""
+    with open(path, 'r') as f:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml  # Optional dependency, only needed for YAML recipes
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def parse_recipe(document):
+    """Validate a recipe document (already parsed from JSON/YAML) and return its runs."""
+    if isinstance(document, list):
+        document = {"runs": document}
+    if not isinstance(document, dict):
+        raise ValueError("A recipe must be a list of runs or a mapping with 'runs'")
+    defaults = document.get("defaults", {})
+
+    runs = []
+    for index, entry in enumerate(document.get("runs", [])):
+        if not isinstance(entry, dict):
+            raise ValueError(f"Run {index} is not a mapping")
+        run = {**defaults, **entry}
+        run["phases"] = {**defaults.get("phases", {}), **entry.get("phases", {})}
+        missing = [key for key in ("chemical", "concentration") if key not in run]
+        if missing:
+            raise ValueError(f"Run {index} is missing {', '.join(missing)}")
+        unknown = set(run["phases"]) - PHASE_KEYS
+        if unknown:
+            raise ValueError(f"Run {index} has unknown phase settings: {sorted(unknown)}")
+        run["repeats"] = int(run.get("repeats", 1))
+        runs.append(run)
+    return runs
+
+
+def default_progress_path(recipe_path):
+    return os.path.splitext(recipe_path)[0] + ".progress.json"
+
+
+class RecipeRunner:
+    """
+    Runs every experiment of a recipe back to back on one ExperimentSession, without a GUI.
+
+    Completed experiments are recorded in a small progress file as soon as each one's
+    sweep is stored, so an interrupted batch can be resumed where it stopped.
+    """
+
+    def __init__(self, recipe_path, progress_path=None, resume=False):
+        self.recipe_path = recipe_path
+        self.runs = load_recipe(recipe_path)
+        self.progress_path = progress_path or default_progress_path(recipe_path)
+        self.completed = self._load_progress() if resume else set()
+        self._recording = 0     # Stored sweeps not yet recorded as done
+        self._progress_lock = threading.Condition()
+
+    def _load_progress(self):
+        if not os.path.exists(self.progress_path):
+            return set()
+        with open(self.progress_path, 'r') as f:
+            progress = json.load(f)
+        return {tuple(item) for item in progress.get("completed", [])}
+
+    def _save_progress(self):
+        # Write-then-rename so a crash never leaves a half-written progress file
+        temp_path = self.progress_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({"recipe": os.path.abspath(self.recipe_path), "completed": sorted(self.completed)}, f)
+        os.replace(temp_path, self.progress_path)
+
+    def experiments(self):
+        """Yield (run index, experiment number, run) for every experiment still to do."""
+        for index, run in enumerate(self.runs):
+            first = int(run.get("first_experiment", 1))
+            for experiment_number in range(first, first + run["repeats"]):
+                if (index, experiment_number) not in self.completed:
+                    yield index, experiment_number, run
+
+    def _record_when_stored(self, index, experiment_number, future):
+        """Record the experiment as done once its sweep is stored (on the pipeline's thread)."""
+        with self._progress_lock:
+            self._recording += 1
+        future.add_done_callback(lambda done: self._record(index, experiment_number, done))
+
+    def _record(self, index, experiment_number, future):
+        # A failed store is only logged; the experiment stays pending for --resume
+        error = future.exception()
+        with self._progress_lock:
+            try:
+                if error is not None:
+                    logger.error("Sweep of run %d, experiment %d was not stored (%s); it will be rerun on --resume.",
+                                 index, experiment_number, error)
+                else:
+                    self.completed.add((index, experiment_number))
+                    self._save_progress()
+            finally:
+                self._recording -= 1
+                self._progress_lock.notify_all()
+
+    def _wait_recorded(self):
+        with self._progress_lock:
+            self._progress_lock.wait_for(lambda: self._recording == 0)
+
+    def run(self):
+        pending = list(self.experiments())
+        total = sum(run["repeats"] for run in self.runs)
+        logger.info("Recipe %s: %d of %d experiments to run.", self.recipe_path, len(pending), total)
+        if not pending:
+            return
+
+        # Each sweep is stored in the background while the next experiment runs and is
+        # counted as done from the pipeline's thread, even if this loop is interrupted
+        with ExperimentSession(shared_data) as session:
+            for index, experiment_number, run in pending:
+                if shared_data.terminate:
+                    logger.warning("Recipe stopped before run %d, experiment %d.", index, experiment_number)
+                    break
+                logger.info("Run %d: %s, %s ppm, Experiment %d...",
+                            index, run["chemical"], run["concentration"], experiment_number)
+                try:
+                    result = session.run(run["chemical"], run["concentration"], experiment_number,
+                                         phase_config=run["phases"])
+                except ExperimentAborted:
+                    logger.warning("Recipe stopped during run %d, experiment %d.", index, experiment_number)
+                    break
+                self._record_when_stored(index, experiment_number, result["persist_future"])
+
+        drain_default_pipeline()
+        self._wait_recorded()
+        logger.info("Recipe %s finished: %d of %d experiments completed.",
+                    self.recipe_path, len(self.completed), total)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a batch of experiments from a recipe file.")
+    parser.add_argument("recipe", help="JSON or YAML recipe file")
+    parser.add_argument("--resume", action="store_true", help="skip experiments already completed")
+    parser.add_argument("--progress", help="progress file (default: <recipe>.progress.json)")
+    args = parser.parse_args(argv)
+
+    runner = RecipeRunner(args.recipe, progress_path=args.progress, resume=args.resume)
+    try:
+        runner.run()
+    except KeyboardInterrupt:
+        logger.warning("Interrupted; rerun with --resume to continue.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+import os
+import json
+import threading
+import numpy as np
+from config import VNA_CONFIG, REFINEMENT_CONFIG
+from vna import acquire_vna_sweep, merge_segments
+from logger import setup_logger
+import logging
+
+logger = setup_logger(__name__, level=logging.INFO)
+
+
+def find_resonances(frequency, s11_real, s11_imag, count=REFINEMENT_CONFIG['max_resonances'],
+                    min_depth_db=REFINEMENT_CONFIG['min_depth_db']):
+    """Frequencies of the deepest local minima of |S11|, at least ``min_depth_db`` below its median."""
+    magnitude_db = 20 * np.log10(np.maximum(np.hypot(s11_real, s11_imag), 1e-12))
+    if magnitude_db.size < 3:
+        return np.empty(0)
+    inner = magnitude_db[1:-1]
+    candidates = np.flatnonzero((inner < magnitude_db[:-2]) & (inner <= magnitude_db[2:])) + 1
+    depth = np.median(magnitude_db) - magnitude_db[candidates]
+    candidates, depth = candidates[depth >= min_depth_db], depth[depth >= min_depth_db]
+    return np.asarray(frequency)[candidates[np.argsort(-depth)[:count]]]
+
+
+def refinement_windows(resonances, width, lower, upper):
+    """
+    Sorted, non-overlapping (start, stop) bands of ``width`` around each resonance.
+
+    Centres are snapped to a quarter of the width, so the sweep grid (and with it the
+    cached calibration and baseline for that grid) stays the same while a resonance
+    only drifts slightly.
+    """
+    step = width / 4
+    windows = []
+    for centre in np.unique(np.round(np.asarray(resonances, dtype=np.float64) / step) * step):
+        start, stop = max(lower, centre - width / 2), min(upper, centre + width / 2)
+        if stop <= start:
+            continue
+        if windows and start <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], stop))
+        else:
+            windows.append((start, stop))
+    return windows
+
+
+def dense_segments(windows, settings=REFINEMENT_CONFIG):
+    return [{'start_frequency': start, 'stop_frequency': stop, 'points': settings['dense_points'],
+             'ifbw': settings['dense_ifbw']} for start, stop in windows]
+
+
+def coarse_segments(windows, lower, upper, settings=REFINEMENT_CONFIG):
+    """Coarse bands covering what the windows leave out, at the coarse sweep's density."""
+    edges = [lower] + [edge for window in windows for edge in window] + [upper]
+    segments = []
+    for start, stop in zip(edges[::2], edges[1::2]):
+        if stop > start:
+            points = max(2, int(round(settings['coarse_points'] * (stop - start) / (upper - lower))))
+            segments.append({'start_frequency': start, 'stop_frequency': stop, 'points': points,
+                             'ifbw': settings['coarse_ifbw']})
+    return segments
+
+
+def stitch(coarse, refined, windows):
+    """Replace the coarse points inside ``windows`` with the dense sweep of those windows."""
+    frequency = coarse["frequency"]
+    outside = np.ones(frequency.size, dtype=bool)
+    for start, stop in windows:
+        outside &= (frequency < start) | (frequency > stop)
+    return merge_segments([refined, {key: values[outside] for key, values in coarse.items()}])
+
+
+class ResonanceCache:
+    """Last resonance frequencies per chemical, kept in memory and in a JSON file."""
+
+    def __init__(self, path=REFINEMENT_CONFIG['cache_file']):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path) as handle:
+                self._resonances = json.load(handle)
+        except FileNotFoundError:
+            self._resonances = {}
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable resonance cache %s: %s", path, e)
+            self._resonances = {}
+
+    def get(self, chemical):
+        return self._resonances.get(str(chemical))
+
+    def put(self, chemical, frequencies):
+        with self._lock:
+            self._resonances[str(chemical)] = [float(frequency) for frequency in frequencies]
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temporary = self.path + ".tmp"
+            with open(temporary, "w") as handle:
+                json.dump(self._resonances, handle, indent=2)
+            os.replace(temporary, self.path)
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def default_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ResonanceCache()
+        return _default_cache
+
+
+def acquire_adaptive_sweep(host='localhost', port=19542, chemical=None, learn=True, config=VNA_CONFIG,
+                           settings=REFINEMENT_CONFIG, cache=None):
+    """
+    Coarse sweep, then dense sweeps around the |S11| minima, stitched into one sweep.
+
+    If resonances for ``chemical`` are cached, the coarse detection pass is skipped:
+    the dense windows and the coarse bands between them are swept in one segmented
+    pass. With ``learn`` the minima found in the result replace the cached ones (blank
+    sweeps pass False so they do not overwrite a chemical's resonances).
+    """
+    cache = cache or default_cache()
+    lower, upper = config['start_frequency'], config['stop_frequency']
+    cached = cache.get(chemical) if chemical is not None else None
+
+    if cached:
+        windows = refinement_windows(cached, settings['window'], lower, upper)
+        logger.info("Refining %d cached resonance window(s) for %s.", len(windows), chemical)
+        segments = dense_segments(windows, settings) + coarse_segments(windows, lower, upper, settings)
+        s_parameters = acquire_vna_sweep(host, port, config={**config, 'segments': segments})
+    else:
+        coarse = acquire_vna_sweep(host, port, config={**config, 'segments': None, 'points': settings['coarse_points'],
+                                                       'ifbw': settings['coarse_ifbw']})
+        resonances = find_resonances(coarse["frequency"], coarse["s11_real"], coarse["s11_imag"],
+                                     settings['max_resonances'], settings['min_depth_db'])
+        windows = refinement_windows(resonances, settings['window'], lower, upper)
+        if not windows:
+            logger.info("No resonances found in the coarse sweep; keeping it as is.")
+            return coarse
+        logger.info("Refining %d resonance window(s) around %s Hz.", len(windows), ", ".join(f"{f:.4g}" for f in resonances))
+        refined = acquire_vna_sweep(host, port, config={**config, 'segments': dense_segments(windows, settings)})
+        s_parameters = stitch(coarse, refined, windows)
+
+    if learn and chemical is not None:
+        found = find_resonances(s_parameters["frequency"], s_parameters["s11_real"], s_parameters["s11_imag"],
+                                settings['max_resonances'], settings['min_depth_db'])
+        if found.size:
+            cache.put(chemical, found)
+    return s_parameters
@@ -0,0 +1,246 @@
+import os
+import sys
+import json
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from inference import feature_grid, sweep_features, split_sweeps
+from config import SIMILARITY_CONFIG
+from logger import setup_logger
+import logging
+
+logger = setup_logger(__name__, level=logging.INFO)
+
+# Rows of the index scored per matrix product, to bound memory on large archives
+SEARCH_BLOCK = 65536
+
+
+def spectral_vector(data, grid, frequency_column="Frequency (Hz)", real_column="S11 Real", imag_column="S11 Imaginary"):
+    """Complex S11 resampled onto ``grid`` as [real, imag], scaled to unit length (float32)."""
+    vector = sweep_features(data[frequency_column].to_numpy(),
+                            [data[real_column].to_numpy(), data[imag_column].to_numpy()], grid)
+    vector = np.nan_to_num(vector)
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm > 0 else vector).astype(np.float32)
+
+
+def top_k(queries, matrix, k):
+    """Indices and cosine scores of the ``k`` best rows of ``matrix`` for each query row."""
+    k = min(k, matrix.shape[0])
+    best_index = np.empty((queries.shape[0], 0), dtype=np.int64)
+    best_score = np.empty((queries.shape[0], 0), dtype=np.float32)
+    for start in range(0, matrix.shape[0], SEARCH_BLOCK):
+        scores = queries @ matrix[start:start + SEARCH_BLOCK].T
+        block_k = min(k, scores.shape[1])
+        part = np.argpartition(-scores, block_k - 1, axis=1)[:, :block_k]
+        best_index = np.hstack([best_index, part + start])
+        best_score = np.hstack([best_score, np.take_along_axis(scores, part, axis=1)])
+        if best_index.shape[1] > k:
+            keep = np.argpartition(-best_score, k - 1, axis=1)[:, :k]
+            best_index = np.take_along_axis(best_index, keep, axis=1)
+            best_score = np.take_along_axis(best_score, keep, axis=1)
+    order = np.argsort(-best_score, axis=1)
+    return np.take_along_axis(best_index, order, axis=1), np.take_along_axis(best_score, order, axis=1)
+
+
+class SpectralIndex:
+    """
+    Unit-length spectra of every processed sweep, searchable by cosine similarity.
+
+    Vectors are kept in one contiguous float32 matrix (grown by doubling) and appended
+    to ``<dir>/vectors.f32`` with their labels in ``<dir>/meta.jsonl``, so the index is
+    built incrementally as sweeps are processed and reloads without re-reading the
+    archive. ``fit_pca`` optionally reduces the vectors to their principal components
+    (searched in the reduced space); ``build_ivf`` adds an approximate inverted-file
+    index that only scores the rows in the ``probes`` clusters nearest each query.
+    """
+
+    def __init__(self, directory=SIMILARITY_CONFIG['dir'], points=SIMILARITY_CONFIG['points']):
+        self.directory = directory
+        self.grid = feature_grid(points)
+        self.dimension = 2 * points
+        self.meta = []
+        self._vectors = np.empty((0, self.dimension), dtype=np.float32)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.components = None      # PCA basis (dimension x components) and mean
+        self.pca_mean = None
+        self._reduced = None
+        self.centroids = None       # IVF coarse centroids and each row's list
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        if not os.path.exists(self._path("meta.jsonl")):
+            return
+        with open(self._path("meta.jsonl")) as handle:
+            meta = [json.loads(line) for line in handle if line.strip()]
+        vectors = np.fromfile(self._path("vectors.f32"), dtype=np.float32)
+        rows = min(len(meta), vectors.size // self.dimension)  # Ignore a partly written last entry
+        self.meta = meta[:rows]
+        self._vectors = vectors[:rows * self.dimension].reshape(rows, self.dimension).copy()
+        self._size = rows
+        if os.path.exists(self._path("pca.npz")):
+            with np.load(self._path("pca.npz")) as archive:
+                self._set_pca(archive["components"], archive["mean"])
+        if os.path.exists(self._path("ivf.npy")):
+            self._set_centroids(np.load(self._path("ivf.npy")))
+        logger.info("Loaded spectral index with %d sweep(s) from %s.", rows, self.directory)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def vectors(self):
+        return self._vectors[:self._size]
+
+    def add(self, data, frequency_column="Frequency (Hz)", real_column="S11 Real", imag_column="S11 Imaginary", **labels):
+        """Index one processed sweep; ``labels`` (chemical, concentration, ...) are returned with matches."""
+        vector = spectral_vector(data, self.grid, frequency_column, real_column, imag_column)
+        labels = {name: value.item() if isinstance(value, np.generic) else value for name, value in labels.items()}
+        with self._lock:
+            if self._size == self._vectors.shape[0]:
+                grown = np.empty((max(64, 2 * self._size), self.dimension), dtype=np.float32)
+                grown[:self._size] = self._vectors[:self._size]
+                self._vectors = grown
+            self._vectors[self._size] = vector
+            self._size += 1
+            self.meta.append(labels)
+            point = vector[np.newaxis]
+            if self.components is not None:
+                point = self._project(point)
+                self._reduced = np.vstack([self._reduced, point])
+            if self.centroids is not None:
+                self._assignments = np.append(self._assignments, self._nearest_centroids(point, 1)[:, 0])
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._path("vectors.f32"), "ab") as handle:
+                vector.tofile(handle)
+            with open(self._path("meta.jsonl"), "a") as handle:
+                handle.write(json.dumps(labels, default=str) + "\n")
+        return self._size - 1
+
+    def _set_pca(self, components, mean):
+        self.components = components.astype(np.float32)
+        self.pca_mean = mean.astype(np.float32)
+        self._reduced = self._project(self.vectors)
+
+    def _project(self, vectors):
+        reduced = (vectors - self.pca_mean) @ self.components
+        norms = np.linalg.norm(reduced, axis=1, keepdims=True)
+        return reduced / np.where(norms > 0, norms, 1)
+
+    def fit_pca(self, components):
+        """Search in the top ``components`` principal directions of the indexed spectra from now on."""
+        with self._lock:
+            mean = self.vectors.mean(axis=0)
+            _, _, basis = np.linalg.svd(self.vectors - mean, full_matrices=False)
+            self._set_pca(basis[:components].T, mean)
+            if self.centroids is not None:
+                self.centroids = None  # Centroids live in the old space; rebuild with build_ivf
+                os.remove(self._path("ivf.npy"))
+            os.makedirs(self.directory, exist_ok=True)
+            np.savez(self._path("pca.npz"), components=self.components, mean=self.pca_mean)
+        logger.info("Spectral index reduced to %d principal components.", components)
+
+    def _set_centroids(self, centroids):
+        self.centroids = centroids.astype(np.float32)
+        self._assignments = top_k(self._space(), self.centroids, 1)[0][:, 0].astype(np.int32)
+
+    def _space(self):
+        return self._reduced if self.components is not None else self.vectors
+
+    def _nearest_centroids(self, queries, count):
+        return top_k(queries, self.centroids, count)[0]
+
+    def build_ivf(self, lists, iterations=10, seed=0):
+        """Cluster the index into ``lists`` cells (spherical k-means) for approximate search."""
+        with self._lock:
+            space = self._space()
+            if len(space) == 0:
+                raise ValueError("Cannot build an approximate index over an empty index")
+            rng = np.random.default_rng(seed)
+            centroids = space[rng.choice(len(space), size=min(lists, len(space)), replace=False)].copy()
+            for _ in range(iterations):
+                assignments = top_k(space, centroids, 1)[0][:, 0]
+                for cell in range(len(centroids)):
+                    members = space[assignments == cell]
+                    if len(members):
+                        centre = members.sum(axis=0)
+                        centroids[cell] = centre / max(np.linalg.norm(centre), 1e-12)
+            self._set_centroids(centroids)
+            os.makedirs(self.directory, exist_ok=True)
+            np.save(self._path("ivf.npy"), centroids)
+        logger.info("Approximate index built with %d lists over %d sweep(s).", len(centroids), len(space))
+
+    def search(self, data, k=5, probes=SIMILARITY_CONFIG['ivf_probes'], **columns):
+        """The ``k`` most similar indexed sweeps to one processed sweep, as (labels, score) pairs."""
+        return self.search_vectors(spectral_vector(data, self.grid, **columns)[np.newaxis], k, probes)[0]
+
+    def search_vectors(self, queries, k=5, probes=SIMILARITY_CONFIG['ivf_probes']):
+        """Batched top-K over query vectors (rows from ``spectral_vector``); one result list per row."""
+        with self._lock:
+            space = self._space()
+            queries = np.asarray(queries, dtype=np.float32)
+            if self.components is not None:
+                queries = self._project(queries)
+            if not len(space):
+                return [[] for _ in queries]
+            if self.centroids is None:
+                indices, scores = top_k(queries, space, k)
+                return [[(self.meta[i], float(s)) for i, s in zip(row, row_scores)] for row, row_scores in zip(indices, scores)]
+            results = []
+            cells = self._nearest_centroids(queries, min(probes, len(self.centroids)))
+            for query, query_cells in zip(queries, cells):
+                candidates = np.flatnonzero(np.isin(self._assignments, query_cells))
+                indices, scores = top_k(query[np.newaxis], space[candidates], k)
+                results.append([(self.meta[candidates[i]], float(s)) for i, s in zip(indices[0], scores[0])])
+            return results
+
+
+def build_from_h5(h5_file, directory=SIMILARITY_CONFIG['dir']):
+    """Rebuild the index from every sweep of an HDF5 processed_data table."""
+    for name in ("vectors.f32", "meta.jsonl", "pca.npz", "ivf.npy"):
+        if os.path.exists(os.path.join(directory, name)):
+            os.remove(os.path.join(directory, name))
+    index = SpectralIndex(directory)
+    table = pd.read_hdf(h5_file, "processed_data")
+    for chemical, concentration, rows in split_sweeps(table):
+        index.add(rows, frequency_column="Frequency_(Hz)", real_column="S11_Real", imag_column="S11_Imaginary",
+                  chemical=chemical, concentration=concentration, experiment_number=rows["Experiment_Number"].iloc[0])
+    logger.info("Indexed %d sweep(s) from %s.", len(index), h5_file)
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query the spectral similarity index.")
+    parser.add_argument("--dir", default=SIMILARITY_CONFIG['dir'])
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="index every sweep in an HDF5 store")
+    build.add_argument("--h5", default="data/data.h5")
+    build.add_argument("--pca", type=int, default=0, help="principal components to search in (default: full spectra)")
+    build.add_argument("--ivf", type=int, default=0, help="lists of an approximate index (default: exact search)")
+    query = commands.add_parser("query", help="find the sweeps most similar to a raw sweep CSV")
+    query.add_argument("raw_csv")
+    query.add_argument("-k", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        index = build_from_h5(args.h5, args.dir)
+        if args.pca:
+            index.fit_pca(args.pca)
+        if args.ivf:
+            index.build_ivf(args.ivf)
+        return 0
+
+    index = SpectralIndex(args.dir)
+    for labels, score in index.search(pd.read_csv(args.raw_csv), args.k):
+        print(f"{score:.4f}  {json.dumps(labels, default=str)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
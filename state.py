@@ -0,0 +1,109 @@
+import threading
+from collections import namedtuple
+
+STATE_FIELDS = (
+    "flow",
+    "flow_rate_of_change",
+    "voltage",
+    "target_flow",
+    "elapsed_time",
+    "valve_mode",
+    "phase",
+    "terminate",
+)
+
+# Immutable, consistent view of a FlowCellState at one version
+StateSnapshot = namedtuple("StateSnapshot", STATE_FIELDS + ("version", "flow_samples"))
+
+
+class FlowCellState:
+    """
+    Live values shared between the GUI, the flow controller and the process functions.
+
+    Single-field reads are plain attribute reads and take no lock. Writes go through
+    ``update``, which applies all changes atomically, bumps ``version`` and wakes every
+    thread blocked in ``wait_for_change``/``wait_for``. ``snapshot`` returns a consistent
+    view of all fields. Each instance is independent, so one process can drive several
+    flow cells. Item access (``state["flow"]``) is kept for code written against the
+    old shared_data dict.
+    """
+
+    __slots__ = STATE_FIELDS + ("version", "flow_samples", "_initial", "_changed")
+
+    def __init__(self, flow=None, flow_rate_of_change=0.0, voltage=0, target_flow=0.0,
+                 elapsed_time=0, valve_mode="flush_flow", phase="idle", terminate=False):
+        self._initial = dict(
+            flow=flow, flow_rate_of_change=flow_rate_of_change, voltage=voltage, target_flow=target_flow,
+            elapsed_time=elapsed_time, valve_mode=valve_mode, phase=phase, terminate=terminate
+        )
+        self._changed = threading.Condition(threading.RLock())
+        self.version = 0
+        self.flow_samples = 0  # Incremented on every flow write so waiters can count samples
+        for field, value in self._initial.items():
+            object.__setattr__(self, field, value)
+
+    @property
+    def lock(self):
+        """Re-entrant lock guarding writes; hold it to group several updates."""
+        return self._changed
+
+    def update(self, expected_version=None, **changes):
+        """
+        Atomically apply ``changes`` and notify waiters.
+
+        If ``expected_version`` is given the write only happens when the state is still
+        at that version (compare-and-set); returns False if it was rejected.
+        """
+        unknown = set(changes) - set(STATE_FIELDS)
+        if unknown:
+            raise KeyError(f"Unknown state fields: {sorted(unknown)}")
+        with self._changed:
+            if expected_version is not None and expected_version != self.version:
+                return False
+            for field, value in changes.items():
+                object.__setattr__(self, field, value)
+            if "flow" in changes:
+                self.flow_samples += 1
+            self.version += 1
+            self._changed.notify_all()
+        return True
+
+    def snapshot(self):
+        with self._changed:
+            return StateSnapshot(*(getattr(self, field) for field in StateSnapshot._fields))
+
+    def wait_for_change(self, since_version, timeout=None):
+        """Block until ``version`` moves past ``since_version`` or ``timeout``; returns the current version."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != since_version, timeout)
+            return self.version
+
+    def wait_for(self, predicate, timeout=None):
+        """Block until ``predicate(snapshot)`` is true or ``timeout`` expires; returns the last predicate result."""
+        with self._changed:
+            return self._changed.wait_for(lambda: predicate(self.snapshot()), timeout)
+
+    def reset(self):
+        """Restore the values the state was created with."""
+        self.update(**self._initial)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in STATE_FIELDS else default
+
+    def __getitem__(self, key):
+        if key not in STATE_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        self.update(**{key: value})
+
+    def __setattr__(self, name, value):
+        if name in STATE_FIELDS:
+            self.update(**{name: value})
+        else:
+            object.__setattr__(self, name, value)
+
+    def __repr__(self):
+        fields = ", ".join(f"{field}={getattr(self, field)!r}" for field in STATE_FIELDS)
+        return f"FlowCellState({fields}, version={self.version})"
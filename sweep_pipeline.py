@@ -0,0 +1,163 @@
+import os
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+import numpy as np
+import pandas as pd
+from processing_manager import ProcessingManager
+from instrumentation import span
+from logger import setup_logger
+import logging
+
+logger = setup_logger(__name__, level=logging.INFO)
+
+RAW_COLUMNS = [
+    ("S11 Real", "s11_real"), ("S11 Imaginary", "s11_imag"),
+    ("S21 Real", "s21_real"), ("S21 Imaginary", "s21_imag"),
+    ("S12 Real", "s12_real"), ("S12 Imaginary", "s12_imag"),
+    ("S22 Real", "s22_real"), ("S22 Imaginary", "s22_imag"),
+]
+
+
+def _csv_scalar(value):
+    """Type a label the way pandas.read_csv would infer it from the raw CSV."""
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            pass
+    return value
+
+
+def sweep_to_dataframe(s_parameters, chemical, concentration, experiment_number):
+    """Build the raw sweep table (same columns as the Raw_datalog CSVs) from in-memory arrays."""
+    frequency = np.asarray(s_parameters["frequency"])
+    columns = {
+        "Chemical": _csv_scalar(chemical),
+        "Concentration": _csv_scalar(concentration),
+        "Experiment Number": _csv_scalar(experiment_number),
+        "Frequency (Hz)": frequency,
+    }
+    for column, key in RAW_COLUMNS:
+        columns[column] = s_parameters.get(key, np.full(frequency.shape, np.nan))
+    return pd.DataFrame(columns)
+
+
+def persist_sweep(s_parameters, chemical, concentration, experiment_number, raw_data_filename, manager, flow_stats=None):
+    """
+    Write the raw sweep CSV, then preprocess it and append it to the processed stores.
+
+    ``flow_stats`` describes the flow during the sweep and feeds the quality checks.
+    """
+    raw_data = sweep_to_dataframe(s_parameters, chemical, concentration, experiment_number)
+
+    os.makedirs(os.path.dirname(raw_data_filename) or ".", exist_ok=True)
+    logger.info("Saving raw data to %s...", raw_data_filename)
+    with span("pipeline.raw_csv_write"):
+        raw_data.to_csv(raw_data_filename, index=False)
+    logger.info("Raw data saved successfully.")
+
+    manager.process_and_save(raw_data, flow_stats)
+    logger.info("Data preprocessing completed and saved successfully.")
+    return raw_data_filename
+
+
+class SweepPipeline:
+    """
+    Saves and processes sweeps on a single background worker.
+
+    Sweeps are handled strictly in submission order (one worker), so CSV and HDF5
+    appends never interleave. The ProcessingManager and its baseline are created once,
+    on the worker, the first time a sweep arrives.
+    """
+
+    def __init__(self, baseline_file="baseline.csv", processed_dir="processed_data", h5_file="data/data.h5",
+                 name="sweep-pipeline", **manager_options):
+        # manager_options (calibration_dir, baseline_dir) are passed on to ProcessingManager
+        self._manager_args = dict(baseline_file=baseline_file, processed_dir=processed_dir, h5_file=h5_file,
+                                  **manager_options)
+        self._manager = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    @property
+    def manager(self):
+        if self._manager is None:
+            self._manager = ProcessingManager(**self._manager_args)
+        return self._manager
+
+    def _persist(self, s_parameters, chemical, concentration, experiment_number, raw_data_filename, flow_stats=None):
+        try:
+            return persist_sweep(s_parameters, chemical, concentration, experiment_number, raw_data_filename, self.manager,
+                                 flow_stats)
+        except Exception as e:
+            logger.error("Failed to persist sweep %s: %s", raw_data_filename, e)
+            raise
+
+    def submit(self, s_parameters, chemical, concentration, experiment_number, raw_data_filename, flow_stats=None):
+        """Queue a sweep for saving and processing; returns a Future resolving to the raw CSV path."""
+        future = self._executor.submit(
+            self._persist, s_parameters, chemical, concentration, experiment_number, raw_data_filename, flow_stats
+        )
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._discard)
+        return future
+
+    def _capture_baseline(self, s_parameters):
+        try:
+            self.manager.capture_baseline(sweep_to_dataframe(s_parameters, "Blank", 0, 0))
+        except Exception as e:
+            logger.error("Failed to capture blank sweep: %s", e)
+            raise
+
+    def submit_baseline(self, s_parameters):
+        """Queue a blank-solvent sweep for the rolling baseline; applies to sweeps submitted after it."""
+        future = self._executor.submit(self._capture_baseline, s_parameters)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._discard)
+        return future
+
+    def _discard(self, future):
+        with self._lock:
+            self._pending.discard(future)
+
+    @property
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def drain(self, timeout=None):
+        """Wait for every queued sweep to be persisted; returns True if none are left."""
+        with self._lock:
+            pending = list(self._pending)
+        if pending:
+            logger.info("Waiting for %d queued sweep(s) to be saved...", len(pending))
+        _, not_done = wait(pending, timeout=timeout)
+        return not not_done
+
+    def shutdown(self):
+        """Drain the queue and stop the worker."""
+        self.drain()
+        self._executor.shutdown(wait=True)
+
+
+_default_pipeline = None
+_default_lock = threading.Lock()
+
+
+def default_pipeline():
+    """Process-wide pipeline; it is drained at interpreter exit so no sweep is lost."""
+    global _default_pipeline
+    with _default_lock:
+        if _default_pipeline is None:
+            _default_pipeline = SweepPipeline()
+            atexit.register(_default_pipeline.shutdown)
+        return _default_pipeline
+
+
+def drain_default_pipeline(timeout=None):
+    """Wait for the default pipeline's queued sweeps, if it was ever started."""
+    return _default_pipeline.drain(timeout) if _default_pipeline is not None else True
@@ -0,0 +1,146 @@
+"""
+Binary flow/voltage telemetry recorder.
+
+Each experiment gets one ``.tlm`` file next to its raw sweep CSV. The file is a
+small JSON header followed by fixed-size little-endian records, written in chunks
+from a preallocated columnar buffer:
+
+    b"TLM1" | uint32 header length | JSON header | record * N
+
+Use ``load_telemetry`` to read a file back as NumPy arrays.
+"""
+import os
+import json
+import struct
+import threading
+import numpy as np
+from logger import setup_logger
+import logging
+
+logger = setup_logger(__name__, level=logging.INFO)
+
+MAGIC = b"TLM1"
+HEADER_PREFIX = struct.Struct("<4sI")
+
+RECORD_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("target_flow", "<f4"),
+    ("flow", "<f4"),
+    ("voltage", "<f4"),
+    ("valve_mode", "u1"),
+    ("phase", "u1"),
+])
+
+VALVE_MODES = ("flush_flow", "homogenization_flow", "sample_flow")
+PHASES = ("idle", "flush", "homogenization", "sample")
+UNKNOWN_CODE = 255
+
+_VALVE_CODES = {name: code for code, name in enumerate(VALVE_MODES)}
+_PHASE_CODES = {name: code for code, name in enumerate(PHASES)}
+
+
+def telemetry_path_for(raw_data_filename):
+    """Telemetry file that belongs to a raw sweep CSV (same stem, ``.tlm`` extension)."""
+    return os.path.splitext(raw_data_filename)[0] + ".tlm"
+
+
+class TelemetryRecorder:
+    """Buffers control-loop samples in preallocated columns and flushes them in chunks."""
+
+    def __init__(self, path, raw_data_filename=None, chunk_size=256, metadata=None):
+        self.path = path
+        self.chunk_size = int(chunk_size)
+        self._buffer = np.zeros(self.chunk_size, dtype=RECORD_DTYPE)
+        self._columns = {name: self._buffer[name] for name in RECORD_DTYPE.names}
+        self._size = 0
+        self.records_written = 0
+        self._lock = threading.Lock()
+
+        header = {
+            "version": 1,
+            "dtype": [[name, RECORD_DTYPE[name].str] for name in RECORD_DTYPE.names],
+            "valve_modes": list(VALVE_MODES),
+            "phases": list(PHASES),
+            "raw_data_filename": raw_data_filename,
+            "metadata": metadata or {},
+        }
+        header_bytes = json.dumps(header).encode()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "wb")
+        self._file.write(HEADER_PREFIX.pack(MAGIC, len(header_bytes)))
+        self._file.write(header_bytes)
+        logger.info("Recording telemetry to %s.", path)
+
+    def record(self, timestamp, target_flow, flow, voltage, valve_mode, phase):
+        """Add one sample; the chunk is written to disk when the buffer is full."""
+        with self._lock:
+            if self._file is None:
+                return
+            i = self._size
+            columns = self._columns
+            columns["timestamp"][i] = timestamp
+            columns["target_flow"][i] = target_flow
+            columns["flow"][i] = np.nan if flow is None else flow
+            columns["voltage"][i] = voltage
+            columns["valve_mode"][i] = _VALVE_CODES.get(valve_mode, UNKNOWN_CODE)
+            columns["phase"][i] = _PHASE_CODES.get(phase, UNKNOWN_CODE)
+            self._size = i + 1
+            if self._size == self.chunk_size:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if self._size:
+            self._file.write(self._buffer[:self._size].tobytes())
+            self.records_written += self._size
+            self._size = 0
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._flush_locked()
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._flush_locked()
+            self._file.close()
+            self._file = None
+        logger.info("Telemetry closed with %s records in %s.", self.records_written, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_telemetry_header(path):
+    with open(path, "rb") as f:
+        magic, header_length = HEADER_PREFIX.unpack(f.read(HEADER_PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a telemetry file.")
+        header = json.loads(f.read(header_length))
+    return header, HEADER_PREFIX.size + header_length
+
+
+def load_telemetry(path, decode=False):
+    """
+    Load a telemetry file as a dict of NumPy arrays keyed by column name.
+
+    With ``decode=True`` the ``valve_mode`` and ``phase`` columns are returned as
+    string arrays instead of integer codes. The header is returned under ``"header"``.
+    """
+    header, offset = read_telemetry_header(path)
+    dtype = np.dtype([tuple(field) for field in header["dtype"]])
+    records = np.fromfile(path, dtype=dtype, offset=offset)
+
+    data = {name: records[name] for name in dtype.names}
+    if decode:
+        for column, names in (("valve_mode", header["valve_modes"]), ("phase", header["phases"])):
+            lookup = np.array(list(names) + ["unknown"] * (UNKNOWN_CODE + 1 - len(names)))
+            data[column] = lookup[data[column]]
+    data["header"] = header
+    return data
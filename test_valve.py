@@ -36,6 +36,6 @@ if __name__ == "__main__":
     try:
         main()
     except Exception as e:
-        logger.error(f"Error occurred: {e}")
+        logger.error("Error occurred: %s", e)
     finally:
         logger.debug("Test completed.")
@@ -1,19 +1,19 @@
-import Jetson.GPIO as GPIO
 import time
-from smbus2 import SMBus
 from pump import run_sequence
-from logger import setup_logger
+from logger import setup_logger, setup_hot_path_logger
+from hardware import gpio as GPIO
+from config import VALVE_CONFIG
 import logging
 
 logger = setup_logger(__name__, level=logging.INFO)
+# control_valve_mode runs every control iteration, so its debug trail is rate limited
+hot_logger = setup_hot_path_logger(__name__)
 
 # GPIO setup
-gpio_pin_1 = 15  # Valve 1
-gpio_pin_2 = 13  # Valve 2
+gpio_pin_1, gpio_pin_2 = VALVE_CONFIG['pins']  # Valve 1, Valve 2
 
-GPIO.setmode(GPIO.BOARD)
-GPIO.setup(gpio_pin_1, GPIO.OUT)
-GPIO.setup(gpio_pin_2, GPIO.OUT)
+# Pins are configured lazily on the first GPIO call, not at import
+GPIO.register_outputs(gpio_pin_1, gpio_pin_2)
 
 # Variable to hold the valve state
 valve_state = {
@@ -26,56 +26,59 @@ def update_valve_state(valve_1_state, valve_2_state):
     valve_state['valve_1'] = 'HIGH' if valve_1_state else 'LOW'
     valve_state['valve_2'] = 'HIGH' if valve_2_state else 'LOW'
     
-    logger.debug(f"Valve 1 (Pin 1): {valve_state['valve_1']}, Valve 2 (Pin 2): {valve_state['valve_2']}")
+    hot_logger.debug("Valve 1 (Pin 1): %s, Valve 2 (Pin 2): %s", valve_state['valve_1'], valve_state['valve_2'])
 
-def sample_flow():
+def sample_flow(pins=None):
     """Activate valve configuration for sampling flow."""
-    logger.debug("Switching to sample flow...")
-    GPIO.output(gpio_pin_1, GPIO.HIGH)
-    GPIO.output(gpio_pin_2, GPIO.LOW)
+    pin_1, pin_2 = pins or (gpio_pin_1, gpio_pin_2)
+    hot_logger.debug("Switching to sample flow...")
+    GPIO.output(pin_1, GPIO.HIGH)
+    GPIO.output(pin_2, GPIO.LOW)
     update_valve_state(GPIO.HIGH, GPIO.LOW)
-    logger.debug("Switched to sample flow")
+    hot_logger.debug("Switched to sample flow")
 
-def flush_flow():
+def flush_flow(pins=None):
     """Activate valve configuration for cleaning flow."""
-    logger.debug("Switching to clean flow...")
-    GPIO.output(gpio_pin_1, GPIO.LOW)
-    GPIO.output(gpio_pin_2, GPIO.HIGH)
+    pin_1, pin_2 = pins or (gpio_pin_1, gpio_pin_2)
+    hot_logger.debug("Switching to clean flow...")
+    GPIO.output(pin_1, GPIO.LOW)
+    GPIO.output(pin_2, GPIO.HIGH)
     update_valve_state(GPIO.LOW, GPIO.HIGH)
-    logger.debug("Switched to flush flow")
+    hot_logger.debug("Switched to flush flow")
 
-def homogenization_flow():
+def homogenization_flow(pins=None):
     """Activate valve configuration for homogenization flow."""
-    logger.debug("Switching to homogenization flow...")
-    GPIO.output(gpio_pin_1, GPIO.LOW)
-    GPIO.output(gpio_pin_2, GPIO.LOW)
+    pin_1, pin_2 = pins or (gpio_pin_1, gpio_pin_2)
+    hot_logger.debug("Switching to homogenization flow...")
+    GPIO.output(pin_1, GPIO.LOW)
+    GPIO.output(pin_2, GPIO.LOW)
     update_valve_state(GPIO.LOW, GPIO.LOW)
-    logger.debug("Switched to homogenization flow")
+    hot_logger.debug("Switched to homogenization flow")
 
-def control_valve_mode(valve_mode):
-    """Control valves based on the valve mode."""
-    logger.debug(f"Controlling valve mode: {valve_mode}")
+def control_valve_mode(valve_mode, pins=None):
+    """Control valves based on the valve mode; ``pins`` selects another channel's valve pair."""
+    hot_logger.debug("Controlling valve mode: %s", valve_mode)
     try:
         if valve_mode == "sample_flow":
-            sample_flow()
+            sample_flow(pins)
         elif valve_mode == "flush_flow":
-            flush_flow()
+            flush_flow(pins)
         elif valve_mode == "homogenization_flow":
-            homogenization_flow()
+            homogenization_flow(pins)
         else:
-            logger.error(f"Unknown valve mode: {valve_mode}")
+            logger.error("Unknown valve mode: %s", valve_mode)
     except Exception as e:
-        logger.error(f"Error controlling valve mode {valve_mode}: {e}")
+        logger.error("Error controlling valve mode %s: %s", valve_mode, e)
 
 def individual_valve_test(valve, interval):
     """Toggles valve state individually for debug."""
-    logger.debug(f"Testing valve {valve} with interval {interval}s")
+    logger.debug("Testing valve %s with interval %ss", valve, interval)
     GPIO.output(valve, GPIO.LOW)
     if valve == gpio_pin_1:
         update_valve_state(GPIO.LOW, valve_state['valve_2'])
     else:
         update_valve_state(valve_state['valve_1'], GPIO.LOW)
-    logger.debug(f"Valve {valve}: off")
+    logger.debug("Valve %s: off", valve)
     time.sleep(interval)
     
     GPIO.output(valve, GPIO.HIGH)
@@ -83,7 +86,7 @@ def individual_valve_test(valve, interval):
         update_valve_state(GPIO.HIGH, valve_state['valve_2'])
     else:
         update_valve_state(valve_state['valve_1'], GPIO.HIGH)
-    logger.debug(f"Valve {valve}: on")
+    logger.debug("Valve %s: on", valve)
     time.sleep(interval)
 
 def test_pin_32():
@@ -111,7 +114,7 @@ def test_valve_mode(valve_mode_function):
             print("flow finised")
 
     except Exception as e:
-        logger.error(f"Error during valve mode test: {e}")
+        logger.error("Error during valve mode test: %s", e)
 '''      
 
 def main():
@@ -133,7 +136,7 @@ if __name__ == "__main__":
     except Exception as e:
         GPIO.cleanup()
         logger.debug("GPIO cleanup done.")
-        logger.error(f"Error occurred: {e}")
+        logger.error("Error occurred: %s", e)
     finally:
         logger.debug("GPIO cleanup done.")
         logger.debug("Process complete.")
@@ -1,17 +1,130 @@
 import socket
-import os
-import csv
 import time
 import numpy as np
-import pandas as pd
-from config import VNA_CONFIG
+from config import VNA_CONFIG, REFINEMENT_CONFIG
+from instrumentation import span, count
 from logger import setup_logger
 import logging
 from datetime import datetime
-from processing_manager import ProcessingManager
 
 logger = setup_logger(__name__, level=logging.INFO)
 
+# Traces in the order they are fetched; the first one fetched also supplies the frequencies
+TRACES = ("S21", "S11", "S12", "S22")
+
+
+def parse_trace_data(data, is_first_trace=True):
+    """Parse a ``VNA:TRACe:DATA?`` response into arrays (frequency too if ``is_first_trace``)."""
+    data = data.strip("[]").split("],[")
+    logger.debug("Raw data received: %s...", data[:5])
+    if not data:
+        raise ValueError("Trace data is empty or invalid.")
+    parsed_points = [list(map(float, point.split(","))) for point in data]
+    if is_first_trace:
+        freq, real, imag = zip(*parsed_points)
+        return np.array(freq), np.array(real), np.array(imag)
+    else:
+        _, real, imag = zip(*parsed_points)
+        return np.array(real), np.array(imag)
+
+
+def selected_traces(collect_s21=True, collect_s11=True, collect_s12=True, collect_s22=True):
+    selected = {"S21": collect_s21, "S11": collect_s11, "S12": collect_s12, "S22": collect_s22}
+    return [trace for trace in TRACES if selected[trace]]
+
+
+def add_trace(result, trace, data):
+    """Parse one trace response into ``result`` (frequency comes from the first trace added)."""
+    key = trace.lower()
+    if "frequency" not in result:
+        result["frequency"], real, imag = parse_trace_data(data, is_first_trace=True)
+    else:
+        real, imag = parse_trace_data(data, is_first_trace=False)
+    result.update({f"{key}_real": real, f"{key}_imag": imag})
+
+
+def sweep_setup_commands(config=VNA_CONFIG):
+    """SCPI commands that configure a sweep from VNA_CONFIG."""
+    return [
+        f"VNA:ACQuisition:IFBW {config['ifbw']}",
+        f"VNA:ACQuisition:POINTS {config['points']}",
+        f"VNA:FREQuency:START {config['start_frequency']}",
+        f"VNA:FREQuency:STOP {config['stop_frequency']}",
+    ]
+
+
+def sweep_segments(config=VNA_CONFIG):
+    """
+    Sub-bands making up one logical sweep.
+
+    ``config['segments']`` is a list of dicts with their own ``start_frequency``,
+    ``stop_frequency``, ``points`` and ``ifbw`` (missing keys fall back to the main
+    config); without it the whole band is one segment.
+    """
+    segments = config.get('segments')
+    if not segments:
+        return [config]
+    return [{**config, **segment} for segment in segments]
+
+
+def merge_segments(parts):
+    """
+    Join per-segment S-parameter dicts into one sweep on a sorted, non-uniform grid.
+
+    A frequency measured by more than one segment is kept once, from the segment
+    listed first.
+    """
+    if len(parts) == 1:
+        return parts[0]
+    merged = {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+    order = np.argsort(merged["frequency"], kind="stable")
+    frequency = merged["frequency"][order]
+    keep = np.ones(frequency.size, dtype=bool)
+    keep[1:] = np.diff(frequency) > 0
+    order = order[keep]
+    return {key: values[order] for key, values in merged.items()}
+
+
+class SweepAverager:
+    """
+    Streaming complex mean and variance per point (Welford) over repeated sweeps of one grid.
+
+    ``add`` folds in an S-parameter dict as it arrives, vectorized across points, so no
+    sweep is kept; ``result`` returns the averaged sweep in the same form, plus
+    ``<trace>_var``: the sample variance E|z - mean|^2 of a single sweep at each point.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.frequency = None
+        self._mean = {}
+        self._m2 = {}
+
+    def add(self, s_parameters):
+        frequency = np.asarray(s_parameters["frequency"])
+        if self.frequency is None:
+            self.frequency = frequency
+        elif not np.array_equal(frequency, self.frequency):
+            raise ValueError("Sweeps to average must share one frequency grid.")
+        self.count += 1
+        for key in (name[:-len("_real")] for name in s_parameters if name.endswith("_real")):
+            value = np.asarray(s_parameters[f"{key}_real"]) + 1j * np.asarray(s_parameters[f"{key}_imag"])
+            if self.count == 1:
+                self._mean[key] = value.astype(np.complex128)
+                self._m2[key] = np.zeros(value.shape)
+                continue
+            delta = value - self._mean[key]
+            self._mean[key] += delta / self.count
+            self._m2[key] += (delta * np.conj(value - self._mean[key])).real
+
+    def result(self):
+        result = {"frequency": self.frequency}
+        for key, mean in self._mean.items():
+            result[f"{key}_real"], result[f"{key}_imag"] = mean.real, mean.imag
+            result[f"{key}_var"] = self._m2[key] / (self.count - 1) if self.count > 1 else np.zeros(mean.shape)
+        return result
+
+
 class SocketStreamReader:
     def __init__(self, sock):
         self._sock = sock
@@ -63,72 +176,35 @@ class libreVNA:
         self.reader = SocketStreamReader(self.sock)
 
     def send_command(self, command):
-        logger.debug(f"Sending command: {command}")
+        logger.debug("Sending command: %s", command)
         self.sock.sendall(command.encode())
         self.sock.send(b"\n")
     
     def send_query(self, query, timeout=None):
         timeout = timeout or self.fetch_timeout
-        logger.debug(f"Sending query: {query}")
+        logger.debug("Sending query: %s", query)
         self.sock.sendall(query.encode())
         self.sock.send(b"\n")
         response = self.reader.readline(timeout=timeout).decode().rstrip()
         if not response:
             raise ValueError(f"Received empty response for query: {query}")
-        logger.debug(f"Received response: {response}")
+        logger.debug("Received response: %s", response)
         return response
 
     def fetch_s_parameters(self, collect_s21=True, collect_s11=True, collect_s12=True, collect_s22=True):
         logger.info("Fetching selected S-parameter data...")
         try:
             result = {}
-            frequency = None
-
-            def parse_trace_data(data, is_first_trace=True):
-                data = data.strip("[]").split("],[")
-                logger.debug(f"Raw data received: {data[:5]}...")
-                if not data:
-                    raise ValueError("Trace data is empty or invalid.")
-                parsed_points = [list(map(float, point.split(","))) for point in data]
-                if is_first_trace:
-                    freq, real, imag = zip(*parsed_points)
-                    return np.array(freq), np.array(real), np.array(imag)
-                else:
-                    _, real, imag = zip(*parsed_points)
-                    return np.array(real), np.array(imag)
-
-            if collect_s21:
-                logger.info("Collecting S21 data...")
-                s21_data = self.send_query("VNA:TRACe:DATA? S21")
-                if frequency is None:
-                    frequency, s21_real, s21_imag = parse_trace_data(s21_data, is_first_trace=True)
-                    result["frequency"] = frequency
-                else:
-                    s21_real, s21_imag = parse_trace_data(s21_data)
-                result.update({"s21_real": s21_real, "s21_imag": s21_imag})
-
-            if collect_s11:
-                logger.info("Collecting S11 data...")
-                s11_data = self.send_query("VNA:TRACe:DATA? S11")
-                s11_real, s11_imag = parse_trace_data(s11_data, is_first_trace=False)
-                result.update({"s11_real": s11_real, "s11_imag": s11_imag})
-
-            if collect_s12:
-                logger.info("Collecting S12 data...")
-                s12_data = self.send_query("VNA:TRACe:DATA? S12")
-                s12_real, s12_imag = parse_trace_data(s12_data, is_first_trace=False)
-                result.update({"s12_real": s12_real, "s12_imag": s12_imag})
-
-            if collect_s22:
-                logger.info("Collecting S22 data...")
-                s22_data = self.send_query("VNA:TRACe:DATA? S22")
-                s22_real, s22_imag = parse_trace_data(s22_data, is_first_trace=False)
-                result.update({"s22_real": s22_real, "s22_imag": s22_imag})
-
+            for trace in selected_traces(collect_s21, collect_s11, collect_s12, collect_s22):
+                logger.info("Collecting %s data...", trace)
+                with span("vna.trace_fetch"):
+                    response = self.send_query(f"VNA:TRACe:DATA? {trace}")
+                with span("vna.trace_parse"):
+                    add_trace(result, trace, response)
             return result
 
         except Exception as e:
-            logger.error(f"An error occurred while fetching S-parameters: {e}")
+            logger.error("An error occurred while fetching S-parameters: %s", e)
             logger.debug("Full traceback:", exc_info=True)
             raise
 
@@ -147,93 +223,141 @@ def wait_for_sweep_completion(vna, poll_interval=1):
                 logger.info("Sweep completed successfully.")
                 return
         except TimeoutError as e:
-            logger.warning(f"Timeout while polling sweep completion: {e}")
+            logger.warning("Timeout while polling sweep completion: %s", e)
         except Exception as e:
-            logger.error(f"Unexpected error while polling sweep completion: {e}")
+            logger.error("Unexpected error while polling sweep completion: %s", e)
             raise
         time.sleep(poll_interval)
 
 
 def fetch_s_parameters_with_delay(vna, delay=2):
-    logger.info(f"Waiting {delay} seconds post-sweep to fetch data...")
-    time.sleep(delay)
+    logger.info("Waiting %s seconds post-sweep to fetch data...", delay)
+    with span("vna.post_sweep_delay"):
+        time.sleep(delay)
     return vna.fetch_s_parameters()
 
 
-def run_vna_sweep(chemical, concentration, experiment_number):
+def raw_datalog_path(chemical, concentration, experiment_number, timestamp=None, base_dir="Raw_datalog"):
+    """Path of the raw sweep CSV for an experiment; other per-experiment files share its stem."""
+    timestamp = timestamp or datetime.now()
+    return (
+        f"{base_dir}/{timestamp.strftime('%Y-%m-%d_%H-%M-%S')}_chem_{chemical}_conc_{concentration}_exp_{experiment_number}.csv"
+    )
+
+
+def acquire_vna_sweep(host='localhost', port=19542, config=VNA_CONFIG, fetch_delay=0):
+    """
+    Configure the VNA, run one sweep and return the S-parameters; nothing is written to disk.
+
+    A segmented config (see sweep_segments) is swept band by band on one connection
+    and returned merged, like a single sweep. With ``config['averages']`` K > 1 each
+    band is swept K times and averaged point by point (SweepAverager), and the result
+    also carries the per-point variance as ``<trace>_var``. Every fetch follows an
+    *OPC? that confirmed the sweep finished, so traces are read straight away;
+    ``fetch_delay`` adds a wait before each fetch, only for an instrument whose *OPC?
+    answers before its traces are readable.
+    """
+    vna = None
+    averages = max(1, int(config.get('averages', 1)))
     try:
         logger.info("Attempting to connect to LibreVNA...")
-        vna = libreVNA(host='localhost', port=19542, fetch_timeout=30)
+        vna = libreVNA(host=host, port=port, fetch_timeout=30)
         logger.info("Connected to LibreVNA.")
 
-        # Configure VNA
-        vna.send_command(f"VNA:ACQuisition:IFBW {VNA_CONFIG['ifbw']}")
-        vna.send_command(f"VNA:ACQuisition:POINTS {VNA_CONFIG['points']}")
-        vna.send_command(f"VNA:FREQuency:START {VNA_CONFIG['start_frequency']}")
-        vna.send_command(f"VNA:FREQuency:STOP {VNA_CONFIG['stop_frequency']}")
-
-        # Start Sweep
-        logger.info("Starting sweep...")
-        vna.send_command("VNA:ACQuisition:RUN")
-        wait_for_sweep_completion(vna)
-
-        # Fetch S-parameters
-        s_parameters = fetch_s_parameters_with_delay(vna, delay=2)
-
-        # Save raw data to the Raw_datalog folder
-        if not os.path.exists('Raw_datalog'):
-            os.makedirs('Raw_datalog')
-
-        raw_data_filename = (
-            f"Raw_datalog/{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_chem_{chemical}_conc_{concentration}_exp_{experiment_number}.csv"
-        )
-        logger.info(f"Saving raw data to {raw_data_filename}...")
-
-        with open(raw_data_filename, 'w', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            # Include chemical, concentration, and experiment number in headers
-            writer.writerow([
-                "Chemical", "Concentration", "Experiment Number", "Frequency (Hz)",
-                "S11 Real", "S11 Imaginary", "S21 Real", "S21 Imaginary",
-                "S12 Real", "S12 Imaginary", "S22 Real", "S22 Imaginary"
-            ])
-            for i in range(len(s_parameters["frequency"])):
-                row = [
-                    chemical, concentration, experiment_number, s_parameters["frequency"][i],
-                    s_parameters.get("s11_real", [None])[i],
-                    s_parameters.get("s11_imag", [None])[i],
-                    s_parameters.get("s21_real", [None])[i],
-                    s_parameters.get("s21_imag", [None])[i],
-                    s_parameters.get("s12_real", [None])[i],
-                    s_parameters.get("s12_imag", [None])[i],
-                    s_parameters.get("s22_real", [None])[i],
-                    s_parameters.get("s22_imag", [None])[i],
-                ]
-                writer.writerow(row)
-
-        logger.info("Raw data saved successfully.")
-
-        # Load raw data into a DataFrame
-        raw_data = pd.read_csv(raw_data_filename)
-
-        # Initialize the ProcessingManager
-        manager = ProcessingManager(
-            baseline_file="baseline.csv",
-            processed_dir="processed_data",
-            h5_file="data/data.h5"
-        )
-
-        # Preprocess and save the data
-        manager.process_and_save(raw_data)
-
-        logger.info("Data preprocessing completed and saved successfully.")
-        return s_parameters
+        parts = []
+        for segment in sweep_segments(config):
+            # Configure VNA
+            for command in sweep_setup_commands(segment):
+                vna.send_command(command)
+
+            averager = SweepAverager()
+            for _ in range(averages):
+                # Start Sweep
+                logger.info("Starting sweep of %.4g-%.4g Hz...", segment['start_frequency'], segment['stop_frequency'])
+                vna.send_command("VNA:ACQuisition:RUN")
+                with span("vna.opc_wait"):
+                    wait_for_sweep_completion(vna)
+                count("vna.sweeps")
+
+                # Fetch S-parameters
+                if fetch_delay:
+                    s_parameters = fetch_s_parameters_with_delay(vna, delay=fetch_delay)
+                else:
+                    s_parameters = vna.fetch_s_parameters()
+                if averages == 1:
+                    break
+                averager.add(s_parameters)
+            parts.append(averager.result() if averages > 1 else s_parameters)
+        return merge_segments(parts)
 
     except Exception as e:
-        logger.error(f"An error occurred: {e}")
+        logger.error("An error occurred: %s", e)
         raise e
 
     finally:
-        if 'vna' in locals():
+        if vna is not None:
             vna.close()
-            logger.info("VNA connection closed.")
\ No newline at end of file
+
+
+def acquire_sample_sweep(endpoint=None, chemical=None, learn=True, config=VNA_CONFIG):
+    """One sweep for ``chemical``: adaptive (see refinement.py) if enabled in REFINEMENT_CONFIG, else fixed."""
+    if not REFINEMENT_CONFIG['enabled']:
+        return acquire_vna_sweep(*(endpoint or ()), config=config)
+    from refinement import acquire_adaptive_sweep
+
+    return acquire_adaptive_sweep(*(endpoint or ()), chemical=chemical, learn=learn, config=config)
+
+
+def start_vna_sweep(chemical, concentration, experiment_number, raw_data_filename=None, pipeline=None, endpoint=None,
+                    flow=None, config=VNA_CONFIG):
+    """
+    Acquire a sweep and hand it to the background sweep pipeline.
+
+    ``endpoint`` is the (host, port) of the VNA to use, for setups with several. With
+    ``flow`` (a running FlowAcquisition) the flow statistics during the sweep are
+    passed on for the quality checks. ``config`` overrides VNA_CONFIG (e.g. averages).
+    Returns ``(s_parameters, future)`` as soon as the data is in memory; the future
+    completes once the raw CSV is written and the data is processed and stored.
+    """
+    # Processing stack (pandas, feature engineering) is only loaded once a sweep is taken
+    from sweep_pipeline import default_pipeline
+
+    started = time.monotonic()  # Flow samples are stamped on the monotonic clock
+    s_parameters = acquire_sample_sweep(endpoint, chemical, config=config)
+    flow_stats = flow.window_stats(started) if flow is not None else None
+    if raw_data_filename is None:
+        raw_data_filename = raw_datalog_path(chemical, concentration, experiment_number)
+    pipeline = pipeline or default_pipeline()
+    future = pipeline.submit(s_parameters, chemical, concentration, experiment_number, raw_data_filename, flow_stats)
+    return s_parameters, future
+
+
+def start_baseline_sweep(pipeline=None, endpoint=None, chemical=None):
+    """
+    Sweep the cell while it holds blank solvent and queue it for the rolling baseline.
+
+    With adaptive sweeps, ``chemical`` (the one about to be sampled) picks the cached
+    refinement windows, so the blank is dense where its sample sweeps are. The grids
+    still differ once the sample sweeps move the cached resonances, so sample sweeps
+    are corrected with the baseline interpolated onto their grid (see
+    RollingBaseline.lookup).
+    """
+    from sweep_pipeline import default_pipeline
+
+    s_parameters = acquire_sample_sweep(endpoint, chemical, learn=False)
+    pipeline = pipeline or default_pipeline()
+    return s_parameters, pipeline.submit_baseline(s_parameters)
+
+
+def run_vna_sweep(chemical, concentration, experiment_number, raw_data_filename=None, averages=None):
+    """
+    Acquire a sweep and wait until it has been saved and processed.
+
+    ``averages`` overrides VNA_CONFIG['averages']: K fast sweeps averaged in software
+    instead of one sweep at a lower IFBW. The returned dict then also holds the
+    per-point variance (``s11_var``, ...); the raw CSV keeps the averaged spectrum.
+    """
+    config = VNA_CONFIG if averages is None else {**VNA_CONFIG, 'averages': averages}
+    s_parameters, future = start_vna_sweep(chemical, concentration, experiment_number, raw_data_filename, config=config)
+    future.result()
+    return s_parameters
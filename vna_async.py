@@ -0,0 +1,133 @@
+import asyncio
+from config import VNA_CONFIG
+from vna import selected_traces, add_trace, sweep_setup_commands, sweep_segments, merge_segments, SweepAverager
+from logger import setup_logger
+import logging
+
+logger = setup_logger(__name__, level=logging.INFO)
+
+# Trace responses are single lines of ~30 bytes per point; allow very long sweeps
+STREAM_LIMIT = 2**26
+
+
+class AsyncLibreVNA:
+    """
+    asyncio counterpart of vna.libreVNA with the same SCPI surface.
+
+    Each instrument is one StreamReader/StreamWriter pair, so a single event loop can
+    drive several VNAs at once. Queries on one connection are serialised by a lock so
+    responses always pair with their query. Create with ``await AsyncLibreVNA.connect()``.
+    """
+
+    def __init__(self, reader, writer, fetch_timeout=20):
+        self.reader = reader
+        self.writer = writer
+        self.fetch_timeout = fetch_timeout
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    async def connect(cls, host='localhost', port=19542, fetch_timeout=20, connect_timeout=5):
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port, limit=STREAM_LIMIT), connect_timeout
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            raise Exception("Unable to connect to LibreVNA-GUI. Ensure it is running and the TCP server is enabled.") from e
+        return cls(reader, writer, fetch_timeout)
+
+    async def send_command(self, command):
+        logger.debug("Sending command: %s", command)
+        async with self._lock:
+            self.writer.write(command.encode() + b"\n")
+            await self.writer.drain()
+
+    async def send_query(self, query, timeout=None):
+        timeout = timeout or self.fetch_timeout
+        logger.debug("Sending query: %s", query)
+        async with self._lock:
+            self.writer.write(query.encode() + b"\n")
+            await self.writer.drain()
+            try:
+                line = await asyncio.wait_for(self.reader.readuntil(b"\n"), timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError("Socket read timed out while waiting for data.")
+            except asyncio.IncompleteReadError as e:
+                raise ConnectionError(f"VNA closed the connection during query: {query}") from e
+        response = line.decode().rstrip()
+        if not response:
+            raise ValueError(f"Received empty response for query: {query}")
+        logger.debug("Received response: %s", response)
+        return response
+
+    async def fetch_s_parameters(self, collect_s21=True, collect_s11=True, collect_s12=True, collect_s22=True):
+        logger.info("Fetching selected S-parameter data...")
+        try:
+            result = {}
+            for trace in selected_traces(collect_s21, collect_s11, collect_s12, collect_s22):
+                logger.debug("Collecting %s data...", trace)
+                add_trace(result, trace, await self.send_query(f"VNA:TRACe:DATA? {trace}"))
+            return result
+        except Exception as e:
+            logger.error("An error occurred while fetching S-parameters: %s", e)
+            raise
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+        logger.info("VNA connection closed.")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+async def wait_for_sweep_completion(vna, poll_interval=1):
+    logger.info("Waiting for sweep to complete...")
+    while True:
+        try:
+            if await vna.send_query("*OPC?", timeout=5) == "1":
+                logger.info("Sweep completed successfully.")
+                return
+        except TimeoutError as e:
+            logger.warning("Timeout while polling sweep completion: %s", e)
+        await asyncio.sleep(poll_interval)
+
+
+async def acquire_vna_sweep(host='localhost', port=19542, fetch_delay=0, config=VNA_CONFIG):
+    """Configure the VNA, run one sweep and return the S-parameters (see vna.acquire_vna_sweep)."""
+    logger.info("Connecting to LibreVNA at %s:%s...", host, port)
+    async with await AsyncLibreVNA.connect(host, port, fetch_timeout=30) as vna:
+        averages = max(1, int(config.get('averages', 1)))
+        parts = []
+        for segment in sweep_segments(config):
+            for command in sweep_setup_commands(segment):
+                await vna.send_command(command)
+            averager = SweepAverager()
+            for _ in range(averages):
+                await vna.send_command("VNA:ACQuisition:RUN")
+                await wait_for_sweep_completion(vna)
+                if fetch_delay:
+                    await asyncio.sleep(fetch_delay)
+                s_parameters = await vna.fetch_s_parameters()
+                if averages == 1:
+                    break
+                averager.add(s_parameters)
+            parts.append(averager.result() if averages > 1 else s_parameters)
+        return merge_segments(parts)
+
+
+async def acquire_many(endpoints, **kwargs):
+    """
+    Sweep several VNAs concurrently on one event loop.
+
+    ``endpoints`` is a list of (host, port); returns the S-parameter dicts in the same
+    order, with the exception in place of the result for any instrument that failed.
+    """
+    return await asyncio.gather(
+        *(acquire_vna_sweep(host, port, **kwargs) for host, port in endpoints), return_exceptions=True
+    )